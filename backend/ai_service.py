@@ -1,115 +1,182 @@
 import asyncio
 import json
+import re
+import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from sqlalchemy.orm import Session
+from typing import AsyncGenerator, Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .database import User, Conversation, Message, UserMemory, memory_store
+from .database import UserMemory, memory_store
+from .keyword_engine import load_keyword_engine
+from .llm_providers import get_llm_provider
+from .response_cache import response_cache
+from .summarizer import merge_context_items
+from .prompt_packer import PromptSection, PackedPrompt, MESSAGE_OVERHEAD, prompt_packer
+from .tokenizer import token_metadata
+from .semantic_memory import semantic_index
+from .knowledge_graph import knowledge_graph
+from .context_cache import context_cache, memory_entry
+from .persistence import persistence, WriteBatch
+from .metrics import observe_stage
+from .config import settings
 
 class AIService:
     """AI Service for generating responses with context retention"""
     
-    def __init__(self):
-        self.model_name = "gemini-pro"  # Would be configured for actual Gemini Pro
+    # Simulated model latency: time to first token, then per streamed token
+    FIRST_TOKEN_DELAY = 0.2
+    TOKEN_DELAY = 0.03
+    
+    def __init__(self, provider_name: Optional[str] = None):
+        self.model_name = settings.LLM_MODEL
+        self.provider = get_llm_provider(provider_name)  # None runs the built-in simulated model
+        self.keyword_engine = load_keyword_engine(settings.KEYWORD_TABLES_PATH)
+        self.response_cache = response_cache
         
     async def generate_response(
         self,
         user_message: str,
         conversation_id: str,
         user_id: str,
-        db: Session
+        db: AsyncSession
     ) -> Dict:
         """Generate AI response with context awareness"""
         
-        # Get user and conversation context
-        user = db.query(User).filter(User.id == user_id).first()
-        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        response = None
+        async for event in self.generate_response_stream(user_message, conversation_id, user_id, db):
+            if event["type"] == "complete":
+                response = event["response"]
         
-        # Build context
-        context = await self._build_context(user, conversation, db)
+        return response
+    
+    async def generate_response_stream(
+        self,
+        user_message: str,
+        conversation_id: str,
+        user_id: str,
+        db: AsyncSession,
+        batch: Optional[WriteBatch] = None
+    ) -> AsyncGenerator[Dict, None]:
+        """Stream AI response as "chunk" events followed by a single "complete" event
         
-        # Get recent messages for conversation context
-        recent_messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.timestamp.desc()).limit(10).all()
+        Memory rows are added to `batch` when given so the caller can commit
+        them together with the turn; otherwise they are written on their own.
+        """
         
-        # Prepare conversation history
-        conversation_history = []
-        for msg in reversed(recent_messages):
-            conversation_history.append({
-                "role": msg.role,
-                "content": msg.content,
-                "timestamp": msg.timestamp.isoformat()
-            })
+        # Get user and conversation context from the snapshot cache
+        with observe_stage("history_fetch"):
+            snapshot = await context_cache.get_snapshot(db, conversation_id, user_id)
+        if snapshot is None:
+            raise ValueError("Conversation not found")
         
-        # Generate response (simulated - would integrate with actual Gemini Pro)
-        response = await self._generate_ai_response(
-            user_message=user_message,
-            context=context,
-            conversation_history=conversation_history,
-            user_preferences=user.preferences or {}
-        )
+        # Analyze the message once for graph lookups, context and memory updates
+        analysis = self.analyze_message(user_message)
+        
+        # Build context
+        with observe_stage("build_context"):
+            context = await self._build_context(snapshot, db, user_message, analysis)
+        
+        # Prepare conversation history
+        conversation_history = [
+            {
+                "id": msg["id"],
+                "role": msg["role"],
+                "content": msg["content"],
+                "timestamp": msg["timestamp"],
+                "tokens": msg.get("tokens")
+            }
+            for msg in snapshot["conversation"]["recent_messages"]
+        ]
+        
+        # Pack the prompt into the token budget
+        with observe_stage("prompt_packing"):
+            prompt = self._build_prompt(user_message, context, conversation_history)
+        
+        # Stream response from the configured provider (the stage includes emitting the chunks)
+        chunks = []
+        with observe_stage("generation"):
+            async for chunk in self._stream_ai_response(
+                user_message=user_message,
+                context=context,
+                conversation_history=conversation_history,
+                user_preferences=snapshot["user"]["preferences"],
+                prompt=prompt,
+                analysis=analysis
+            ):
+                chunks.append(chunk)
+                yield {"type": "chunk", "content": chunk}
+        
+        response = self._build_response("".join(chunks), user_message, snapshot["conversation"], analysis)
+        response["prompt_tokens"] = prompt.report()
         
         # Update memory stores
-        await self._update_memory(user_id, conversation_id, user_message, response, db)
+        with observe_stage("update_memory"):
+            await self._update_memory(user_id, conversation_id, user_message, response, batch)
         
-        return response
+        yield {"type": "complete", "response": response}
     
-    async def _build_context(self, user: User, conversation: Conversation, db: Session) -> Dict:
+    async def _build_context(self, snapshot: Dict, db: AsyncSession, user_message: str = "", analysis: Optional[Dict] = None) -> Dict:
         """Build comprehensive context for AI response"""
         
+        analysis = analysis or self.analyze_message(user_message)
+        user = snapshot["user"]
+        conversation = snapshot["conversation"]
+        preferences = user["preferences"] or {}
+        
         context = {
             "user_profile": {
-                "name": user.name,
-                "preferences": user.preferences or {},
-                "communication_style": user.preferences.get("communication_style", "casual") if user.preferences else "casual"
+                "id": user["id"],
+                "name": user["name"],
+                "preferences": preferences,
+                "communication_style": preferences.get("communication_style", "casual")
             },
             "conversation_context": {
-                "title": conversation.title,
-                "message_count": conversation.message_count,
-                "summary": conversation.context_summary,
-                "entities": conversation.context_entities or [],
-                "topics": conversation.context_topics or []
+                "title": conversation["title"],
+                "message_count": conversation["message_count"],
+                "summary": conversation["summary"],
+                "entities": conversation["entities"],
+                "topics": conversation["topics"]
             },
             "memory": {
                 "short_term": {},
                 "long_term": [],
-                "semantic": []
+                "semantic": [],
+                "related": []
             }
         }
         
         # Get short-term memory from Redis
         short_term_keys = ["current_topic", "user_intent", "session_context"]
-        for key in short_term_keys:
-            value = memory_store.get_short_term(str(user.id), key)
-            if value:
-                context["memory"]["short_term"][key] = value
-        
-        # Get long-term memory from database
-        long_term_memories = db.query(UserMemory).filter(
-            UserMemory.user_id == user.id,
-            UserMemory.memory_type == "long_term"
-        ).order_by(UserMemory.importance_score.desc()).limit(5).all()
-        
-        for memory in long_term_memories:
+        context["memory"]["short_term"] = await memory_store.get_short_term_many(user["id"], short_term_keys)
+        
+        # Get long-term memory from the snapshot
+        for memory in user["long_term"]:
             context["memory"]["long_term"].append({
-                "content": memory.content,
-                "importance": memory.importance_score,
-                "created_at": memory.created_at.isoformat()
+                "content": memory["content"],
+                "importance": memory["importance"],
+                "created_at": memory["created_at"],
+                "tokens": memory.get("tokens")
             })
         
-        # Get semantic memory
-        semantic_memories = db.query(UserMemory).filter(
-            UserMemory.user_id == user.id,
-            UserMemory.memory_type == "semantic"
-        ).order_by(UserMemory.importance_score.desc()).limit(3).all()
+        # Get semantic memory nearest to the current message
+        semantic_memories = await semantic_index.search(db, user["id"], user_message, k=settings.PROMPT_SEMANTIC_CANDIDATES)
         
         for memory in semantic_memories:
             context["memory"]["semantic"].append({
-                "content": memory.content,
-                "importance": memory.importance_score
+                "content": memory["content"],
+                "importance": memory["importance"],
+                "similarity": round(memory["score"], 4),
+                "tokens": memory.get("tokens")
             })
         
+        # Concepts the user has talked about alongside this message's (or, failing those, the conversation's)
+        context["memory"]["related"] = await knowledge_graph.related(
+            user["id"],
+            analysis["entities"] or conversation["entities"][-3:],
+            analysis["topics"] or conversation["topics"][-2:],
+            limit=settings.KNOWLEDGE_GRAPH_RELATED_LIMIT
+        )
+        
         return context
     
     async def _generate_ai_response(
@@ -119,26 +186,163 @@ class AIService:
         conversation_history: List[Dict],
         user_preferences: Dict
     ) -> Dict:
-        """Generate AI response (simulated - would integrate with Gemini Pro)"""
+        """Generate a complete (non-streamed) AI response"""
         
-        # Simulate processing delay
-        await asyncio.sleep(1.5)
+        chunks = []
+        async for chunk in self._stream_ai_response(user_message, context, conversation_history, user_preferences):
+            chunks.append(chunk)
+        
+        return self._build_response("".join(chunks), user_message, context["conversation_context"])
+    
+    async def _stream_ai_response(
+        self,
+        user_message: str,
+        context: Dict,
+        conversation_history: List[Dict],
+        user_preferences: Dict,
+        prompt: Optional[PackedPrompt] = None,
+        analysis: Optional[Dict] = None
+    ) -> AsyncGenerator[str, None]:
+        """Stream AI response token by token, serving repeated prompts from the response cache"""
+        
+        analysis = analysis or self.analyze_message(user_message)
+        # The history the reply builds on; this turn's own message (see _build_prompt) is the key's message
+        history = conversation_history
+        if history and history[-1]["role"] == "user" and history[-1]["content"] == user_message:
+            history = history[:-1]
+        cache_key = self.response_cache.key_for(
+            context["user_profile"]["id"],
+            user_message,
+            context,
+            user_preferences,
+            self.model_name if self.provider is not None else "simulated",
+            analysis["intent"],
+            [msg.get("id") for msg in history]
+        )
+        if cache_key is not None:
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        chunks = []
+        async for chunk in self._generate_stream(
+            user_message, context, conversation_history, user_preferences, analysis, prompt
+        ):
+            chunks.append(chunk)
+            yield chunk
+        
+        if cache_key is not None:
+            await self.response_cache.put(cache_key, "".join(chunks))
+    
+    async def _generate_stream(
+        self,
+        user_message: str,
+        context: Dict,
+        conversation_history: List[Dict],
+        user_preferences: Dict,
+        analysis: Dict,
+        prompt: Optional[PackedPrompt] = None
+    ) -> AsyncGenerator[str, None]:
+        """Stream a fresh response from the provider (or the simulated model)"""
+        
+        if self.provider is not None:
+            prompt = prompt or self._build_prompt(user_message, context, conversation_history)
+            async for chunk in self.provider.stream(prompt.messages):
+                yield chunk
+            return
+        
+        response_content = self._compose_response_content(user_message, analysis, context, user_preferences)
+        
+        # Simulate model latency
+        await asyncio.sleep(self.FIRST_TOKEN_DELAY)
+        for index, token in enumerate(re.findall(r"\S+\s*", response_content)):
+            if index:
+                await asyncio.sleep(self.TOKEN_DELAY)
+            yield token
+    
+    def _build_prompt(self, user_message: str, context: Dict, conversation_history: List[Dict]) -> PackedPrompt:
+        """Pack the assembled context into chat messages within the prompt token budget"""
+        
+        profile = context["user_profile"]
+        conversation = context["conversation_context"]
+        memory = context["memory"]
+        
+        instructions = [
+            "You are a personal AI assistant that remembers context across conversations.",
+            f"The user's name is {profile['name']}. Preferred communication style: {profile['communication_style']}.",
+            f"Preferred response length: {profile['preferences'].get('response_length', 'medium')}."
+        ]
+        if conversation["topics"]:
+            instructions.append(f"Topics so far: {', '.join(conversation['topics'])}")
+        
+        # The snapshot usually already ends with this turn's user message
+        history = list(conversation_history)
+        current = {"content": user_message}
+        if history and history[-1]["role"] == "user" and history[-1]["content"] == user_message:
+            current = history.pop()
+        
+        long_term = sorted(memory["long_term"], key=lambda item: item["importance"], reverse=True)
+        known = {item["content"] for item in long_term}
+        semantic = [item for item in memory["semantic"] if item["content"] not in known]
+        
+        sections = [
+            PromptSection(
+                "summary",
+                [{"content": line} for line in reversed((conversation["summary"] or "").splitlines()) if line],
+                header="Conversation summary:",
+                contiguous=True
+            ),
+            PromptSection(
+                "long_term",
+                [{"content": f"- {item['content']}", "tokens": item.get("tokens")} for item in long_term],
+                header="Things to remember about the user:"
+            ),
+            PromptSection(
+                "semantic",
+                [{"content": f"- {item['content']}", "tokens": item.get("tokens")} for item in semantic],
+                header="Related things the user said before:"
+            ),
+            PromptSection(
+                "related",
+                [{"content": f"- {item['name']} ({item['kind']})"} for item in memory["related"]],
+                header="Other things the user often mentions alongside these:"
+            ),
+            PromptSection(
+                "session",
+                [{"content": f"{key}: {value}"} for key, value in memory["short_term"].items()],
+                header="Current session:"
+            ),
+            PromptSection(
+                "history",
+                [
+                    {"role": msg["role"], "content": msg["content"], "tokens": msg.get("tokens")}
+                    for msg in reversed(history)
+                ],
+                contiguous=True,
+                item_overhead=MESSAGE_OVERHEAD
+            )
+        ]
+        return prompt_packer.pack(instructions, current, sections)
+    
+    def _compose_response_content(self, user_message: str, analysis: Dict, context: Dict, user_preferences: Dict) -> str:
+        """Compose response text from the message analysis, context and preferences"""
         
         # Extract user preferences
         communication_style = user_preferences.get("communication_style", "casual")
         response_length = user_preferences.get("response_length", "medium")
         
-        # Build response based on context and preferences
-        if "hello" in user_message.lower() or "hi" in user_message.lower():
+        # Build response based on the analyzed message (whole-word matches, so "this" is no greeting)
+        if analysis["intent"] == "greeting":
             if communication_style == "formal":
                 base_response = f"Good day! How may I assist you today?"
             else:
                 base_response = f"Hello there! How can I help you today?"
-        elif "weather" in user_message.lower():
+        elif "weather" in analysis["topics"]:
             base_response = "I'd be happy to help with weather information, but I don't have access to real-time weather data at the moment. You might want to check your local weather app or website for accurate conditions."
-        elif "remember" in user_message.lower():
+        elif analysis["intent"] == "memory_retrieval":
             base_response = "I have access to our conversation history and can remember context from our previous interactions. What would you like me to remember or recall?"
-        elif any(topic in user_message.lower() for topic in ["ai", "artificial intelligence", "machine learning"]):
+        elif "ai" in analysis["entities"]:
             if communication_style == "technical":
                 base_response = "Artificial Intelligence encompasses machine learning algorithms, neural networks, and computational models designed to simulate human cognitive functions. What specific aspect would you like to explore?"
             else:
@@ -160,16 +364,32 @@ class AIService:
         else:
             response_content = base_response
         
-        # Extract entities and topics for context updating
-        entities = self._extract_entities(user_message)
-        topics = self._extract_topics(user_message)
+        return response_content
+    
+    def _build_response(
+        self,
+        response_content: str,
+        user_message: str,
+        conversation: Optional[Dict] = None,
+        analysis: Optional[Dict] = None
+    ) -> Dict:
+        """Wrap generated content with confidence and context updates
+        
+        Entities and topics accumulate across the conversation; the summary
+        is maintained separately by the background summarizer.
+        """
+        
+        analysis = analysis or self.analyze_message(user_message)
+        conversation = conversation or {}
+        entities = merge_context_items(conversation.get("entities") or [], analysis["entities"], settings.MAX_CONTEXT_ENTITIES)
+        topics = merge_context_items(conversation.get("topics") or [], analysis["topics"], settings.MAX_CONTEXT_TOPICS)
         
         return {
             "content": response_content,
+            "analysis": analysis,
             "confidence": 0.92,
             "context_used": True,
             "context": {
-                "summary": f"User asked about: {user_message[:50]}...",
                 "entities": entities,
                 "topics": topics
             }
@@ -181,18 +401,22 @@ class AIService:
         conversation_id: str,
         user_message: str,
         ai_response: Dict,
-        db: Session
+        batch: Optional[WriteBatch] = None
     ):
         """Update various memory stores"""
         
         # Update short-term memory in Redis
+        short_term = {}
         current_topics = ai_response.get("context", {}).get("topics", [])
         if current_topics:
-            memory_store.store_short_term(user_id, "current_topic", current_topics[0])
+            short_term["current_topic"] = current_topics[0]
         
         # Determine user intent and store
-        intent = self._analyze_intent(user_message)
-        memory_store.store_short_term(user_id, "user_intent", intent)
+        analysis = ai_response.get("analysis") or self.analyze_message(user_message)
+        short_term["user_intent"] = analysis["intent"]
+        
+        # Co-occurrence edges are written to the graph in the background
+        knowledge_graph.record_turn(user_id, analysis["entities"], analysis["topics"])
         
         # Store conversation context
         context_data = {
@@ -200,84 +424,67 @@ class AIService:
             "ai_response_summary": ai_response["content"][:100] + "...",
             "timestamp": datetime.utcnow().isoformat()
         }
-        memory_store.store_conversation_context(conversation_id, context_data)
+        
+        # One pipelined round-trip for every Redis write of this turn
+        await memory_store.store_memory_updates(
+            user_id,
+            short_term,
+            conversation_id=conversation_id,
+            context=context_data
+        )
         
         # Update long-term memory if message is important
-        importance = self._calculate_importance(user_message)
+        importance = analysis["importance"]
         if importance >= 7:  # High importance threshold
+            memory_content = f"User expressed: {user_message}"
             long_term_memory = UserMemory(
-                user_id=user_id,
+                id=uuid.uuid4(),
+                user_id=uuid.UUID(str(user_id)),
                 memory_type="long_term",
-                content=f"User expressed: {user_message}",
+                content=memory_content,
                 importance_score=importance,
-                metadata={
+                created_at=datetime.utcnow(),
+                expires_at=(
+                    datetime.utcnow() + timedelta(days=settings.MEMORY_TTL_DAYS)
+                    if settings.MEMORY_TTL_DAYS else None
+                ),
+                memory_metadata={
                     "conversation_id": conversation_id,
-                    "context": ai_response.get("context", {})
+                    "context": ai_response.get("context", {}),
+                    **token_metadata(memory_content)
                 }
             )
-            db.add(long_term_memory)
-            db.commit()
+            memory_batch = batch if batch is not None else WriteBatch()
+            memory_batch.add(long_term_memory)
+            semantic_index.add_memory(memory_batch, long_term_memory)
+            if batch is None:
+                memory_ack = persistence.submit(memory_batch)
+                await persistence.wait(memory_ack)
+            await context_cache.add_long_term_memory(user_id, memory_entry(long_term_memory))
+            if batch is None and not memory_ack.done():
+                # Enqueue durability applied it ahead of the commit (a caller's batch is the caller's to revalidate)
+                context_cache.revalidate_after(memory_ack, user_id=user_id)
+    
+    def analyze_message(self, text: str) -> Dict:
+        """Extract entities, topics, intent and importance in a single pass"""
+        return self.keyword_engine.analyze(text)
+    
+    def analyze_messages(self, texts: List[str]) -> List[Dict]:
+        """Analyze many messages at once (e.g. backfilling historical messages)"""
+        return self.keyword_engine.analyze_many(texts)
     
     def _extract_entities(self, text: str) -> List[str]:
-        """Extract entities from text (simplified)"""
-        entities = []
-        
-        # Simple entity extraction (would use NLP models in production)
-        common_entities = ["weather", "time", "date", "location", "person", "ai", "technology"]
-        for entity in common_entities:
-            if entity in text.lower():
-                entities.append(entity)
-        
-        return entities[:5]  # Limit to top 5
+        """Extract entities from text"""
+        return self.analyze_message(text)["entities"]
     
     def _extract_topics(self, text: str) -> List[str]:
-        """Extract topics from text (simplified)"""
-        topics = []
-        
-        # Simple topic extraction
-        topic_keywords = {
-            "technology": ["ai", "computer", "software", "tech", "digital"],
-            "weather": ["weather", "temperature", "rain", "sunny", "cloudy"],
-            "general": ["help", "question", "information", "explain"],
-            "personal": ["remember", "preference", "like", "dislike", "favorite"]
-        }
-        
-        text_lower = text.lower()
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in text_lower for keyword in keywords):
-                topics.append(topic)
-        
-        return topics[:3]  # Limit to top 3
+        """Extract topics from text"""
+        return self.analyze_message(text)["topics"]
     
     def _analyze_intent(self, text: str) -> str:
-        """Analyze user intent (simplified)"""
-        text_lower = text.lower()
-        
-        if any(word in text_lower for word in ["hello", "hi", "hey"]):
-            return "greeting"
-        elif any(word in text_lower for word in ["help", "how", "what", "explain"]):
-            return "information_seeking"
-        elif any(word in text_lower for word in ["remember", "recall", "previous"]):
-            return "memory_retrieval"
-        elif any(word in text_lower for word in ["thank", "thanks", "bye", "goodbye"]):
-            return "closing"
-        else:
-            return "general_query"
+        """Analyze user intent"""
+        return self.analyze_message(text)["intent"]
     
     def _calculate_importance(self, text: str) -> int:
         """Calculate importance score for memory storage"""
-        score = 1
-        
-        # Increase score for certain indicators
-        text_lower = text.lower()
-        
-        if any(word in text_lower for word in ["important", "remember", "crucial", "critical"]):
-            score += 5
-        elif any(word in text_lower for word in ["prefer", "like", "dislike", "favorite"]):
-            score += 4
-        elif any(word in text_lower for word in ["always", "never", "usually"]):
-            score += 3
-        elif len(text) > 100:  # Longer messages might be more important
-            score += 2
-        
-        return min(score, 10)  # Cap at 10
\ No newline at end of file
+        return self.analyze_message(text)["importance"]
@@ -1,19 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import AsyncGenerator, Optional
 from pydantic import BaseModel, EmailStr
 
-from .database import get_db, User
+from .database import get_db, AsyncSessionLocal, User, replica_router
+from .principal_cache import principal_cache
+from .password_hashing import password_hasher, pwd_context, verify_password, get_password_hash
 from .config import settings
 
 router = APIRouter()
 
 # Security setup
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 # Pydantic models
@@ -35,12 +36,6 @@ class Token(BaseModel):
     user: UserResponse
 
 # Utility functions
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -52,38 +47,71 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
+    user = await get_user_by_email(db, email)
+    if not user or not await password_hasher.verify(password, user.hashed_password):
         return None
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def get_user_for_token(token: str, db: Optional[AsyncSession] = None) -> Optional[User]:
+    """Resolve a JWT to its active user, serving warm tokens from the principal cache"""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    email: str = payload.get("sub")
+    if email is None:
+        return None
+    
+    user = principal_cache.get(token)
+    if user is not None:
+        return user
+    
+    if db is None:
+        async with (await replica_router.session_factory(email))() as session:
+            user = await get_user_by_email(session, email)
+        if user is None and replica_router.enabled:
+            # A replica may not have a just-registered user yet
+            async with AsyncSessionLocal() as session:
+                user = await get_user_by_email(session, email)
+    else:
+        user = await get_user_by_email(db, email)
+    if user is None or user.is_active is False:
+        return None
+    
+    # Cache a detached copy so it never touches a closed session
+    if db is not None:
+        db.expunge(user)
+    principal_cache.put(token, user, token_expires_at=payload.get("exp"))
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
+    user = await get_user_for_token(token)
     if user is None:
         raise credentials_exception
     
     return user
 
+async def get_read_db(current_user: User = Depends(get_current_user)) -> AsyncGenerator[AsyncSession, None]:
+    """Session for read-only routes: a replica unless the user has just written"""
+    async with (await replica_router.session_factory(current_user.id))() as db:
+        yield db
+
 # Routes
 @router.post("/register", response_model=Token)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await get_user_by_email(db, user_data.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -91,7 +119,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     user = User(
         email=user_data.email,
         name=user_data.name,
@@ -101,13 +129,15 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
             "communication_style": "casual",
             "response_length": "medium",
             "interests": [],
-            "timezone": "UTC"
+            "timezone": "UTC",
+            "response_cache": True
         }
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    await replica_router.mark_write(user.id, user.email)
     
     # Create access token
     access_token = create_access_token(data={"sub": user.email})
@@ -125,8 +155,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     }
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import User, Conversation, Message, UserMemory, redis_client
+from .tokenizer import cached_token_count
+from .config import settings
+
+RECENT_MESSAGES = 10
+LONG_TERM_MEMORIES = 5
+
+def message_entry(message: Message) -> Dict:
+    """Serialize a Message for a conversation snapshot"""
+    return {
+        "id": str(message.id),
+        "role": message.role,
+        "content": message.content,
+        "timestamp": message.timestamp.isoformat(),
+        "tokens": cached_token_count(message.message_metadata, message.content)
+    }
+
+def memory_entry(memory: UserMemory) -> Dict:
+    """Serialize a UserMemory for a user snapshot"""
+    return {
+        "id": str(memory.id),
+        "content": memory.content,
+        "importance": memory.importance_score,
+        "created_at": memory.created_at.isoformat(),
+        "tokens": cached_token_count(memory.memory_metadata, memory.content)
+    }
+
+class ContextCache:
+    """Versioned context snapshots: in-process LRU in front of Redis in front of Postgres
+
+    A snapshot has two parts with independent version counters in Redis:
+    the conversation part (title, counters, summary, last messages) and the
+    user part (profile, preferences, top long-term memories). A cached part
+    is only used when its version matches the counter, so any write that
+    bumps a counter invalidates every worker's copy at once. Counters
+    expire after `version_ttl` seconds without a bump and are seeded from
+    the clock, so a recreated counter never repeats an old version.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: int = 3600, version_ttl: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_ttl = version_ttl or 2 * ttl  # outlives the Redis snapshots stamped with it
+        self._local: "OrderedDict[str, Dict]" = OrderedDict()
+        self._revalidations: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _key(kind: str, ident: str) -> str:
+        return f"ctx:{kind}:{ident}"
+
+    @staticmethod
+    def _version_key(kind: str, ident: str) -> str:
+        return f"ctx:v:{kind}:{ident}"
+
+    def _remember(self, key: str, entry: Dict):
+        self._local[key] = entry
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def _publish(self, kind: str, ident: str, data: Dict, version: int):
+        """Store a part locally and in Redis stamped with its version"""
+        entry = {"version": version, "data": data}
+        self._remember(self._key(kind, ident), entry)
+        await redis_client.setex(self._key(kind, ident), self.ttl, json.dumps(entry))
+
+    @staticmethod
+    def _clock_version() -> int:
+        return int(time.time() * 1000)
+
+    async def _initial_version(self, key: str) -> Tuple[int, bool]:
+        """Return the current version and whether this call created the counter"""
+        created = await redis_client.set(key, self._clock_version(), nx=True, ex=self.version_ttl)
+        return int(await redis_client.get(key)), bool(created)
+
+    async def _bump(self, key: str) -> int:
+        """Increment a version counter (creating it if it expired) and extend its TTL"""
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(key, self._clock_version(), nx=True, ex=self.version_ttl)
+            pipe.incr(key)
+            pipe.expire(key, self.version_ttl)
+            _, version, _ = await pipe.execute()
+        return version
+
+    async def _load_conversation(self, db: AsyncSession, conversation_id: uuid.UUID) -> Optional[Dict]:
+        conversation = await db.get(Conversation, conversation_id)
+        if conversation is None or conversation.deleted_at is not None:
+            return None
+        result = await db.execute(
+            select(Message).where(
+                Message.conversation_id == conversation_id
+            ).order_by(Message.timestamp.desc(), Message.id.desc()).limit(RECENT_MESSAGES)
+        )
+        return {
+            "id": str(conversation.id),
+            "user_id": str(conversation.user_id),
+            "title": conversation.title,
+            "message_count": conversation.message_count or 0,
+            "summary": conversation.context_summary,
+            "entities": conversation.context_entities or [],
+            "topics": conversation.context_topics or [],
+            "recent_messages": [message_entry(msg) for msg in reversed(result.scalars().all())]
+        }
+
+    async def _load_user(self, db: AsyncSession, user_id: uuid.UUID) -> Optional[Dict]:
+        user = await db.get(User, user_id)
+        if user is None:
+            return None
+        result = await db.execute(
+            select(UserMemory).where(
+                UserMemory.user_id == user_id,
+                UserMemory.memory_type == "long_term",
+                # Expired rows may linger until the next lifecycle sweep
+                or_(UserMemory.expires_at.is_(None), UserMemory.expires_at > datetime.utcnow())
+            ).order_by(UserMemory.importance_score.desc()).limit(LONG_TERM_MEMORIES)
+        )
+        return {
+            "id": str(user.id),
+            "name": user.name,
+            "preferences": user.preferences or {},
+            "long_term": [memory_entry(memory) for memory in result.scalars().all()]
+        }
+
+    async def get_snapshot(self, db: AsyncSession, conversation_id: str, user_id: str) -> Optional[Dict]:
+        """Return {"conversation": ..., "user": ...} if the user owns the conversation"""
+        try:
+            conversation_uuid = uuid.UUID(str(conversation_id))
+            user_uuid = uuid.UUID(str(user_id))
+        except ValueError:
+            return None
+
+        parts = [("conv", str(conversation_uuid)), ("user", str(user_uuid))]
+        versions = await redis_client.mget([self._version_key(kind, ident) for kind, ident in parts])
+
+        resolved: Dict[str, Dict] = {}
+        missing: List[Tuple[str, str, Optional[int]]] = []
+        for (kind, ident), version in zip(parts, versions):
+            version = int(version) if version is not None else None
+            local = self._local.get(self._key(kind, ident))
+            if version is not None and local is not None and local["version"] == version:
+                self._local.move_to_end(self._key(kind, ident))
+                resolved[kind] = local["data"]
+            else:
+                missing.append((kind, ident, version))
+
+        if missing:
+            # One round-trip for every part this worker doesn't hold
+            blobs = await redis_client.mget([self._key(kind, ident) for kind, ident, _ in missing])
+            for (kind, ident, version), blob in zip(missing, blobs):
+                entry = json.loads(blob) if blob else None
+                if version is not None and entry is not None and entry["version"] == version:
+                    self._remember(self._key(kind, ident), entry)
+                    resolved[kind] = entry["data"]
+                    continue
+
+                # Rebuild from Postgres (the version is read first, so the data is at least that fresh)
+                created = False
+                if version is None:
+                    version, created = await self._initial_version(self._version_key(kind, ident))
+                if kind == "conv":
+                    data = await self._load_conversation(db, conversation_uuid)
+                else:
+                    data = await self._load_user(db, user_uuid)
+                if data is None or (kind == "conv" and data["user_id"] != str(user_uuid)):
+                    # Don't leave counters behind for ids a client made up or doesn't own
+                    if created:
+                        await redis_client.delete(self._version_key(kind, ident))
+                    return None
+                await self._publish(kind, ident, data, version)
+                resolved[kind] = data
+
+        if resolved["conv"]["user_id"] != str(user_uuid):
+            return None
+        return {"conversation": resolved["conv"], "user": resolved["user"]}
+
+    async def _update(self, kind: str, ident: str, apply: Callable[[Dict], None]):
+        """Bump a part's version and apply the change if we hold its predecessor"""
+        version = await self._bump(self._version_key(kind, ident))
+        key = self._key(kind, ident)
+        local = self._local.get(key)
+        if local is None or local["version"] != version - 1:
+            # Our copy is missing or stale; the next read rebuilds it
+            self._local.pop(key, None)
+            return
+        data = json.loads(json.dumps(local["data"]))
+        apply(data)
+        await self._publish(kind, ident, data, version)
+
+    async def append_messages(self, conversation_id: str, messages: List[Dict], **fields):
+        """Record new messages (and updated conversation fields) in the snapshot"""
+        def apply(data: Dict):
+            # A concurrent rebuild may already contain these messages
+            known = {message["id"] for message in data["recent_messages"]}
+            new_messages = [message for message in messages if message["id"] not in known]
+            data["recent_messages"] = (data["recent_messages"] + new_messages)[-RECENT_MESSAGES:]
+            data["message_count"] += len(new_messages)
+            data.update(fields)
+        await self._update("conv", str(conversation_id), apply)
+
+    async def update_conversation_fields(self, conversation_id: str, **fields):
+        """Set conversation fields (e.g. the rolling summary) in the snapshot"""
+        await self._update("conv", str(conversation_id), lambda data: data.update(fields))
+    
+    async def add_long_term_memory(self, user_id: str, memory: Dict):
+        """Record a new long-term memory in the user snapshot"""
+        def apply(data: Dict):
+            memories = [item for item in data["long_term"] if item["id"] != memory["id"]] + [memory]
+            memories.sort(key=lambda item: item["importance"], reverse=True)
+            data["long_term"] = memories[:LONG_TERM_MEMORIES]
+        await self._update("user", str(user_id), apply)
+
+    def revalidate_after(
+        self,
+        ack: asyncio.Future,
+        conversation_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ):
+        """Re-stamp parts that were updated before the write behind them committed
+
+        An update bumps the version at once, so a worker rebuilding from the
+        database before the commit lands publishes rows without the change
+        under the new version. Bumping again once `ack` resolves supersedes
+        such a rebuild (a worker holding the applied copy republishes it
+        without a database read); if the write failed the parts are dropped.
+        """
+        parts = [("conv", str(conversation_id))] if conversation_id is not None else []
+        if user_id is not None:
+            parts.append(("user", str(user_id)))
+        if parts:
+            task = asyncio.create_task(self._revalidate(ack, parts))
+            self._revalidations.add(task)
+            task.add_done_callback(self._revalidations.discard)
+
+    async def _revalidate(self, ack: asyncio.Future, parts: List[Tuple[str, str]]):
+        await asyncio.wait([ack])
+        committed = not ack.cancelled() and ack.exception() is None
+        try:
+            for kind, ident in parts:
+                if committed:
+                    await self._update(kind, ident, lambda data: None)
+                else:
+                    await self._bump(self._version_key(kind, ident))
+                    self._local.pop(self._key(kind, ident), None)
+        except Exception as e:
+            print(f"Context cache revalidation failed: {e}")
+
+    @staticmethod
+    def _list_version_key(user_id: str) -> str:
+        return f"ctx:v:convlist:{user_id}"
+
+    async def conversation_list_version(self, user_id: str) -> int:
+        """Per-user counter that changes whenever one of the user's conversations is added, removed or updated"""
+        key = self._list_version_key(str(user_id))
+        version = await redis_client.get(key)
+        if version is None:
+            # Seeded from the clock so a lost counter never repeats a version clients already hold
+            version, _ = await self._initial_version(key)
+        return int(version)
+
+    async def bump_conversation_list(self, user_id: str):
+        await self._bump(self._list_version_key(str(user_id)))
+
+    async def invalidate_conversation(self, conversation_id: str):
+        """Drop the conversation part everywhere (e.g. after deletion)"""
+        await self._bump(self._version_key("conv", str(conversation_id)))
+        self._local.pop(self._key("conv", str(conversation_id)), None)
+
+    async def invalidate_user(self, user_id: str):
+        """Drop the user part everywhere (e.g. after a profile or preference change)"""
+        await self._bump(self._version_key("user", str(user_id)))
+        self._local.pop(self._key("user", str(user_id)), None)
+
+context_cache = ContextCache(
+    max_entries=settings.CONTEXT_CACHE_SIZE,
+    ttl=settings.CONTEXT_CACHE_TTL
+)
@@ -1,11 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
+import base64
+import hashlib
+import uuid
 
-from .database import get_db, User, Conversation, Message
-from .auth import get_current_user
+from .database import get_db, replica_router, User, Conversation, Message, UserMemory
+from .auth import get_current_user, get_read_db
+from .context_cache import context_cache
+from .search import message_search
+from .semantic_memory import semantic_index
+from .reaper import conversation_reaper
+from .transfer import export_ndjson, gzip_stream, ndjson_lines, ConversationImporter, ImportFormatError, ImportTooLargeError
+from .config import settings
 
 router = APIRouter()
 
@@ -22,6 +33,20 @@ class ConversationResponse(BaseModel):
     message_count: int
     context: Optional[dict] = None
 
+class ConversationListItem(BaseModel):
+    id: str
+    title: str
+    user_id: str
+    created_at: datetime
+    updated_at: datetime
+    message_count: int
+    last_message_preview: Optional[str] = None
+
+class ConversationPage(BaseModel):
+    conversations: List[ConversationListItem]
+    has_more: bool
+    next_cursor: Optional[str] = None  # pass as ?before= to load older conversations
+
 class MessageResponse(BaseModel):
     id: str
     content: str
@@ -30,42 +55,161 @@ class MessageResponse(BaseModel):
     conversation_id: str
     metadata: Optional[dict] = None
 
+class MessagePage(BaseModel):
+    messages: List[MessageResponse]
+    has_more: bool
+    before_cursor: Optional[str] = None  # pass as ?before= to load older messages
+    after_cursor: Optional[str] = None  # pass as ?after= to load newer messages
+
+class SearchHit(BaseModel):
+    id: str
+    conversation_id: str
+    conversation_title: Optional[str] = None
+    role: str
+    timestamp: datetime
+    highlight: str  # HTML-escaped excerpt with matches wrapped in <mark>
+    rank: Optional[float] = None
+
+class SearchPage(BaseModel):
+    results: List[SearchHit]
+    next_offset: Optional[int] = None
+
 class MessageCreate(BaseModel):
     content: str
     role: str = "user"
 
+async def get_owned_conversation(db: AsyncSession, conversation_id, user_id) -> Optional[Conversation]:
+    """Fetch a conversation only if it belongs to the given user and isn't deleted"""
+    result = await db.execute(
+        select(Conversation).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == user_id,
+            Conversation.deleted_at.is_(None)
+        )
+    )
+    return result.scalars().first()
+
+def encode_position(timestamp: datetime, ident) -> str:
+    """Encode a (timestamp, id) keyset position as an opaque cursor"""
+    raw = f"{timestamp.isoformat()}|{ident}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def encode_cursor(message: Message) -> str:
+    """Encode a message's (timestamp, id) position as an opaque cursor"""
+    return encode_position(message.timestamp, message.id)
+
+def decode_cursor(cursor: str):
+    """Decode a cursor back into its (timestamp, id) position"""
+    try:
+        timestamp, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(timestamp), uuid.UUID(message_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def export_response(user_id, conversation_id: Optional[uuid.UUID], compress: Optional[str], filename: str) -> StreamingResponse:
+    """Stream an NDJSON export, gzipped on request, as a download"""
+    session_factory = await replica_router.session_factory(user_id)
+    body = export_ndjson(user_id, conversation_id, session_factory, settings.EXPORT_BATCH_SIZE)
+    media_type = "application/x-ndjson"
+    filename += ".ndjson"
+    if compress == "gzip":
+        body = gzip_stream(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
 # Routes
-@router.get("/", response_model=List[ConversationResponse])
+@router.get("/", response_model=ConversationPage)
 async def get_conversations(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    preview: bool = False,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    conversations = db.query(Conversation).filter(
-        Conversation.user_id == current_user.id
-    ).order_by(Conversation.updated_at.desc()).all()
-    
-    return [
-        ConversationResponse(
-            id=str(conv.id),
-            title=conv.title,
-            user_id=str(conv.user_id),
-            created_at=conv.created_at,
-            updated_at=conv.updated_at,
-            message_count=conv.message_count,
-            context={
-                "summary": conv.context_summary,
-                "entities": conv.context_entities,
-                "topics": conv.context_topics
-            } if conv.context_summary else None
-        )
-        for conv in conversations
+    """Page through conversations, most recently updated first
+    
+    Responses carry an ETag derived from the user's conversation list
+    version, so a poll with a matching If-None-Match gets a 304 without
+    touching the database.
+    """
+    version = await context_cache.conversation_list_version(current_user.id)
+    variant = hashlib.sha1(f"{current_user.id}|{limit}|{before}|{preview}".encode()).hexdigest()[:16]
+    etag = f'W/"{version}-{variant}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    
+    # Only the listed columns; the JSON context columns stay in the table
+    columns = [
+        Conversation.id,
+        Conversation.title,
+        Conversation.created_at,
+        Conversation.updated_at,
+        Conversation.message_count
     ]
+    if preview:
+        # Served by the (conversation_id, timestamp, id) index, one row per conversation
+        columns.append(
+            select(func.substr(Message.content, 1, 120))
+            .where(Message.conversation_id == Conversation.id)
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(1)
+            .correlate(Conversation)
+            .scalar_subquery()
+            .label("last_message_preview")
+        )
+    query = select(*columns).where(
+        Conversation.user_id == current_user.id,
+        Conversation.deleted_at.is_(None)
+    )
+    if before:
+        query = query.where(tuple_(Conversation.updated_at, Conversation.id) < tuple_(*decode_cursor(before)))
+    result = await db.execute(
+        query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+    )
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    return ConversationPage(
+        conversations=[
+            ConversationListItem(
+                id=str(row.id),
+                title=row.title,
+                user_id=str(current_user.id),
+                created_at=row.created_at,
+                updated_at=row.updated_at,
+                message_count=row.message_count or 0,
+                last_message_preview=row.last_message_preview if preview else None
+            )
+            for row in rows
+        ],
+        has_more=has_more,
+        next_cursor=encode_position(rows[-1].updated_at, rows[-1].id) if has_more else None
+    )
 
 @router.post("/", response_model=ConversationResponse)
 async def create_conversation(
     conversation_data: ConversationCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     conversation = Conversation(
         title=conversation_data.title,
@@ -73,8 +217,10 @@ async def create_conversation(
     )
     
     db.add(conversation)
-    db.commit()
-    db.refresh(conversation)
+    await db.commit()
+    await db.refresh(conversation)
+    await replica_router.mark_write(current_user.id)
+    await context_cache.bump_conversation_list(current_user.id)
     
     return ConversationResponse(
         id=str(conversation.id),
@@ -85,16 +231,80 @@ async def create_conversation(
         message_count=0
     )
 
+@router.get("/export")
+async def export_conversations(
+    compress: Optional[str] = Query(None, pattern="^gzip$"),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream all of the user's conversations and messages as NDJSON"""
+    return await export_response(current_user.id, None, compress, "conversations")
+
+@router.get("/search", response_model=SearchPage)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000),
+    conversation_id: Optional[uuid.UUID] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Full-text search over the user's messages, best matches first"""
+    hits = await message_search.search(db, current_user.id, q, limit, offset, conversation_id)
+    return SearchPage(
+        results=[
+            SearchHit(
+                id=str(hit["id"]),
+                conversation_id=str(hit["conversation_id"]),
+                conversation_title=hit["conversation_title"],
+                role=hit["role"],
+                timestamp=hit["timestamp"],
+                highlight=hit["highlight"],
+                rank=hit["rank"]
+            )
+            for hit in hits[:limit]
+        ],
+        next_offset=offset + limit if len(hits) > limit else None
+    )
+
+@router.post("/import")
+async def import_conversations(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Load an NDJSON export (optionally gzipped) into the user's account as new conversations"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.IMPORT_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Import exceeds {settings.IMPORT_MAX_BYTES} bytes"
+        )
+    
+    importer = ConversationImporter(current_user.id, batch_size=settings.IMPORT_BATCH_SIZE)
+    try:
+        imported = await importer.load(ndjson_lines(
+            request.stream(), settings.IMPORT_MAX_LINE_BYTES, settings.IMPORT_MAX_BYTES
+        ))
+    except ImportTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Invalid import: {e}"
+        )
+    except ImportFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid import: {e}"
+        )
+    await replica_router.mark_write(current_user.id)
+    await context_cache.bump_conversation_list(current_user.id)
+    return {"imported": imported}
+
 @router.get("/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
-    conversation_id: str,
+    conversation_id: uuid.UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    conversation = await get_owned_conversation(db, conversation_id, current_user.id)
     
     if not conversation:
         raise HTTPException(
@@ -113,20 +323,42 @@ async def get_conversation(
             "summary": conversation.context_summary,
             "entities": conversation.context_entities,
             "topics": conversation.context_topics
-        } if conversation.context_summary else None
+        } if conversation.context_summary or conversation.context_topics else None
     )
 
-@router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
+@router.get("/{conversation_id}/export")
+async def export_conversation(
+    conversation_id: uuid.UUID,
+    compress: Optional[str] = Query(None, pattern="^gzip$"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Stream one conversation and its messages as NDJSON"""
+    if not await get_owned_conversation(db, conversation_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    return await export_response(current_user.id, conversation_id, compress, f"conversation-{conversation_id}")
+
+@router.get("/{conversation_id}/messages", response_model=MessagePage)
 async def get_messages(
-    conversation_id: str,
+    conversation_id: uuid.UUID,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
+    """Page through messages on (timestamp, id); defaults to the most recent page"""
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either before or after, not both"
+        )
+    
     # Verify conversation ownership
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    conversation = await get_owned_conversation(db, conversation_id, current_user.id)
     
     if not conversation:
         raise HTTPException(
@@ -134,44 +366,89 @@ async def get_messages(
             detail="Conversation not found"
         )
     
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.timestamp.asc()).all()
-    
-    return [
-        MessageResponse(
-            id=str(msg.id),
-            content=msg.content,
-            role=msg.role,
-            timestamp=msg.timestamp,
-            conversation_id=str(msg.conversation_id),
-            metadata=msg.metadata
+    position = tuple_(Message.timestamp, Message.id)
+    query = select(Message).where(Message.conversation_id == conversation_id)
+    
+    if after:
+        # Walk forward from the cursor
+        query = query.where(position > tuple_(*decode_cursor(after))).order_by(
+            Message.timestamp.asc(), Message.id.asc()
         )
-        for msg in messages
-    ]
+    else:
+        # Walk backward from the cursor (or from the newest message)
+        if before:
+            query = query.where(position < tuple_(*decode_cursor(before)))
+        query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+    
+    # Fetch one extra row to learn whether another page exists
+    result = await db.execute(query.limit(limit + 1))
+    messages = result.scalars().all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if not after:
+        messages.reverse()
+    
+    # Older pages may exist after walking forward; newer ones may always appear
+    before_cursor = after_cursor = None
+    if messages:
+        if after or has_more:
+            before_cursor = encode_cursor(messages[0])
+        after_cursor = encode_cursor(messages[-1])
+    
+    return MessagePage(
+        messages=[
+            MessageResponse(
+                id=str(msg.id),
+                content=msg.content,
+                role=msg.role,
+                timestamp=msg.timestamp,
+                conversation_id=str(msg.conversation_id),
+                metadata=msg.message_metadata
+            )
+            for msg in messages
+        ],
+        has_more=has_more,
+        before_cursor=before_cursor,
+        after_cursor=after_cursor
+    )
 
 @router.delete("/{conversation_id}")
 async def delete_conversation(
-    conversation_id: str,
+    conversation_id: uuid.UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    """Hide the conversation at once; its messages and memories are removed in the background"""
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(Conversation).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id,
+            Conversation.deleted_at.is_(None)
+        ).values(deleted_at=now).execution_options(synchronize_session=False)
+    )
     
-    if not conversation:
+    if result.rowcount == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Conversation not found"
         )
     
-    # Delete all messages first
-    db.query(Message).filter(Message.conversation_id == conversation_id).delete()
+    # Expiring the conversation's memories hides them from every memory read until the reaper deletes them
+    memory_ids = (await db.execute(
+        update(UserMemory).where(
+            UserMemory.user_id == current_user.id,
+            UserMemory.memory_metadata["conversation_id"].as_string() == str(conversation_id)
+        ).values(expires_at=now).returning(UserMemory.id).execution_options(synchronize_session=False)
+    )).scalars().all()
     
-    # Delete conversation
-    db.delete(conversation)
-    db.commit()
+    await db.commit()
+    await replica_router.mark_write(current_user.id)
+    if memory_ids:
+        await semantic_index.remove_memories(str(current_user.id), memory_ids)
+        await context_cache.invalidate_user(str(current_user.id))
+    await context_cache.invalidate_conversation(conversation_id)
+    await context_cache.bump_conversation_list(current_user.id)
+    conversation_reaper.wake()
     
     return {"message": "Conversation deleted successfully"}
\ No newline at end of file
@@ -1,27 +1,174 @@
-import asyncpg
-import redis
-from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer, Boolean, ForeignKey, JSON
+import asyncio
+import json
+import redis.asyncio as redis
+from sqlalchemy import Column, String, DateTime, Text, Integer, Boolean, ForeignKey, JSON, Index, LargeBinary, Uuid, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
 from datetime import datetime
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict, Iterable, List, Optional
 import uuid
 
 from .config import settings
 
-# PostgreSQL setup
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_async_database_url(url: str) -> str:
+    """Map a plain database URL onto its asyncio driver"""
+    if url.startswith("postgresql://") or url.startswith("postgres://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+def create_engine_for(url: str):
+    """Create an async engine, sizing the pool for server databases"""
+    async_url = get_async_database_url(url)
+    if async_url.startswith("sqlite"):
+        return create_async_engine(async_url)
+    return create_async_engine(
+        async_url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+# PostgreSQL setup (asyncpg driver, pooled)
+engine = create_engine_for(settings.DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-# Redis setup
-redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+# Redis setup (asyncio client over a bounded connection pool)
+redis_pool = redis.ConnectionPool.from_url(
+    settings.REDIS_URL,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    decode_responses=True
+)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Seconds a PostgreSQL standby is behind; 0 when it has replayed everything it received
+REPLICA_LAG_QUERY = text(
+    "SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)"
+)
+
+class ReplicaRouter:
+    """Sends read-only work to replicas and everything else to the primary
+
+    Replicas are used round-robin while their replication lag, polled
+    every `check_interval` seconds, stays under `max_lag`; with none
+    healthy, reads fall back to the primary. After a user writes,
+    `mark_write` keeps that user's reads on the primary for `sticky`
+    seconds (never less than `max_lag`) so they always see their own
+    writes. Without replicas every session comes from the primary and no
+    Redis lookup is made.
+    """
+
+    def __init__(self, urls: Iterable[str], max_lag: float = 5.0, sticky: float = 5.0, check_interval: float = 2.0):
+        self.engines = [create_engine_for(url) for url in urls]
+        self.session_factories = [
+            async_sessionmaker(bind=replica, autoflush=False, expire_on_commit=False)
+            for replica in self.engines
+        ]
+        self.max_lag = max_lag
+        self.sticky_ms = int(max(sticky, max_lag) * 1000)
+        self.check_interval = check_interval
+        self.lag: List[Optional[float]] = [None] * len(self.engines)  # None until checked, or unreachable
+        self.stats = {"primary_reads": 0, "replica_reads": 0, "sticky_reads": 0, "writes_marked": 0}
+        self._healthy: List[int] = []
+        self._next = 0
+        self._monitor: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    @staticmethod
+    def _sticky_key(ident) -> str:
+        return f"db:sticky:{ident}"
+
+    async def mark_write(self, *idents):
+        """Keep reads for these users (ids or emails) on the primary for a while"""
+        if not self.enabled or not idents:
+            return
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for ident in idents:
+                pipe.set(self._sticky_key(ident), 1, px=self.sticky_ms)
+            await pipe.execute()
+        self.stats["writes_marked"] += 1
+
+    async def session_factory(self, ident=None):
+        """Session factory for a read on behalf of this user"""
+        if not self.enabled:
+            return AsyncSessionLocal
+        if ident is not None and await redis_client.exists(self._sticky_key(ident)):
+            self.stats["sticky_reads"] += 1
+            return AsyncSessionLocal
+        if not self._healthy:
+            self.stats["primary_reads"] += 1
+            return AsyncSessionLocal
+        self._next = (self._next + 1) % len(self._healthy)
+        self.stats["replica_reads"] += 1
+        return self.session_factories[self._healthy[self._next]]
+
+    async def check_lag(self):
+        for index, replica in enumerate(self.engines):
+            try:
+                async with replica.connect() as conn:
+                    if conn.dialect.name == "postgresql":
+                        self.lag[index] = float((await conn.execute(REPLICA_LAG_QUERY)).scalar() or 0)
+                    else:
+                        await conn.execute(text("SELECT 1"))
+                        self.lag[index] = 0.0
+            except Exception as e:
+                if self.lag[index] is not None:
+                    print(f"Replica {index} unreachable: {e}")
+                self.lag[index] = None
+        self._healthy = [index for index, lag in enumerate(self.lag) if lag is not None and lag <= self.max_lag]
+
+    async def _watch(self):
+        while True:
+            await self.check_lag()
+            await asyncio.sleep(self.check_interval)
+
+    async def start(self):
+        if self.enabled and self._monitor is None:
+            await self.check_lag()
+            self._monitor = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+
+    async def dispose(self):
+        for replica in self.engines:
+            await replica.dispose()
+
+    def snapshot(self) -> Dict[str, float]:
+        known = [lag for lag in self.lag if lag is not None]
+        return {
+            **self.stats,
+            "replicas": len(self.engines),
+            "healthy": len(self._healthy),
+            "max_lag_seconds": max(known, default=0.0)
+        }
+
+replica_router = ReplicaRouter(
+    settings.DATABASE_REPLICA_URLS,
+    max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+    sticky=settings.REPLICA_STICKY_SECONDS,
+    check_interval=settings.REPLICA_LAG_CHECK_INTERVAL
+)
 
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
     email = Column(String, unique=True, index=True, nullable=False)
     name = Column(String, nullable=False)
     hashed_password = Column(String, nullable=False)
@@ -37,9 +184,9 @@ class User(Base):
 class Conversation(Base):
     __tablename__ = "conversations"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
     title = Column(String, default="New Conversation")
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    user_id = Column(Uuid(as_uuid=True), ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -49,50 +196,107 @@ class Conversation(Base):
     context_topics = Column(JSON, default=[])
     message_count = Column(Integer, default=0)
     
+    # Last message (timestamp, id) folded into context_summary
+    summarized_until = Column(DateTime, nullable=True)
+    summarized_until_id = Column(Uuid(as_uuid=True), nullable=True)
+    
+    # Soft delete: set when deleted, the row is reaped in the background
+    deleted_at = Column(DateTime, nullable=True)
+    
     # Relationships
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation")
+    
+    __table_args__ = (
+        # Scopes per-user listings and message search
+        Index("ix_conversations_user_updated", "user_id", "updated_at"),
+        Index("ix_conversations_deleted_at", "deleted_at"),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
     content = Column(Text, nullable=False)
     role = Column(String, nullable=False)  # 'user' or 'assistant'
     timestamp = Column(DateTime, default=datetime.utcnow)
-    conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"), nullable=False)
+    conversation_id = Column(Uuid(as_uuid=True), ForeignKey("conversations.id"), nullable=False)
     
-    # Message metadata
-    metadata = Column(JSON, default={})
+    # Message metadata ("metadata" is reserved on declarative models)
+    message_metadata = Column("metadata", JSON, default={})
     
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
+    
+    __table_args__ = (
+        # Serves keyset pagination and "last N messages" lookups
+        Index("ix_messages_conversation_timestamp", "conversation_id", "timestamp", "id"),
+    )
 
 class UserMemory(Base):
     __tablename__ = "user_memory"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid(as_uuid=True), ForeignKey("users.id"), nullable=False)
     memory_type = Column(String, nullable=False)  # 'short_term', 'long_term', 'semantic'
     content = Column(Text, nullable=False)
     importance_score = Column(Integer, default=1)  # 1-10 scale
     created_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=True)
+    decayed_at = Column(DateTime, nullable=True)  # last importance decay or reinforcement
     
-    # Memory metadata
-    metadata = Column(JSON, default={})
+    # Memory metadata ("metadata" is reserved on declarative models)
+    memory_metadata = Column("metadata", JSON, default={})
+    
+    __table_args__ = (
+        Index("ix_user_memory_user_type_importance", "user_id", "memory_type", "importance_score"),
+        Index("ix_user_memory_expires_at", "expires_at"),
+    )
+
+class MemoryEmbedding(Base):
+    __tablename__ = "memory_embeddings"
+    
+    memory_id = Column(Uuid(as_uuid=True), ForeignKey("user_memory.id", ondelete="CASCADE"), primary_key=True)
+    model = Column(String, primary_key=True)  # embedder name, e.g. "hashing-256"
+    user_id = Column(Uuid(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    vector = Column(LargeBinary, nullable=False)  # float32, L2-normalized
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_memory_embeddings_user_model_created", "user_id", "model", "created_at"),
+    )
+
+def _create_schema(conn):
+    Base.metadata.create_all(conn)
+    # create_all skips tables that already exist, so add any missing (nullable) columns and indexes
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+                )
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 async def init_db():
     """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_schema)
 
-def get_db() -> Session:
+async def close_db():
+    """Dispose of pooled database and Redis connections"""
+    await engine.dispose()
+    await replica_router.dispose()
+    await redis_client.aclose()
+    await redis_pool.disconnect()
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """Get database session"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def get_redis():
     """Get Redis client"""
@@ -101,26 +305,77 @@ def get_redis():
 # Memory Store Functions
 class MemoryStore:
     @staticmethod
-    def store_short_term(user_id: str, key: str, value: str, ttl: int = 3600):
+    def _short_term_key(user_id: str, key: str) -> str:
+        return f"short_term:{user_id}:{key}"
+
+    @staticmethod
+    def _context_key(conversation_id: str) -> str:
+        return f"context:{conversation_id}"
+
+    @staticmethod
+    async def store_short_term(user_id: str, key: str, value: str, ttl: int = 3600):
         """Store short-term memory in Redis"""
-        redis_client.setex(f"short_term:{user_id}:{key}", ttl, value)
+        await redis_client.setex(MemoryStore._short_term_key(user_id, key), ttl, value)
     
     @staticmethod
-    def get_short_term(user_id: str, key: str) -> str:
+    async def get_short_term(user_id: str, key: str) -> Optional[str]:
         """Get short-term memory from Redis"""
-        return redis_client.get(f"short_term:{user_id}:{key}")
+        return await redis_client.get(MemoryStore._short_term_key(user_id, key))
+
+    @staticmethod
+    async def get_short_term_many(user_id: str, keys: Iterable[str]) -> Dict[str, str]:
+        """Get several short-term memories in a single MGET round-trip"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = await redis_client.mget([MemoryStore._short_term_key(user_id, key) for key in keys])
+        return {key: value for key, value in zip(keys, values) if value}
     
     @staticmethod
-    def store_conversation_context(conversation_id: str, context: dict, ttl: int = 3600 * 24):
+    async def store_conversation_context(conversation_id: str, context: dict, ttl: int = 3600 * 24):
         """Store conversation context in Redis"""
-        import json
-        redis_client.setex(f"context:{conversation_id}", ttl, json.dumps(context))
+        await redis_client.setex(MemoryStore._context_key(conversation_id), ttl, json.dumps(context))
     
     @staticmethod
-    def get_conversation_context(conversation_id: str) -> dict:
+    async def get_conversation_context(conversation_id: str) -> dict:
         """Get conversation context from Redis"""
-        import json
-        data = redis_client.get(f"context:{conversation_id}")
+        data = await redis_client.get(MemoryStore._context_key(conversation_id))
         return json.loads(data) if data else {}
 
+    @staticmethod
+    async def store_memory_updates(
+        user_id: str,
+        short_term: Dict[str, str],
+        conversation_id: Optional[str] = None,
+        context: Optional[dict] = None,
+        short_term_ttl: int = 3600,
+        context_ttl: int = 3600 * 24
+    ):
+        """Write all short-term and conversation context updates in one pipelined round-trip"""
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key, value in short_term.items():
+                pipe.setex(MemoryStore._short_term_key(user_id, key), short_term_ttl, value)
+            if conversation_id and context is not None:
+                pipe.setex(MemoryStore._context_key(conversation_id), context_ttl, json.dumps(context))
+            await pipe.execute()
+
+    @staticmethod
+    async def store_socket_session(sid: str, session: Dict[str, str], ttl: int = 3600 * 24):
+        """Store Socket.IO session data where every worker can read it"""
+        key = f"sio_session:{sid}"
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=session)
+            pipe.expire(key, ttl)
+            await pipe.execute()
+
+    @staticmethod
+    async def get_socket_session(sid: str) -> Dict[str, str]:
+        """Get Socket.IO session data"""
+        return await redis_client.hgetall(f"sio_session:{sid}")
+
+    @staticmethod
+    async def delete_socket_session(sid: str):
+        """Remove Socket.IO session data on disconnect"""
+        await redis_client.delete(f"sio_session:{sid}")
+
 memory_store = MemoryStore()
\ No newline at end of file
@@ -0,0 +1,198 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
+
+from .metrics import TURN_STAGE_SECONDS
+from .config import settings
+
+class GenerationRejected(Exception):
+    """A generation was shed instead of being run"""
+
+    def __init__(self, code: str, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+class GenerationJob:
+    """One queued or running generation; await it for the outcome"""
+
+    def __init__(self, user_id: str, sid: str, run: Callable[[], Awaitable]):
+        self.user_id = user_id
+        self.sid = sid
+        self.run = run
+        self.enqueued_at = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+        self.task: Optional[asyncio.Task] = None
+        self.position = 0
+
+    @property
+    def started(self) -> bool:
+        return self.task is not None
+
+    def __await__(self):
+        return self.future.__await__()
+
+class GenerationScheduler:
+    """Bounded worker pool with per-user fair queuing and load shedding
+
+    At most `max_concurrency` generations run at once and at most
+    `max_per_user` of them for any one user. Waiting jobs sit in per-user
+    FIFO queues that are served round-robin, so a user with many pending
+    messages only ever takes their turn. Submissions beyond `max_queue`
+    waiting jobs overall (or `max_queue_per_user` for one user) are
+    rejected up front, and jobs that waited longer than `max_wait`
+    seconds are dropped instead of started.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_per_user: int = 1,
+        max_queue: int = 256,
+        max_queue_per_user: int = 4,
+        max_wait: float = 30.0
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self.stats = {"admitted": 0, "rejected": 0, "expired": 0, "completed": 0, "failed": 0, "cancelled": 0}
+        self._queues: Dict[str, Deque[GenerationJob]] = {}
+        self._ready: "OrderedDict[str, None]" = OrderedDict()  # users with waiting jobs, in service order
+        self._running: Dict[str, int] = {}
+        self._jobs_by_sid: Dict[str, Set[GenerationJob]] = {}
+        self._active = 0
+        self._waiting = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def submit(self, user_id: str, sid: str, run: Callable[[], Awaitable]) -> GenerationJob:
+        """Queue a generation or raise GenerationRejected if the backend is saturated"""
+        queue = self._queues.get(user_id)
+        if self._waiting >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise GenerationRejected("overloaded", "The assistant is busy, please retry shortly", retry_after=2.0)
+        if queue is not None and len(queue) >= self.max_queue_per_user:
+            self.stats["rejected"] += 1
+            raise GenerationRejected("too_many_pending", "Please wait for your previous messages to be answered")
+
+        job = GenerationJob(user_id, sid, run)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+        queue.append(job)
+        job.position = len(queue)
+        self._ready.setdefault(user_id, None)
+        self._jobs_by_sid.setdefault(sid, set()).add(job)
+        self._waiting += 1
+        self.stats["admitted"] += 1
+        self._dispatch()
+        return job
+
+    def _next_job(self) -> Optional[GenerationJob]:
+        """Pop the head job of the first user in rotation that is below its limit"""
+        for user_id in self._ready:
+            if self._running.get(user_id, 0) >= self.max_per_user:
+                continue
+            queue = self._queues[user_id]
+            job = queue.popleft()
+            if queue:
+                self._ready.move_to_end(user_id)
+            else:
+                del self._ready[user_id]
+                del self._queues[user_id]
+            self._waiting -= 1
+            return job
+        return None
+
+    def _dispatch(self):
+        while self._active < self.max_concurrency:
+            job = self._next_job()
+            if job is None:
+                return
+            waited = time.monotonic() - job.enqueued_at
+            if waited > self.max_wait:
+                self.stats["expired"] += 1
+                self._forget(job)
+                job.future.set_exception(
+                    GenerationRejected("timeout", "The assistant is busy, please retry shortly", retry_after=2.0)
+                )
+                continue
+            TURN_STAGE_SECONDS.labels("queue_wait").observe(waited)
+            self._active += 1
+            self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+            job.task = asyncio.create_task(job.run())
+            job.task.add_done_callback(lambda task, job=job: self._finished(job, task))
+
+    def _finished(self, job: GenerationJob, task: asyncio.Task):
+        self._active -= 1
+        running = self._running[job.user_id] - 1
+        if running:
+            self._running[job.user_id] = running
+        else:
+            del self._running[job.user_id]
+        self._forget(job)
+
+        if task.cancelled():
+            self.stats["cancelled"] += 1
+            job.future.cancel()
+        elif task.exception() is not None:
+            self.stats["failed"] += 1
+            job.future.set_exception(task.exception())
+        else:
+            self.stats["completed"] += 1
+            job.future.set_result(task.result())
+        self._dispatch()
+
+    def _forget(self, job: GenerationJob):
+        jobs = self._jobs_by_sid.get(job.sid)
+        if jobs is not None:
+            jobs.discard(job)
+            if not jobs:
+                del self._jobs_by_sid[job.sid]
+
+    def _drop_waiting(self, job: GenerationJob):
+        queue = self._queues.get(job.user_id)
+        if queue is None or job not in queue:
+            return
+        queue.remove(job)
+        if not queue:
+            del self._queues[job.user_id]
+            self._ready.pop(job.user_id, None)
+        self._waiting -= 1
+        self._forget(job)
+        self.stats["cancelled"] += 1
+        job.future.cancel()
+
+    def cancel_session(self, sid: str):
+        """Cancel every queued and running generation for a socket (e.g. on disconnect)"""
+        for job in list(self._jobs_by_sid.get(sid, ())):
+            if job.task is not None:
+                job.task.cancel()
+            else:
+                self._drop_waiting(job)
+
+    async def stop(self):
+        """Cancel all queued and running generations"""
+        tasks = []
+        for sid in list(self._jobs_by_sid):
+            tasks.extend(job.task for job in self._jobs_by_sid[sid] if job.task is not None)
+            self.cancel_session(sid)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+generation_scheduler = GenerationScheduler(
+    max_concurrency=settings.GENERATION_CONCURRENCY,
+    max_per_user=settings.GENERATION_PER_USER_CONCURRENCY,
+    max_queue=settings.GENERATION_QUEUE_LIMIT,
+    max_queue_per_user=settings.GENERATION_USER_QUEUE_LIMIT,
+    max_wait=settings.GENERATION_MAX_QUEUE_WAIT
+)
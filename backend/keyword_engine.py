@@ -0,0 +1,176 @@
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Default keyword tables. A trailing "*" marks a prefix keyword ("prefer*"
+# matches "prefer", "prefers", "preferred"); everything else must match a
+# whole word or phrase.
+DEFAULT_ENTITIES = ["weather", "time", "date", "location", "person", "ai", "technology"]
+
+DEFAULT_TOPICS = {
+    "technology": ["ai", "computer", "software", "tech", "digital"],
+    "weather": ["weather", "temperature", "rain", "sunny", "cloudy"],
+    "general": ["help", "question", "information", "explain"],
+    "personal": ["remember", "preference", "like", "dislike", "favorite"]
+}
+
+# Checked in order; the first intent with a match wins
+DEFAULT_INTENTS = {
+    "greeting": ["hello", "hi", "hey"],
+    "information_seeking": ["help", "how", "what", "explain"],
+    "memory_retrieval": ["remember", "recall", "previous"],
+    "closing": ["thank", "thanks", "bye", "goodbye"]
+}
+
+# (boost, keywords) tiers checked in order; only the first matching tier counts
+DEFAULT_IMPORTANCE = [
+    (5, ["important", "remember", "crucial", "critical"]),
+    (4, ["prefer*", "like", "dislike", "favorite"]),
+    (3, ["always", "never", "usually"])
+]
+
+class KeywordEngine:
+    """Single-pass, word-boundary-aware keyword matcher for message analysis"""
+
+    def __init__(
+        self,
+        entities: Optional[Sequence[str]] = None,
+        topics: Optional[Dict[str, Sequence[str]]] = None,
+        intents: Optional[Dict[str, Sequence[str]]] = None,
+        importance: Optional[Sequence[Tuple[int, Sequence[str]]]] = None,
+        default_intent: str = "general_query",
+        long_message_length: int = 100,
+        long_message_boost: int = 2,
+        max_entities: int = 5,
+        max_topics: int = 3
+    ):
+        self.entities = list(DEFAULT_ENTITIES if entities is None else entities)
+        self.topics = dict(DEFAULT_TOPICS if topics is None else topics)
+        self.intents = dict(DEFAULT_INTENTS if intents is None else intents)
+        self.importance = [(int(boost), list(words)) for boost, words in (DEFAULT_IMPORTANCE if importance is None else importance)]
+        self.default_intent = default_intent
+        self.long_message_length = long_message_length
+        self.long_message_boost = long_message_boost
+        self.max_entities = max_entities
+        self.max_topics = max_topics
+        self._compile()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "KeywordEngine":
+        """Build an engine from a dict shaped like the default tables"""
+        return cls(
+            entities=config.get("entities"),
+            topics=config.get("topics"),
+            intents=config.get("intents"),
+            importance=config.get("importance"),
+            **{key: config[key] for key in (
+                "default_intent", "long_message_length", "long_message_boost", "max_entities", "max_topics"
+            ) if key in config}
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> "KeywordEngine":
+        """Build an engine from a JSON file of keyword tables"""
+        with open(path) as f:
+            return cls.from_config(json.load(f))
+
+    def _compile(self):
+        """Index every keyword by the labels it contributes and build one combined regex"""
+        # label kinds: ("entity", rank), ("topic", rank), ("intent", rank), ("importance", rank)
+        self._exact: Dict[str, List[Tuple[str, int]]] = {}
+        self._prefixes: Dict[str, List[Tuple[str, int]]] = {}
+
+        def add(keyword: str, label: Tuple[str, int]):
+            keyword = " ".join(keyword.lower().split())
+            if keyword.endswith("*"):
+                self._prefixes.setdefault(keyword[:-1], []).append(label)
+            else:
+                self._exact.setdefault(keyword, []).append(label)
+
+        for rank, entity in enumerate(self.entities):
+            add(entity, ("entity", rank))
+        for rank, keywords in enumerate(self.topics.values()):
+            for keyword in keywords:
+                add(keyword, ("topic", rank))
+        for rank, keywords in enumerate(self.intents.values()):
+            for keyword in keywords:
+                add(keyword, ("intent", rank))
+        for rank, (_, keywords) in enumerate(self.importance):
+            for keyword in keywords:
+                add(keyword, ("importance", rank))
+
+        self._topic_names = list(self.topics)
+        self._intent_names = list(self.intents)
+        self._prefix_order = list(self._prefixes)
+
+        def pattern(keyword: str, prefix: bool) -> str:
+            body = r"\s+".join(re.escape(word) for word in keyword.split(" "))
+            return body + r"\w*" if prefix else body
+
+        # Longer alternatives first so phrases win over their leading words
+        alternatives = [(k, False) for k in self._exact] + [(k, True) for k in self._prefixes]
+        alternatives.sort(key=lambda item: len(item[0]), reverse=True)
+        if alternatives:
+            combined = "|".join(pattern(keyword, prefix) for keyword, prefix in alternatives)
+            self._regex = re.compile(rf"\b(?:{combined})\b", re.IGNORECASE)
+        else:
+            self._regex = None
+
+    def _labels_for(self, keyword: str) -> List[Tuple[str, int]]:
+        labels = list(self._exact.get(keyword, ()))
+        for stem in self._prefix_order:
+            if keyword.startswith(stem):
+                labels.extend(self._prefixes[stem])
+        return labels
+
+    def match_keywords(self, text: str) -> List[str]:
+        """Return the distinct keywords found in text, in order of appearance"""
+        if self._regex is None:
+            return []
+        seen = {}
+        for match in self._regex.finditer(text):
+            seen.setdefault(" ".join(match.group(0).lower().split()), None)
+        return list(seen)
+
+    def analyze(self, text: str) -> Dict:
+        """Extract entities, topics, intent and importance in one pass over text"""
+        entity_ranks = set()
+        topic_ranks = set()
+        intent_rank = None
+        importance_rank = None
+        keywords = self.match_keywords(text)
+
+        for keyword in keywords:
+            for kind, rank in self._labels_for(keyword):
+                if kind == "entity":
+                    entity_ranks.add(rank)
+                elif kind == "topic":
+                    topic_ranks.add(rank)
+                elif kind == "intent":
+                    if intent_rank is None or rank < intent_rank:
+                        intent_rank = rank
+                elif importance_rank is None or rank < importance_rank:
+                    importance_rank = rank
+
+        score = 1
+        if importance_rank is not None:
+            score += self.importance[importance_rank][0]
+        elif len(text) > self.long_message_length:  # Longer messages might be more important
+            score += self.long_message_boost
+
+        return {
+            "entities": [self.entities[rank] for rank in sorted(entity_ranks)][:self.max_entities],
+            "topics": [self._topic_names[rank] for rank in sorted(topic_ranks)][:self.max_topics],
+            "intent": self._intent_names[intent_rank] if intent_rank is not None else self.default_intent,
+            "importance": min(score, 10),
+            "keywords": keywords
+        }
+
+    def analyze_many(self, texts: Iterable[str]) -> List[Dict]:
+        """Analyze a batch of texts, e.g. historical messages during a backfill"""
+        analyze = self.analyze
+        return [analyze(text) for text in texts]
+
+def load_keyword_engine(path: Optional[str] = None) -> KeywordEngine:
+    """Load the configured keyword tables, falling back to the defaults"""
+    return KeywordEngine.from_file(path) if path else KeywordEngine()
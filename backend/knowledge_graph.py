@@ -0,0 +1,345 @@
+import asyncio
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+
+# (user_id, kind, name) identifies a node; kind is "entity" or "topic"
+NodeKey = Tuple[str, str, str]
+
+def _batches(items: List[Dict], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+class GraphBackend:
+    """Base class for knowledge graph stores
+
+    `upsert` receives aggregated rows: mentions as
+    {"user_id", "kind", "name", "count", "at"} and co-occurrence edges as
+    {"user_id", "a_kind", "a", "b_kind", "b", "weight", "at"}, with the
+    (a_kind, a) node ordered before (b_kind, b).
+    """
+
+    name = "base"
+
+    async def init_schema(self):
+        pass
+
+    async def upsert(self, mentions: List[Dict], edges: List[Dict]):
+        raise NotImplementedError
+
+    async def related(self, user_id: str, seeds: Sequence[Tuple[str, str]], limit: int) -> List[Dict]:
+        """Nodes most strongly connected to the seed (kind, name) pairs, heaviest first
+
+        Nodes named like a seed are left out. Without seeds, the user's most
+        mentioned nodes.
+        """
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+class InMemoryGraph(GraphBackend):
+    """Per-user adjacency index held in process
+
+    For tests and single-node setups: each worker keeps its own graph and
+    it is lost on restart. Users are evicted least recently used beyond
+    `max_users`.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max_users
+        # user -> node -> neighbour -> weight, and user -> node -> mention count
+        self._adjacency: "OrderedDict[str, Dict[Tuple[str, str], Dict[Tuple[str, str], float]]]" = OrderedDict()
+        self._mentions: Dict[str, Dict[Tuple[str, str], int]] = {}
+
+    def _user(self, user_id: str):
+        adjacency = self._adjacency.get(user_id)
+        if adjacency is None:
+            adjacency = self._adjacency[user_id] = defaultdict(dict)
+            self._mentions[user_id] = defaultdict(int)
+            while len(self._adjacency) > self.max_users:
+                evicted, _ = self._adjacency.popitem(last=False)
+                self._mentions.pop(evicted, None)
+        else:
+            self._adjacency.move_to_end(user_id)
+        return adjacency, self._mentions[user_id]
+
+    async def upsert(self, mentions: List[Dict], edges: List[Dict]):
+        for mention in mentions:
+            _, counts = self._user(mention["user_id"])
+            counts[(mention["kind"], mention["name"])] += mention["count"]
+        for edge in edges:
+            adjacency, _ = self._user(edge["user_id"])
+            a, b = (edge["a_kind"], edge["a"]), (edge["b_kind"], edge["b"])
+            adjacency[a][b] = adjacency[a].get(b, 0.0) + edge["weight"]
+            adjacency[b][a] = adjacency[b].get(a, 0.0) + edge["weight"]
+
+    async def related(self, user_id: str, seeds: Sequence[Tuple[str, str]], limit: int) -> List[Dict]:
+        adjacency = self._adjacency.get(user_id)
+        if adjacency is None:
+            return []
+        self._adjacency.move_to_end(user_id)
+        names = {name for _, name in seeds}
+        scores: Dict[Tuple[str, str], float] = defaultdict(float)
+        if seeds:
+            for seed in set(seeds):
+                for neighbour, weight in adjacency.get(seed, {}).items():
+                    if neighbour[1] not in names:
+                        scores[neighbour] += weight
+        else:
+            scores.update(self._mentions[user_id])
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"kind": kind, "name": name, "weight": weight} for (kind, name), weight in ranked]
+
+    def __len__(self) -> int:
+        return len(self._adjacency)
+
+class Neo4jGraph(GraphBackend):
+    """Neo4j store (optional dependency), written with batched UNWIND upserts
+
+    Each user is a (:User) node linked by [:MENTIONED] to its
+    (:Concept {user_id, kind, name}) nodes, which are linked to each
+    other by undirected [:CO_OCCURS {weight}] relationships.
+    """
+
+    name = "neo4j"
+
+    UPSERT_MENTIONS = (
+        "UNWIND $rows AS row "
+        "MERGE (u:User {id: row.user_id}) "
+        "MERGE (c:Concept {user_id: row.user_id, kind: row.kind, name: row.name}) "
+        "SET c.mentions = coalesce(c.mentions, 0) + row.count, c.last_seen = row.at "
+        "MERGE (u)-[m:MENTIONED]->(c) "
+        "SET m.count = coalesce(m.count, 0) + row.count"
+    )
+    UPSERT_EDGES = (
+        "UNWIND $rows AS row "
+        "MATCH (a:Concept {user_id: row.user_id, kind: row.a_kind, name: row.a}) "
+        "MATCH (b:Concept {user_id: row.user_id, kind: row.b_kind, name: row.b}) "
+        "MERGE (a)-[r:CO_OCCURS]-(b) "
+        "SET r.weight = coalesce(r.weight, 0) + row.weight, r.last_seen = row.at"
+    )
+    RELATED = (
+        "UNWIND $seeds AS seed "
+        "MATCH (s:Concept {user_id: $user_id, kind: seed[0], name: seed[1]})-[r:CO_OCCURS]-(n:Concept) "
+        "WHERE NOT n.name IN $names "
+        "RETURN n.kind AS kind, n.name AS name, sum(r.weight) AS weight "
+        "ORDER BY weight DESC LIMIT $limit"
+    )
+    TOP_MENTIONED = (
+        "MATCH (:User {id: $user_id})-[m:MENTIONED]->(n:Concept) "
+        "RETURN n.kind AS kind, n.name AS name, m.count AS weight "
+        "ORDER BY weight DESC LIMIT $limit"
+    )
+
+    def __init__(self, uri: str, user: str, password: str, database: Optional[str] = None):
+        try:
+            from neo4j import AsyncGraphDatabase
+        except ImportError:
+            raise RuntimeError("neo4j is not installed; use the in-memory knowledge graph instead")
+        self._driver = AsyncGraphDatabase.driver(uri, auth=(user, password))
+        self.database = database
+
+    async def init_schema(self):
+        async with self._driver.session(database=self.database) as session:
+            await session.run("CREATE CONSTRAINT user_id IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE")
+            await session.run(
+                "CREATE CONSTRAINT concept_key IF NOT EXISTS "
+                "FOR (c:Concept) REQUIRE (c.user_id, c.kind, c.name) IS UNIQUE"
+            )
+
+    async def upsert(self, mentions: List[Dict], edges: List[Dict]):
+        async def write(tx):
+            # Nodes first: the edge statement only matches existing concepts
+            if mentions:
+                await (await tx.run(self.UPSERT_MENTIONS, rows=mentions)).consume()
+            if edges:
+                await (await tx.run(self.UPSERT_EDGES, rows=edges)).consume()
+        async with self._driver.session(database=self.database) as session:
+            await session.execute_write(write)
+
+    async def related(self, user_id: str, seeds: Sequence[Tuple[str, str]], limit: int) -> List[Dict]:
+        async def read(tx):
+            if seeds:
+                result = await tx.run(
+                    self.RELATED,
+                    user_id=user_id,
+                    seeds=[list(seed) for seed in seeds],
+                    names=[name for _, name in seeds],
+                    limit=limit
+                )
+            else:
+                result = await tx.run(self.TOP_MENTIONED, user_id=user_id, limit=limit)
+            return [record.data() async for record in result]
+        async with self._driver.session(database=self.database) as session:
+            return await session.execute_read(read)
+
+    async def aclose(self):
+        await self._driver.close()
+
+def create_graph_backend(name: str = "memory") -> Optional[GraphBackend]:
+    """Create a knowledge graph backend by name ("memory", "neo4j" or "none")"""
+    if name == "none":
+        return None
+    if name == "memory":
+        return InMemoryGraph(settings.KNOWLEDGE_GRAPH_MAX_USERS)
+    if name == "neo4j":
+        return Neo4jGraph(settings.NEO4J_URI, settings.NEO4J_USER, settings.NEO4J_PASSWORD)
+    raise ValueError(f"Unknown knowledge graph backend: {name}")
+
+class KnowledgeGraph:
+    """Accumulates entity/topic co-occurrence per user and serves related-concept lookups
+
+    `record_turn` only aggregates into pending counters; a background task
+    writes them to the backend every `flush_interval` seconds (sooner once
+    `batch_size` rows are pending), `batch_size` rows per upsert. Pending
+    rows beyond `max_pending` are dropped rather than growing without
+    bound while the backend is down. Lookups give up after
+    `lookup_timeout` seconds so the graph never holds up a turn.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[GraphBackend],
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        max_pending: int = 50000,
+        lookup_timeout: float = 0.05
+    ):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.lookup_timeout = lookup_timeout
+        self.stats = {"turns": 0, "flushes": 0, "rows_written": 0, "dropped": 0, "failures": 0, "lookups": 0, "lookup_timeouts": 0}
+        self._mentions: Dict[NodeKey, int] = defaultdict(int)
+        self._edges: Dict[Tuple[NodeKey, NodeKey], int] = defaultdict(int)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self._mentions) + len(self._edges)
+
+    @staticmethod
+    def _nodes(user_id: str, entities: Sequence[str], topics: Sequence[str]) -> List[NodeKey]:
+        nodes = [(user_id, "entity", name) for name in entities] + [(user_id, "topic", name) for name in topics]
+        return sorted(set(nodes))
+
+    def record_turn(self, user_id, entities: Sequence[str], topics: Sequence[str]):
+        """Queue the mentions and pairwise co-occurrences from one turn"""
+        if not self.enabled:
+            return
+        nodes = self._nodes(str(user_id), entities, topics)
+        if not nodes:
+            return
+        if self.pending >= self.max_pending:
+            self.stats["dropped"] += 1
+            return
+        for node in nodes:
+            self._mentions[node] += 1
+        for pair in combinations(nodes, 2):
+            self._edges[pair] += 1
+        self.stats["turns"] += 1
+        if self.pending >= self.batch_size:
+            self._wake.set()
+
+    async def related(self, user_id, entities: Sequence[str] = (), topics: Sequence[str] = (), limit: int = 8) -> List[Dict]:
+        """Concepts the user has most often mentioned together with these ones"""
+        if not self.enabled:
+            return []
+        seeds = [(kind, name) for _, kind, name in self._nodes(str(user_id), entities, topics)]
+        self.stats["lookups"] += 1
+        try:
+            return await asyncio.wait_for(self.backend.related(str(user_id), seeds, limit), self.lookup_timeout)
+        except asyncio.TimeoutError:
+            self.stats["lookup_timeouts"] += 1
+        except Exception as e:
+            self.stats["failures"] += 1
+            print(f"Knowledge graph lookup failed: {e}")
+        return []
+
+    async def flush(self):
+        """Write everything pending to the backend"""
+        if not self.pending:
+            return
+        mentions, self._mentions = self._mentions, defaultdict(int)
+        edges, self._edges = self._edges, defaultdict(int)
+        at = datetime.utcnow().isoformat()
+        mention_rows = [
+            {"user_id": user_id, "kind": kind, "name": name, "count": count, "at": at}
+            for (user_id, kind, name), count in mentions.items()
+        ]
+        edge_rows = [
+            {"user_id": a[0], "a_kind": a[1], "a": a[2], "b_kind": b[1], "b": b[2], "weight": weight, "at": at}
+            for (a, b), weight in edges.items()
+        ]
+        try:
+            # All node batches go before any edge batch, since edges attach to existing nodes
+            for rows in _batches(mention_rows, self.batch_size):
+                await self.backend.upsert(rows, [])
+            for rows in _batches(edge_rows, self.batch_size):
+                await self.backend.upsert([], rows)
+        except Exception:
+            # Upserts are additive, so a retried batch may count some rows twice; that beats losing them
+            for key, count in mentions.items():
+                self._mentions[key] += count
+            for key, weight in edges.items():
+                self._edges[key] += weight
+            raise
+        self.stats["flushes"] += 1
+        self.stats["rows_written"] += len(mention_rows) + len(edge_rows)
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"Knowledge graph flush failed: {e}")
+                # A full buffer keeps waking the loop; don't hammer a backend that is down
+                await asyncio.sleep(self.flush_interval)
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            await self.backend.init_schema()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Knowledge graph final flush failed: {e}")
+            await self.backend.aclose()
+
+knowledge_graph = KnowledgeGraph(
+    create_graph_backend(settings.KNOWLEDGE_GRAPH_BACKEND),
+    flush_interval=settings.KNOWLEDGE_GRAPH_FLUSH_INTERVAL,
+    batch_size=settings.KNOWLEDGE_GRAPH_BATCH_SIZE,
+    max_pending=settings.KNOWLEDGE_GRAPH_MAX_PENDING,
+    lookup_timeout=settings.KNOWLEDGE_GRAPH_LOOKUP_TIMEOUT
+)
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import random
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .config import settings
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class ProviderError(Exception):
+    """An LLM provider request failed"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code is None or self.status_code in RETRYABLE_STATUS
+
+class LLMProvider:
+    """Base class for chat-completion providers
+
+    `messages` are {"role": "system" | "user" | "assistant", "content": str}
+    dicts, in order.
+    """
+
+    name = "base"
+
+    async def stream(self, messages: List[Dict], max_tokens: Optional[int] = None) -> AsyncGenerator[str, None]:
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def complete(self, messages: List[Dict], max_tokens: Optional[int] = None) -> str:
+        return "".join([chunk async for chunk in self.stream(messages, max_tokens)])
+
+    async def aclose(self):
+        pass
+
+class HTTPProvider(LLMProvider):
+    """Provider over one shared keep-alive HTTP client
+
+    Every attempt gets connect/read timeouts; failed attempts that are
+    safe to repeat (transport errors, timeouts, 429/5xx) are retried with
+    full-jitter exponential backoff. With `hedge_delay` set, a second
+    identical request is started if the first has not produced its first
+    token (or response) by then, and whichever answers first wins.
+    Streams are only retried or hedged before their first token.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 2,
+        retry_backoff: float = 0.25,
+        max_backoff: float = 4.0,
+        hedge_delay: Optional[float] = None,
+        max_connections: int = 100,
+        max_tokens: int = 512,
+        temperature: float = 0.7
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.hedge_delay = hedge_delay
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stats = {"requests": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "failures": 0}
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers=self._headers()
+        )
+
+    def _headers(self) -> Dict[str, str]:
+        return {}
+
+    def _request(self, messages: List[Dict], max_tokens: int, stream: bool) -> Tuple[str, Dict]:
+        """Return (url, JSON body) for a request"""
+        raise NotImplementedError
+
+    def _parse_chunk(self, data: Dict) -> str:
+        """Text carried by one streamed event"""
+        raise NotImplementedError
+
+    def _parse_completion(self, data: Dict) -> str:
+        """Text of a non-streamed response"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _status_error(response: httpx.Response) -> ProviderError:
+        retry_after = response.headers.get("retry-after")
+        try:
+            retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            retry_after = None
+        return ProviderError(
+            f"Provider returned HTTP {response.status_code}",
+            status_code=response.status_code,
+            retry_after=retry_after
+        )
+
+    async def _post(self, messages: List[Dict], max_tokens: int) -> str:
+        url, body = self._request(messages, max_tokens, stream=False)
+        self.stats["requests"] += 1
+        response = await self.client.post(url, json=body)
+        if response.status_code >= 400:
+            raise self._status_error(response)
+        return self._parse_completion(response.json())
+
+    async def _stream_events(self, messages: List[Dict], max_tokens: int) -> AsyncGenerator[str, None]:
+        """Yield non-empty text chunks from a server-sent event stream"""
+        url, body = self._request(messages, max_tokens, stream=True)
+        self.stats["requests"] += 1
+        async with self.client.stream("POST", url, json=body) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise self._status_error(response)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                text = self._parse_chunk(json.loads(data))
+                if text:
+                    yield text
+
+    async def _open_stream(self, messages: List[Dict], max_tokens: int):
+        """Start a stream and wait for its first chunk"""
+        events = self._stream_events(messages, max_tokens)
+        try:
+            first = await events.__anext__()
+        except StopAsyncIteration:
+            return events, None
+        except BaseException:
+            await events.aclose()
+            raise
+        return events, first
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.retry_backoff * 2 ** attempt))
+        if isinstance(error, ProviderError) and error.retry_after is not None:
+            delay = max(delay, min(error.retry_after, self.max_backoff))
+        return delay
+
+    async def _with_retries(self, attempt_once: Callable[[], Awaitable]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await attempt_once()
+            except (httpx.TimeoutException, httpx.TransportError, ProviderError) as e:
+                if attempt == self.max_retries or (isinstance(e, ProviderError) and not e.retryable):
+                    self.stats["failures"] += 1
+                    if isinstance(e, ProviderError):
+                        raise
+                    raise ProviderError(f"Provider request failed: {e!r}") from e
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    async def _hedged(self, start: Callable[[], Awaitable], discard: Callable[[object], Awaitable]):
+        """Run start(), racing a second copy if the first is slower than hedge_delay"""
+        if self.hedge_delay is None:
+            return await start()
+
+        tasks = [asyncio.create_task(start())]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if not done:
+                self.stats["hedged"] += 1
+                tasks.append(asyncio.create_task(start()))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not tasks[0]:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for task in tasks:
+                if task is not winner and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+
+    async def complete(self, messages: List[Dict], max_tokens: Optional[int] = None) -> str:
+        max_tokens = max_tokens or self.max_tokens
+
+        async def discard(_):
+            pass
+
+        return await self._hedged(lambda: self._with_retries(lambda: self._post(messages, max_tokens)), discard)
+
+    async def stream(self, messages: List[Dict], max_tokens: Optional[int] = None) -> AsyncGenerator[str, None]:
+        max_tokens = max_tokens or self.max_tokens
+
+        async def discard(opened):
+            await opened[0].aclose()
+
+        events, first = await self._hedged(
+            lambda: self._with_retries(lambda: self._open_stream(messages, max_tokens)),
+            discard
+        )
+        try:
+            if first is None:
+                return
+            yield first
+            async for chunk in events:
+                yield chunk
+        finally:
+            await events.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class OpenAIProvider(HTTPProvider):
+    """OpenAI-compatible /chat/completions API (also served by the local mock provider)"""
+
+    name = "openai"
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _request(self, messages: List[Dict], max_tokens: int, stream: bool) -> Tuple[str, Dict]:
+        return f"{self.base_url}/chat/completions", {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": self.temperature,
+            "stream": stream
+        }
+
+    def _parse_chunk(self, data: Dict) -> str:
+        choices = data.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content") or ""
+
+    def _parse_completion(self, data: Dict) -> str:
+        return data["choices"][0]["message"]["content"] or ""
+
+class GeminiProvider(HTTPProvider):
+    """Google Gemini generateContent API"""
+
+    name = "gemini"
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-goog-api-key": self.api_key} if self.api_key else {}
+
+    def _request(self, messages: List[Dict], max_tokens: int, stream: bool) -> Tuple[str, Dict]:
+        system = "\n\n".join(msg["content"] for msg in messages if msg["role"] == "system")
+        body = {
+            "contents": [
+                {"role": "model" if msg["role"] == "assistant" else "user", "parts": [{"text": msg["content"]}]}
+                for msg in messages if msg["role"] != "system"
+            ],
+            "generationConfig": {"maxOutputTokens": max_tokens, "temperature": self.temperature}
+        }
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": system}]}
+        method = "streamGenerateContent?alt=sse" if stream else "generateContent"
+        return f"{self.base_url}/models/{self.model}:{method}", body
+
+    def _parse_chunk(self, data: Dict) -> str:
+        candidates = data.get("candidates") or [{}]
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts)
+
+    def _parse_completion(self, data: Dict) -> str:
+        return self._parse_chunk(data)
+
+PROVIDERS = {
+    "openai": (OpenAIProvider, "https://api.openai.com/v1"),
+    "gemini": (GeminiProvider, "https://generativelanguage.googleapis.com/v1beta"),
+}
+
+_providers: Dict[str, LLMProvider] = {}
+
+def get_llm_provider(name: Optional[str] = None) -> Optional[LLMProvider]:
+    """Return the shared provider for `name` (default LLM_PROVIDER), or None for the simulated model"""
+    name = name or settings.LLM_PROVIDER
+    if name == "simulated":
+        return None
+    if name not in _providers:
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown LLM provider: {name}")
+        provider_class, default_base_url = PROVIDERS[name]
+        _providers[name] = provider_class(
+            base_url=settings.LLM_BASE_URL or default_base_url,
+            model=settings.LLM_MODEL,
+            api_key=settings.OPENAI_API_KEY if name == "openai" else settings.GEMINI_API_KEY,
+            connect_timeout=settings.LLM_CONNECT_TIMEOUT,
+            read_timeout=settings.LLM_READ_TIMEOUT,
+            max_retries=settings.LLM_MAX_RETRIES,
+            retry_backoff=settings.LLM_RETRY_BACKOFF,
+            hedge_delay=settings.LLM_HEDGE_DELAY,
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_tokens=settings.LLM_MAX_TOKENS,
+            temperature=settings.LLM_TEMPERATURE
+        )
+    return _providers[name]
+
+async def close_llm_providers():
+    """Close every shared provider client"""
+    for provider in list(_providers.values()):
+        await provider.aclose()
+    _providers.clear()
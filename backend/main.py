@@ -1,11 +1,31 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi_socketio import SocketManager
 from contextlib import asynccontextmanager
 import socketio
 
-from .database import init_db, get_db
+from .database import init_db, close_db, get_db, engine, redis_pool, replica_router
+from .principal_cache import principal_cache
+from .password_hashing import password_hasher
+from .persistence import persistence
+from .generation_scheduler import generation_scheduler
+from .summarizer import summarizer
+from .search import message_search
+from .semantic_memory import semantic_index
+from .memory_lifecycle import memory_lifecycle
+from .reaper import conversation_reaper
+from .knowledge_graph import knowledge_graph
+from .llm_providers import close_llm_providers
+from .response_cache import response_cache
+from .metrics import (
+    CONTENT_TYPE_LATEST,
+    RequestMetricsMiddleware,
+    register_runtime_collector,
+    render_metrics,
+    redis_pool_stats,
+    sqlalchemy_pool_stats,
+)
 from .auth import router as auth_router
 from .conversations import router as conversations_router
 from .websocket import setup_socket_handlers
@@ -16,9 +36,28 @@ async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     # Startup
     await init_db()
+    await message_search.init_schema()
     print("Database initialized")
+    await replica_router.start()
+    await principal_cache.start()
+    await semantic_index.start()
+    await memory_lifecycle.start()
+    await conversation_reaper.start()
+    await knowledge_graph.start()
     yield
     # Shutdown
+    await generation_scheduler.stop()
+    await summarizer.stop()
+    await memory_lifecycle.stop()
+    await conversation_reaper.stop()
+    await knowledge_graph.stop()
+    await principal_cache.stop()
+    await semantic_index.stop()
+    await replica_router.stop()
+    password_hasher.shutdown()
+    await close_llm_providers()
+    await persistence.stop()
+    await close_db()
     print("Application shutting down")
 
 # Create FastAPI app with lifespan
@@ -38,14 +77,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize SocketIO
+# Request latency by route template
+app.add_middleware(RequestMetricsMiddleware)
+
+# Pool and scheduler gauges, read when /metrics is scraped
+register_runtime_collector({
+    "db_pool": sqlalchemy_pool_stats(engine),
+    "redis_pool": redis_pool_stats(redis_pool),
+    "generation": lambda: {"active": generation_scheduler.active, "queue_depth": generation_scheduler.queue_depth},
+    "response_cache": lambda: {"hit_rate": response_cache.hit_rate},
+    "memory_lifecycle": lambda: dict(memory_lifecycle.stats),
+    "reaper": lambda: dict(conversation_reaper.stats),
+    "replicas": replica_router.snapshot,
+    "knowledge_graph": lambda: {**knowledge_graph.stats, "pending": knowledge_graph.pending},
+})
+
+# Initialize SocketIO; with a message queue, emits reach sockets held by any worker or node
+socketio_options = {}
+if settings.SOCKETIO_MESSAGE_QUEUE:
+    socketio_options["client_manager"] = socketio.AsyncRedisManager(settings.SOCKETIO_MESSAGE_QUEUE)
+
 socket_manager = SocketManager(
     app=app,
-    cors_allowed_origins=["http://localhost:5173", "http://127.0.0.1:5173"]
+    cors_allowed_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
+    **socketio_options
 )
 
 # Setup WebSocket handlers
-setup_socket_handlers(socket_manager.get_socketio_manager())
+setup_socket_handlers(app.sio)
 
 # Include routers
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
@@ -57,4 +116,8 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(render_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST})
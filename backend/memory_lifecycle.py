@@ -0,0 +1,277 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from sqlalchemy import select, update, delete, func, and_
+
+from .database import AsyncSessionLocal, UserMemory, MemoryEmbedding, redis_client
+from .context_cache import context_cache
+from .semantic_memory import Embedder, semantic_index
+from .response_cache import normalize_message
+from .config import settings
+
+LOCK_KEY = "memory_lifecycle:lock"
+SINCE_KEY = "memory_lifecycle:since"  # start of the last completed sweep, shared by all workers
+MAX_IMPORTANCE = 10
+
+class MemoryLifecycle:
+    """Background maintenance of long-term UserMemory rows
+
+    Each sweep deletes expired memories, decays the importance of
+    memories that haven't been reinforced for `decay_interval`, merges
+    near-duplicates (the survivor is reinforced) and trims each user to
+    `max_per_user` memories. Every statement touches at most `chunk_size`
+    rows in its own short transaction, and only users with memories
+    created since the previous sweep are deduplicated and capped. A Redis
+    lock lets one worker sweep per interval.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        embedder: Optional[Embedder] = None,
+        interval: float = 300.0,
+        chunk_size: int = 500,
+        decay_interval: timedelta = timedelta(days=7),
+        min_importance: int = 1,
+        duplicate_threshold: float = 0.9,
+        max_per_user: int = 200
+    ):
+        self.session_factory = session_factory
+        self.embedder = embedder or semantic_index.embedder
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.decay_interval = decay_interval
+        self.min_importance = min_importance
+        self.duplicate_threshold = duplicate_threshold
+        self.max_per_user = max_per_user
+        self.stats = {"sweeps": 0, "expired": 0, "decayed": 0, "merged": 0, "capped": 0, "failures": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                if await redis_client.set(LOCK_KEY, str(uuid.uuid4()), nx=True, ex=max(int(self.interval), 1)):
+                    await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"Memory lifecycle sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self) -> Dict[str, int]:
+        """Run one full maintenance pass; returns the rows changed per step"""
+        started = datetime.utcnow()
+        touched: Dict[str, Set[str]] = {}
+        changed = {
+            "expired": await self.delete_expired(started, touched),
+            "decayed": await self.decay(started, touched),
+        }
+        since = await redis_client.get(SINCE_KEY)
+        merged = capped = 0
+        for user_id in await self._users_with_new_memories(datetime.fromisoformat(since) if since else None):
+            user_merged, user_capped = await self.compact_user(user_id, touched)
+            merged += user_merged
+            capped += user_capped
+        changed.update(merged=merged, capped=capped)
+        await redis_client.set(SINCE_KEY, started.isoformat())
+
+        for user_id, deleted in touched.items():
+            await semantic_index.remove_memories(user_id, deleted)
+            await context_cache.invalidate_user(user_id)
+        self.stats["sweeps"] += 1
+        for step, count in changed.items():
+            self.stats[step] += count
+        return changed
+
+    async def _delete_chunk(self, db, memory_ids: List[uuid.UUID]):
+        # Embeddings first: SQLite doesn't enforce the ON DELETE CASCADE by default
+        await db.execute(delete(MemoryEmbedding).where(MemoryEmbedding.memory_id.in_(memory_ids)))
+        await db.execute(delete(UserMemory).where(UserMemory.id.in_(memory_ids)))
+
+    async def _delete(self, memory_ids: List[uuid.UUID]):
+        for start in range(0, len(memory_ids), self.chunk_size):
+            async with self.session_factory() as db:
+                await self._delete_chunk(db, memory_ids[start:start + self.chunk_size])
+                await db.commit()
+
+    async def delete_expired(self, now: datetime, touched: Dict[str, Set[str]]) -> int:
+        deleted = 0
+        while True:
+            async with self.session_factory() as db:
+                rows = (await db.execute(
+                    select(UserMemory.id, UserMemory.user_id)
+                    .where(UserMemory.expires_at <= now)
+                    .limit(self.chunk_size)
+                )).all()
+                if not rows:
+                    return deleted
+                await self._delete_chunk(db, [row.id for row in rows])
+                await db.commit()
+            for row in rows:
+                touched.setdefault(str(row.user_id), set()).add(str(row.id))
+            deleted += len(rows)
+
+    async def decay(self, now: datetime, touched: Dict[str, Set[str]]) -> int:
+        """Lower importance by one point per decay interval without reinforcement"""
+        cutoff = now - self.decay_interval
+        decayed = 0
+        while True:
+            async with self.session_factory() as db:
+                rows = (await db.execute(
+                    select(UserMemory.id, UserMemory.user_id).where(
+                        UserMemory.memory_type == "long_term",
+                        UserMemory.importance_score > self.min_importance,
+                        func.coalesce(UserMemory.decayed_at, UserMemory.created_at) < cutoff
+                    ).limit(self.chunk_size)
+                )).all()
+                if not rows:
+                    return decayed
+                await db.execute(
+                    update(UserMemory)
+                    .where(UserMemory.id.in_([row.id for row in rows]))
+                    .values(importance_score=UserMemory.importance_score - 1, decayed_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            for row in rows:
+                touched.setdefault(str(row.user_id), set())
+            decayed += len(rows)
+
+    async def _users_with_new_memories(self, since: Optional[datetime]) -> List[str]:
+        query = select(UserMemory.user_id).where(UserMemory.memory_type == "long_term").distinct()
+        if since is not None:
+            query = query.where(UserMemory.created_at >= since)
+        async with self.session_factory() as db:
+            return [str(user_id) for user_id in (await db.execute(query)).scalars().all()]
+
+    async def _load_for_compaction(self, user_id: str):
+        """Read a user's long-term memories with their stored vectors, chunk by chunk"""
+        memories: List[UserMemory] = []
+        vectors: List[Optional[bytes]] = []
+        query = select(UserMemory, MemoryEmbedding.vector).outerjoin(
+            MemoryEmbedding,
+            and_(MemoryEmbedding.memory_id == UserMemory.id, MemoryEmbedding.model == self.embedder.name)
+        ).where(
+            UserMemory.user_id == uuid.UUID(user_id),
+            UserMemory.memory_type == "long_term"
+        ).order_by(UserMemory.importance_score.desc(), UserMemory.created_at.desc(), UserMemory.id)
+        async with self.session_factory() as db:
+            while True:
+                rows = (await db.execute(query.offset(len(memories)).limit(self.chunk_size))).all()
+                for memory, vector in rows:
+                    memories.append(memory)
+                    vectors.append(vector)
+                if len(rows) < self.chunk_size:
+                    return memories, vectors
+
+    def _plan_merges(self, texts: List[str], stored: List[Optional[bytes]]):
+        """Greedy duplicate detection; CPU-bound, so it runs in an executor
+
+        Each memory merges into the best-ranked kept memory it duplicates.
+        Candidates are scored against the memories kept before their chunk
+        with one matrix product, then against those kept within it.
+        """
+        vectors = np.zeros((len(texts), self.embedder.dim), dtype=np.float32)
+        missing = [index for index, vector in enumerate(stored) if vector is None]
+        for index, vector in enumerate(stored):
+            if vector is not None:
+                vectors[index] = np.frombuffer(vector, dtype=np.float32)
+        if missing:
+            # Not backfilled by the semantic index yet
+            vectors[missing] = self.embedder.embed([texts[index] for index in missing])
+
+        kept: List[int] = []
+        kept_vectors = np.zeros_like(vectors)
+        kept_text: Dict[str, int] = {}
+        merged_into: Dict[int, List[int]] = {}
+        for start in range(0, len(texts), self.chunk_size):
+            prior = len(kept)
+            block_scores = vectors[start:start + self.chunk_size] @ kept_vectors[:prior].T
+            for offset, scores in enumerate(block_scores):
+                index = start + offset
+                text = normalize_message(texts[index])
+                target = kept_text.get(text)
+                if target is None and kept:
+                    best, best_score = None, -np.inf
+                    if prior:
+                        column = int(np.argmax(scores))
+                        best, best_score = kept[column], scores[column]
+                    if len(kept) > prior:
+                        recent = kept_vectors[prior:len(kept)] @ vectors[index]
+                        column = int(np.argmax(recent))
+                        if recent[column] > best_score:
+                            best, best_score = kept[prior + column], recent[column]
+                    if best_score >= self.duplicate_threshold:
+                        target = best
+                if target is None:
+                    kept_vectors[len(kept)] = vectors[index]
+                    kept.append(index)
+                    kept_text.setdefault(text, index)
+                else:
+                    merged_into.setdefault(target, []).append(index)
+        return kept, merged_into
+
+    async def compact_user(self, user_id: str, touched: Dict[str, Set[str]]):
+        """Merge one user's near-duplicate memories and enforce the cap; returns (merged, capped)"""
+        memories, stored = await self._load_for_compaction(user_id)
+        if not memories:
+            return 0, 0
+
+        # Reuses the vectors in memory_embeddings; the quadratic pass stays off the event loop
+        kept, merged_into = await asyncio.get_running_loop().run_in_executor(
+            None, self._plan_merges, [memory.content for memory in memories], stored
+        )
+
+        dropped = set(kept[self.max_per_user:])
+        duplicates = [memories[i].id for sources in merged_into.values() for i in sources]
+        over_cap = [memories[i].id for i in sorted(dropped)]
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            for target, sources in merged_into.items():
+                if target in dropped:
+                    continue
+                survivor = memories[target]
+                metadata = dict(survivor.memory_metadata or {})
+                metadata["merged_count"] = metadata.get("merged_count", 0) + len(sources)
+                await db.execute(
+                    update(UserMemory).where(UserMemory.id == survivor.id).values(
+                        importance_score=min(
+                            MAX_IMPORTANCE,
+                            max(memories[i].importance_score for i in [target] + sources) + 1
+                        ),
+                        decayed_at=now,
+                        memory_metadata=metadata
+                    ).execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        await self._delete(duplicates + over_cap)
+
+        if duplicates or over_cap or merged_into:
+            touched.setdefault(user_id, set()).update(str(memory_id) for memory_id in duplicates + over_cap)
+        return len(duplicates), len(over_cap)
+
+memory_lifecycle = MemoryLifecycle(
+    interval=settings.MEMORY_LIFECYCLE_INTERVAL,
+    chunk_size=settings.MEMORY_LIFECYCLE_CHUNK,
+    decay_interval=timedelta(days=settings.MEMORY_DECAY_INTERVAL_DAYS),
+    min_importance=settings.MEMORY_MIN_IMPORTANCE,
+    duplicate_threshold=settings.MEMORY_DUPLICATE_THRESHOLD,
+    max_per_user=settings.MEMORY_MAX_PER_USER
+)
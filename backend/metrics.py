@@ -0,0 +1,151 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Seconds; spans cache hits (sub-millisecond) to slow model generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+TURN_STAGE_SECONDS = Histogram(
+    "chat_turn_stage_seconds",
+    "Time spent in each stage of a chat turn",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+TURN_SECONDS = Histogram(
+    "chat_turn_seconds",
+    "Time from receiving send_message to emitting message_complete",
+    buckets=LATENCY_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "chat_time_to_first_token_seconds",
+    "Time from starting generation to the first streamed chunk",
+    buckets=LATENCY_BUCKETS,
+)
+TURN_ERRORS = Counter("chat_turn_errors_total", "Chat turns that failed or were shed", ["reason"])
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "REST request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+SOCKETS_CONNECTED = Gauge(
+    "socketio_connected_sockets",
+    "Socket.IO connections held by this worker",
+    multiprocess_mode="livesum",
+)
+
+@contextmanager
+def observe_stage(stage: str):
+    """Record the duration of a block as one chat turn stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        TURN_STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording REST latency by route template
+
+    Labels use the matched route's path (not the raw URL) so ids don't
+    explode the label set. Plain ASGI rather than BaseHTTPMiddleware,
+    which doesn't stream and misbehaves with slow keep-alive requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route in the shared scope
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code)
+            ).observe(time.perf_counter() - started)
+
+class RuntimeCollector:
+    """Gauges read at scrape time from pools and in-process components
+
+    Each source is a callable returning {metric suffix: value}; they are
+    exported as `app_<source>_<suffix>`.
+    """
+
+    def __init__(self, sources: Dict[str, Callable[[], Dict[str, float]]]):
+        self.sources = sources
+
+    def collect(self) -> Iterable[GaugeMetricFamily]:
+        for source, read in self.sources.items():
+            try:
+                values = read()
+            except Exception as e:
+                print(f"Metrics source {source} failed: {e}")
+                continue
+            for name, value in values.items():
+                if value is not None:
+                    yield GaugeMetricFamily(f"app_{source}_{name}", f"{source} {name.replace('_', ' ')}", value=value)
+
+def sqlalchemy_pool_stats(engine) -> Callable[[], Dict[str, float]]:
+    def read():
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            return {}
+        return {
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "size": pool.size(),
+            "overflow": pool.overflow(),
+        }
+    return read
+
+def redis_pool_stats(pool) -> Callable[[], Dict[str, float]]:
+    def read():
+        return {
+            "in_use": len(getattr(pool, "_in_use_connections", ())),
+            "available": len(getattr(pool, "_available_connections", ())),
+            "max": pool.max_connections,
+        }
+    return read
+
+def register_runtime_collector(sources: Dict[str, Callable[[], Dict[str, float]]]):
+    REGISTRY.register(RuntimeCollector(sources))
+
+def render_metrics() -> bytes:
+    """Prometheus text exposition, aggregated across workers in multiprocess mode"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in list(REGISTRY._collector_to_names):
+            if isinstance(collector, RuntimeCollector):
+                registry.register(collector)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
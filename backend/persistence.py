@@ -0,0 +1,186 @@
+import asyncio
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import inspect, insert, update
+
+from .database import AsyncSessionLocal, Base, Conversation
+from .config import settings
+
+DURABILITY_FLUSH = "flush"  # acknowledge once the group commit has completed
+DURABILITY_ENQUEUE = "enqueue"  # acknowledge as soon as the write is queued
+
+class WriteBatch:
+    """Rows and conversation counter updates that must be committed together"""
+
+    def __init__(self):
+        self.rows: Dict[type, List[Dict]] = {}
+        self.conversation_updates: Dict[str, Dict] = {}
+
+    def add(self, obj: Base):
+        """Queue an ORM instance for insertion; its primary key must be set client-side"""
+        values = {
+            attr.key: getattr(obj, attr.key)
+            for attr in inspect(type(obj)).column_attrs
+            if getattr(obj, attr.key) is not None
+        }
+        self.rows.setdefault(type(obj), []).append(values)
+
+    def update_conversation(self, conversation_id, message_delta: int = 0, **values):
+        """Atomically bump message_count and set other columns on a conversation"""
+        pending = self.conversation_updates.setdefault(str(conversation_id), {"message_delta": 0, "values": {}})
+        pending["message_delta"] += message_delta
+        pending["values"].update(values)
+
+    def merge(self, other: "WriteBatch"):
+        for model, rows in other.rows.items():
+            self.rows.setdefault(model, []).extend(rows)
+        for conversation_id, pending in other.conversation_updates.items():
+            self.update_conversation(conversation_id, pending["message_delta"], **pending["values"])
+
+    def __bool__(self) -> bool:
+        return bool(self.rows or self.conversation_updates)
+
+class PersistencePipeline:
+    """Write-behind group commit for chat persistence
+
+    Batches submitted by concurrent turns are merged and written in one
+    transaction: one executemany INSERT per table and one atomic
+    'message_count = message_count + n' UPDATE per conversation. A group
+    is flushed when it reaches `max_batch` rows or `max_delay` seconds
+    after its first write, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_batch: int = 500,
+        max_delay: float = 0.005,
+        durability: str = DURABILITY_FLUSH
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.durability = durability
+        self.stats = {"batches": 0, "commits": 0, "rows": 0, "failures": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        if self._worker is None or self._worker.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    def submit(self, batch: WriteBatch) -> asyncio.Future:
+        """Queue a batch; the returned future resolves once it is committed"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        if not batch:
+            future.set_result(None)
+            return future
+        self.stats["batches"] += 1
+        self._queue.put_nowait((batch, future))
+        return future
+
+    async def write(self, batch: WriteBatch, durability: Optional[str] = None):
+        """Submit a batch and wait according to the durability mode"""
+        await self.wait(self.submit(batch), durability)
+
+    async def wait(self, future: asyncio.Future, durability: Optional[str] = None):
+        """Wait for a submitted batch unless running in enqueue durability"""
+        if (durability or self.durability) == DURABILITY_ENQUEUE:
+            future.add_done_callback(self._log_failure)
+            return
+        await future
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Write-behind persistence failed: {future.exception()}")
+
+    async def _collect(self) -> Optional[List[Tuple[WriteBatch, asyncio.Future]]]:
+        first = await self._queue.get()
+        if first is None:
+            return None
+        items = [first]
+        rows = sum(len(r) for r in first[0].rows.values())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while rows < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                self._queue.put_nowait(None)
+                break
+            items.append(item)
+            rows += sum(len(r) for r in item[0].rows.values())
+        return items
+
+    async def _run(self):
+        while True:
+            items = await self._collect()
+            if items is None:
+                return
+            await self._commit_group(items)
+
+    async def _commit_group(self, items: List[Tuple[WriteBatch, asyncio.Future]]):
+        merged = WriteBatch()
+        for batch, _ in items:
+            merged.merge(batch)
+        try:
+            await self._apply(merged)
+        except Exception as e:
+            if len(items) == 1:
+                self.stats["failures"] += 1
+                if not items[0][1].done():
+                    items[0][1].set_exception(e)
+                return
+            # Retry one by one so a single bad batch doesn't fail the group
+            for item in items:
+                await self._commit_group([item])
+            return
+        for _, future in items:
+            if not future.done():
+                future.set_result(None)
+
+    async def _apply(self, batch: WriteBatch):
+        """Write a merged batch in a single transaction"""
+        async with self.session_factory() as session:
+            async with session.begin():
+                # Insert parents before children
+                for table in Base.metadata.sorted_tables:
+                    for model, rows in batch.rows.items():
+                        if model.__table__ is table and rows:
+                            await session.execute(insert(model), rows)
+                # Fixed order keeps concurrent group commits from deadlocking
+                for conversation_id in sorted(batch.conversation_updates):
+                    pending = batch.conversation_updates[conversation_id]
+                    values = dict(pending["values"])
+                    if pending["message_delta"]:
+                        values["message_count"] = Conversation.message_count + pending["message_delta"]
+                    if values:
+                        await session.execute(
+                            update(Conversation).where(
+                                Conversation.id == uuid.UUID(conversation_id)
+                            ).values(**values)
+                        )
+        self.stats["commits"] += 1
+        self.stats["rows"] += sum(len(rows) for rows in batch.rows.values())
+
+    async def stop(self):
+        """Flush everything queued so far and stop the worker"""
+        if self._worker is not None and not self._worker.done():
+            self._queue.put_nowait(None)
+            await self._worker
+        self._worker = None
+
+persistence = PersistencePipeline(
+    max_batch=settings.PERSISTENCE_MAX_BATCH,
+    max_delay=settings.PERSISTENCE_MAX_DELAY_MS / 1000,
+    durability=settings.PERSISTENCE_DURABILITY
+)
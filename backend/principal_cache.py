@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .database import User, redis_client, replica_router
+from .context_cache import context_cache
+from .config import settings
+
+INVALIDATION_CHANNEL = "principal:invalidate"
+
+_pending_invalidations: Set[asyncio.Task] = set()
+
+class PrincipalCache:
+    """TTL/LRU cache of authenticated users keyed by a digest of their token
+
+    Entries expire with the token or after `ttl` seconds, whichever comes
+    first. Changes to a user are broadcast over Redis pub/sub so every
+    worker drops that user's entries.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # digest -> (user, expires_at)
+        self._by_email: Dict[str, Set[str]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[User]:
+        digest = self._digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if expires_at <= time.time():
+            self._discard(digest)
+            return None
+        self._entries.move_to_end(digest)
+        return user
+
+    def put(self, token: str, user: User, token_expires_at: Optional[float] = None):
+        """Cache a detached user for this token"""
+        digest = self._digest(token)
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        self._discard(digest)
+        self._entries[digest] = (user, expires_at)
+        self._by_email.setdefault(user.email, set()).add(digest)
+        while len(self._entries) > self.max_entries:
+            oldest, _ = next(iter(self._entries.items()))
+            self._discard(oldest)
+
+    def _discard(self, digest: str):
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            digests = self._by_email.get(entry[0].email)
+            if digests is not None:
+                digests.discard(digest)
+                if not digests:
+                    del self._by_email[entry[0].email]
+
+    def drop_local(self, emails: Iterable[str]):
+        for email in emails:
+            for digest in list(self._by_email.get(email, ())):
+                self._discard(digest)
+
+    async def invalidate(self, emails: Iterable[str]):
+        """Drop cached principals for these users on every worker"""
+        emails = list(emails)
+        if not emails:
+            return
+        self.drop_local(emails)
+        await redis_client.publish(INVALIDATION_CHANNEL, json.dumps(emails))
+
+    async def _listen(self):
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.drop_local(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Entries may have gone stale while disconnected
+                print(f"Principal cache listener error: {e}")
+                self._entries.clear()
+                self._by_email.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def start(self):
+        """Start listening for invalidations from other workers"""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+principal_cache = PrincipalCache(
+    max_entries=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL
+)
+
+# Invalidate automatically whenever a User row is changed or deleted through the ORM
+# (bulk UPDATE statements bypass this and must call invalidate_user_caches)
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault("changed_users", {"emails": set(), "ids": set()})
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            history = inspect(obj).attrs.email.history
+            changed["emails"].update(email for email in (history.deleted or ()) if email)
+            changed["emails"].add(obj.email)
+            changed["ids"].add(str(obj.id))
+
+@event.listens_for(Session, "after_commit")
+def _publish_changed_users(session):
+    changed = session.info.pop("changed_users", None)
+    if changed and changed["emails"]:
+        task = asyncio.get_running_loop().create_task(
+            invalidate_user_caches(changed["emails"], changed["ids"])
+        )
+        _pending_invalidations.add(task)
+        task.add_done_callback(_pending_invalidations.discard)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_users", None)
+
+async def invalidate_user_caches(emails: Iterable[str], user_ids: Iterable[str]):
+    """Drop cached principals and context snapshots for changed users"""
+    emails, user_ids = list(emails), list(user_ids)
+    # Reloads must not come from a replica that hasn't seen the change yet
+    await replica_router.mark_write(*emails, *user_ids)
+    await principal_cache.invalidate(emails)
+    for user_id in user_ids:
+        await context_cache.invalidate_user(user_id)
@@ -0,0 +1,130 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .tokenizer import count_tokens
+from .config import settings
+
+MESSAGE_OVERHEAD = 4  # role and separator tokens per chat message
+
+class PromptSection:
+    """Candidate items for one part of the prompt, best first
+
+    Each item is a dict with "content" and optionally a precomputed
+    "tokens" count. Contiguous sections (history, summary) stop at the
+    first item that doesn't fit so they never have gaps; other sections
+    skip it and try smaller ones.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        items: Sequence[Dict],
+        header: Optional[str] = None,
+        contiguous: bool = False,
+        max_tokens: Optional[int] = None,
+        item_overhead: int = 1
+    ):
+        self.name = name
+        self.items = list(items)
+        self.header = header
+        self.contiguous = contiguous
+        self.max_tokens = max_tokens
+        self.item_overhead = item_overhead
+
+class PackedPrompt:
+    """Chat messages for the provider plus the tokens each section used"""
+
+    def __init__(self, messages: List[Dict], usage: Dict[str, int], dropped: Dict[str, int], budget: int):
+        self.messages = messages
+        self.usage = usage
+        self.dropped = dropped
+        self.budget = budget
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.usage.values())
+
+    def report(self) -> Dict:
+        return {"budget": self.budget, "total": self.total_tokens, "sections": self.usage, "dropped": self.dropped}
+
+class PromptPacker:
+    """Packs prompt sections by priority into a token budget
+
+    Instructions and the current user message are always included; the
+    remaining budget is handed to the optional sections in priority
+    order, each limited by its own cap.
+    """
+
+    def __init__(self, budget: int = 3000, priority: Sequence[str] = (), section_caps: Optional[Dict[str, int]] = None):
+        self.budget = budget
+        self.priority = list(priority)
+        self.section_caps = dict(section_caps or {})
+
+    @staticmethod
+    def _tokens(item: Dict) -> int:
+        tokens = item.get("tokens")
+        return tokens if tokens is not None else count_tokens(item["content"])
+
+    def _select(self, section: PromptSection, remaining: int) -> Tuple[List[Dict], int]:
+        cap = section.max_tokens if section.max_tokens is not None else self.section_caps.get(section.name)
+        available = remaining if cap is None else min(remaining, cap)
+        used = count_tokens(section.header) + 1 if section.header else 0
+        chosen = []
+        for item in section.items:
+            cost = self._tokens(item) + section.item_overhead
+            if used + cost > available:
+                if section.contiguous:
+                    break
+                continue
+            chosen.append(item)
+            used += cost
+        return chosen, (used if chosen else 0)
+
+    def pack(self, instructions: Sequence[str], user_message: Dict, sections: Sequence[PromptSection]) -> PackedPrompt:
+        """Return the packed chat messages; history items are expected newest first"""
+        instruction_text = "\n".join(instructions)
+        usage = {
+            "instructions": count_tokens(instruction_text) + MESSAGE_OVERHEAD,
+            "user_message": self._tokens(user_message) + MESSAGE_OVERHEAD
+        }
+        remaining = self.budget - usage["instructions"] - usage["user_message"]
+
+        by_name = {section.name: section for section in sections}
+        order = [name for name in self.priority if name in by_name]
+        order += [section.name for section in sections if section.name not in order]
+
+        selected: Dict[str, List[Dict]] = {}
+        dropped: Dict[str, int] = {}
+        for name in order:
+            section = by_name[name]
+            chosen, used = self._select(section, max(remaining, 0))
+            selected[name] = chosen
+            usage[name] = used
+            remaining -= used
+            if len(chosen) < len(section.items):
+                dropped[name] = len(section.items) - len(chosen)
+
+        # Render: context sections go into the system message, history as chat turns
+        system = [instruction_text]
+        for section in sections:
+            if section.name == "history" or not selected[section.name]:
+                continue
+            items = selected[section.name]
+            if section.contiguous:
+                items = list(reversed(items))  # contiguous sections are packed newest first
+            lines = [section.header] if section.header else []
+            lines.extend(item["content"] for item in items)
+            system.append("\n".join(lines))
+
+        messages = [{"role": "system", "content": "\n\n".join(system)}]
+        messages.extend(
+            {"role": item["role"], "content": item["content"]}
+            for item in reversed(selected.get("history", []))
+        )
+        messages.append({"role": "user", "content": user_message["content"]})
+        return PackedPrompt(messages, usage, dropped, self.budget)
+
+prompt_packer = PromptPacker(
+    budget=settings.PROMPT_TOKEN_BUDGET,
+    priority=settings.PROMPT_SECTION_PRIORITY,
+    section_caps=settings.PROMPT_SECTION_MAX_TOKENS
+)
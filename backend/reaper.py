@@ -0,0 +1,149 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, delete
+
+from .database import AsyncSessionLocal, Conversation, Message, UserMemory, MemoryEmbedding, redis_client
+from .context_cache import context_cache
+from .semantic_memory import semantic_index
+from .config import settings
+
+class ConversationReaper:
+    """Deletes soft-deleted conversations in the background
+
+    Deleting a conversation only stamps `deleted_at`, which hides it from
+    every read path at once. The reaper then removes its messages, and
+    the long-term memories whose metadata points at it, `batch_size`
+    rows per transaction with `batch_delay` seconds between batches, and
+    finally the conversation row itself. Progress is kept in `progress`
+    (per conversation) and `stats`. A Redis lock per conversation keeps
+    workers from reaping the same one twice.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        interval: float = 30.0,
+        batch_size: int = 1000,
+        batch_delay: float = 0.05
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.stats = {"pending": 0, "reaped": 0, "messages": 0, "memories": 0, "failures": 0}
+        self.progress: Dict[str, Dict] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Start reaping now instead of at the next interval"""
+        self._wake.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.reap_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"Conversation reaper failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def reap_pending(self):
+        """Reap every soft-deleted conversation, oldest deletion first"""
+        async with self.session_factory() as db:
+            pending = (await db.execute(
+                select(Conversation.id, Conversation.user_id)
+                .where(Conversation.deleted_at.is_not(None))
+                .order_by(Conversation.deleted_at)
+            )).all()
+        self.stats["pending"] = len(pending)
+        for conversation_id, user_id in pending:
+            lock = f"reaper:lock:{conversation_id}"
+            if not await redis_client.set(lock, 1, nx=True, ex=300):
+                continue
+            try:
+                await self.reap(conversation_id, user_id)
+            finally:
+                await redis_client.delete(lock)
+            self.stats["pending"] -= 1
+
+    async def reap(self, conversation_id: uuid.UUID, user_id: uuid.UUID):
+        key = str(conversation_id)
+        progress = self.progress[key] = {"messages": 0, "memories": 0, "started_at": datetime.utcnow().isoformat()}
+        started = time.monotonic()
+
+        # Memories first: they are found through the conversation id in their metadata
+        deleted_memories: List[str] = []
+        while True:
+            async with self.session_factory() as db:
+                ids = (await db.execute(
+                    select(UserMemory.id).where(
+                        UserMemory.user_id == user_id,
+                        UserMemory.memory_metadata["conversation_id"].as_string() == key
+                    ).limit(self.batch_size)
+                )).scalars().all()
+                if not ids:
+                    break
+                await db.execute(delete(MemoryEmbedding).where(MemoryEmbedding.memory_id.in_(ids)))
+                await db.execute(delete(UserMemory).where(UserMemory.id.in_(ids)))
+                await db.commit()
+            deleted_memories.extend(str(memory_id) for memory_id in ids)
+            progress["memories"] += len(ids)
+            await asyncio.sleep(self.batch_delay)
+
+        while True:
+            async with self.session_factory() as db:
+                ids = (await db.execute(
+                    select(Message.id).where(Message.conversation_id == conversation_id).limit(self.batch_size)
+                )).scalars().all()
+                if ids:
+                    await db.execute(delete(Message).where(Message.id.in_(ids)))
+                else:
+                    # Nothing left; removing the row in the same transaction as the check
+                    await db.execute(delete(Conversation).where(Conversation.id == conversation_id))
+                await db.commit()
+            if not ids:
+                break
+            progress["messages"] += len(ids)
+            await asyncio.sleep(self.batch_delay)
+
+        if deleted_memories:
+            await semantic_index.remove_memories(str(user_id), deleted_memories)
+            await context_cache.invalidate_user(str(user_id))
+        self.stats["reaped"] += 1
+        self.stats["messages"] += progress["messages"]
+        self.stats["memories"] += progress["memories"]
+        del self.progress[key]
+        print(
+            f"Reaped conversation {key}: {progress['messages']} messages, "
+            f"{progress['memories']} memories in {time.monotonic() - started:.1f}s"
+        )
+
+conversation_reaper = ConversationReaper(
+    interval=settings.REAPER_INTERVAL,
+    batch_size=settings.REAPER_BATCH_SIZE,
+    batch_delay=settings.REAPER_BATCH_DELAY
+)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+from .database import redis_client
+from .semantic_memory import Embedder, VectorStore, semantic_index
+from .config import settings
+
+_punctuation = re.compile(r"[^\w\s']+")
+_whitespace = re.compile(r"\s+")
+
+def normalize_message(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _whitespace.sub(" ", _punctuation.sub(" ", text.lower())).strip()
+
+class ResponseCacheKey:
+    """Where a reply would be cached: the normalized message within a context bucket"""
+
+    def __init__(self, message: str, bucket: str):
+        self.message = message
+        self.bucket = bucket
+        self.digest = hashlib.sha256(f"{bucket}\x00{message}".encode()).hexdigest()
+
+class ResponseCache:
+    """Cache of generated replies to short, context-independent messages
+
+    Replies are keyed by the normalized message plus a bucket made of the
+    user, the model, the preference fields that shape the reply and a
+    fingerprint of the conversation context (topics, rolling summary and
+    the ids of the recent messages in the prompt). The prompt carries the
+    user's name, memories and history, so replies are never shared between
+    users or reused once the conversation has moved on. The exact tier is
+    an in-process TTL/LRU in front of Redis (shared by all workers). The optional similarity tier
+    embeds the message and reuses the reply of the nearest cached message
+    in the same bucket when its cosine similarity reaches the threshold.
+    """
+
+    PREFERENCE_FIELDS = ("communication_style", "response_length")
+    SKIP_INTENTS = {"memory_retrieval"}  # replies depend on the user's memories
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        max_entries: int = 5000,
+        ttl: int = 3600,
+        max_message_length: int = 200,
+        similarity_threshold: Optional[float] = None,
+        enabled: bool = True
+    ):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_message_length = max_message_length
+        self.similarity_threshold = similarity_threshold
+        self.enabled = enabled
+        self.stats = {"lookups": 0, "exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0, "skipped": 0, "evictions": 0}
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()  # digest -> (reply, expires_at, key)
+        self._buckets: Dict[str, VectorStore] = {}
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.stats["exact_hits"] + self.stats["similar_hits"]
+        return hits / self.stats["lookups"] if self.stats["lookups"] else 0.0
+
+    @staticmethod
+    def _redis_key(digest: str) -> str:
+        return f"resp:{digest}"
+
+    def key_for(
+        self,
+        user_id: str,
+        user_message: str,
+        context: Dict,
+        preferences: Dict,
+        model: str,
+        intent: str,
+        recent_message_ids: Sequence[str]
+    ) -> Optional[ResponseCacheKey]:
+        """Return the cache key for this turn, or None if it must not be cached"""
+        if not self.enabled or preferences.get("response_cache") is False:
+            return None
+        message = normalize_message(user_message)
+        if not message or len(message) > self.max_message_length or intent in self.SKIP_INTENTS:
+            self.stats["skipped"] += 1
+            return None
+        fingerprint = {
+            "user": str(user_id),
+            "model": model,
+            "preferences": {field: preferences.get(field) for field in self.PREFERENCE_FIELDS},
+            "topics": sorted(context["conversation_context"]["topics"] or []),
+            "summary": context["conversation_context"].get("summary"),
+            "recent": [str(message_id) for message_id in recent_message_ids]
+        }
+        bucket = hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:32]
+        return ResponseCacheKey(message, bucket)
+
+    def _remember(self, key: ResponseCacheKey, reply: str, expires_at: float):
+        self._local[key.digest] = (reply, expires_at, key)
+        self._local.move_to_end(key.digest)
+        while len(self._local) > self.max_entries:
+            _, (_, _, evicted) = self._local.popitem(last=False)
+            self._forget_vector(evicted)
+            self.stats["evictions"] += 1
+
+    def _forget_vector(self, key: ResponseCacheKey):
+        store = self._buckets.get(key.bucket)
+        if store is not None:
+            store.remove([key.digest])
+            if not len(store):
+                del self._buckets[key.bucket]
+
+    async def _get_exact(self, digest: str) -> Optional[str]:
+        entry = self._local.get(digest)
+        if entry is not None:
+            reply, expires_at, key = entry
+            if expires_at > time.time():
+                self._local.move_to_end(digest)
+                return reply
+            del self._local[digest]
+            self._forget_vector(key)
+        return await redis_client.get(self._redis_key(digest))
+
+    async def get(self, key: ResponseCacheKey) -> Optional[str]:
+        """Return a cached reply for this key (exact, then similar), if any"""
+        self.stats["lookups"] += 1
+        reply = await self._get_exact(key.digest)
+        if reply is not None:
+            self._remember(key, reply, time.time() + self.ttl)
+            self.stats["exact_hits"] += 1
+            return reply
+
+        store = self._buckets.get(key.bucket)
+        if self.similarity_threshold is not None and store is not None:
+            matches = store.search(self.embedder.embed([key.message])[0], k=1)
+            if matches and matches[0][1] >= self.similarity_threshold:
+                reply = await self._get_exact(matches[0][0])
+                if reply is not None:
+                    self.stats["similar_hits"] += 1
+                    return reply
+                self._forget_vector(matches[0][2]["key"])
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: ResponseCacheKey, reply: str):
+        """Cache a generated reply"""
+        if not reply:
+            return
+        self._remember(key, reply, time.time() + self.ttl)
+        if self.similarity_threshold is not None:
+            store = self._buckets.get(key.bucket)
+            if store is None:
+                store = self._buckets[key.bucket] = VectorStore(self.embedder.dim)
+            store.add([key.digest], self.embedder.embed([key.message]), [{"key": key}])
+        await redis_client.setex(self._redis_key(key.digest), self.ttl, reply)
+        self.stats["stores"] += 1
+
+    def clear(self):
+        self._local.clear()
+        self._buckets.clear()
+
+response_cache = ResponseCache(
+    semantic_index.embedder,
+    max_entries=settings.RESPONSE_CACHE_SIZE,
+    ttl=settings.RESPONSE_CACHE_TTL,
+    max_message_length=settings.RESPONSE_CACHE_MAX_MESSAGE_LENGTH,
+    similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+    enabled=settings.RESPONSE_CACHE_ENABLED
+)
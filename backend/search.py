@@ -0,0 +1,272 @@
+import html
+import re
+import uuid
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, and_, func, literal_column, table, column
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import engine, Conversation, Message
+from .config import settings
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# The database marks matches with control characters so the text can be escaped before the tags go in
+_MATCH_START = "\x02"
+_MATCH_END = "\x03"
+MIN_TRIGRAM_TERM = 3  # FTS5's trigram tokenizer can't match shorter terms
+
+_term_pattern = re.compile(r'"([^"]+)"|(\S+)')
+
+def parse_terms(query: str) -> List[str]:
+    """Split a query into terms; double-quoted phrases stay together"""
+    return [phrase or word for phrase, word in _term_pattern.findall(query) if (phrase or word).strip()]
+
+def highlight_snippet(content: str, terms: List[str], width: int = 80) -> str:
+    """Escaped excerpt around the first matching term with every term marked"""
+    lowered = content.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    first = min((position for position in positions if position >= 0), default=0)
+    start = max(first - width // 2, 0)
+    excerpt = content[start:start + width]
+    marked = html.escape(excerpt)
+    for term in sorted(set(terms), key=len, reverse=True):
+        marked = re.sub(
+            re.escape(html.escape(term)),
+            lambda match: f"{HIGHLIGHT_START}{match.group(0)}{HIGHLIGHT_END}",
+            marked,
+            flags=re.IGNORECASE
+        )
+    return ("…" if start else "") + marked + ("…" if start + width < len(content) else "")
+
+def render_highlight(marked: str) -> str:
+    """HTML-escape a database highlight and turn its match markers into tags"""
+    return html.escape(marked).replace(_MATCH_START, HIGHLIGHT_START).replace(_MATCH_END, HIGHLIGHT_END)
+
+class MessageSearch:
+    """Ranked full-text search over the messages of a user's conversations
+
+    On PostgreSQL messages get a stored generated tsvector column with a
+    GIN index, queried with websearch_to_tsquery and ranked by
+    ts_rank_cd; headlines are computed for the returned page only. On
+    SQLite an external-content FTS5 table with the trigram tokenizer is
+    kept in sync by triggers and ranked by bm25. Anything else (or SQLite
+    without FTS5) falls back to LIKE, newest first.
+    """
+
+    def __init__(self, language: str = "english"):
+        if not re.fullmatch(r"[a-z_]+", language):
+            raise ValueError(f"Invalid text search configuration: {language}")
+        self.language = language
+        self.mode = "like"
+
+    async def init_schema(self):
+        """Pick the search mode at startup; never rewrites PostgreSQL tables
+
+        On PostgreSQL the tsvector column and its index come from `migrate`
+        (run once per deployment); until both exist search uses LIKE. SQLite
+        creates its FTS5 table here, which is cheap and local to the file.
+        """
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                if await conn.run_sync(self._postgres_index_ready):
+                    self.mode = "postgres"
+                else:
+                    print("Message search index missing, search uses LIKE; run: python -m backend.search migrate")
+            elif conn.dialect.name == "sqlite":
+                try:
+                    await conn.run_sync(self._create_fts5)
+                    self.mode = "fts5"
+                except OperationalError as e:
+                    print(f"FTS5 unavailable, message search uses LIKE: {e}")
+
+    async def migrate(self):
+        """Add the PostgreSQL tsvector column and build its GIN index without blocking writes
+
+        Adding the stored generated column rewrites messages once under an
+        exclusive lock, so run this at a quiet time. The index is built
+        CONCURRENTLY (outside a transaction); an invalid leftover of an
+        interrupted build is dropped and rebuilt.
+        """
+        async with engine.begin() as conn:
+            if conn.dialect.name != "postgresql":
+                if conn.dialect.name == "sqlite":
+                    await conn.run_sync(self._create_fts5)
+                return
+            await conn.exec_driver_sql(
+                "ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('{self.language}', content)) STORED"
+            )
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            valid = (await conn.exec_driver_sql(
+                "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = 'ix_messages_content_tsv'"
+            )).scalar()
+            if valid is False:
+                await conn.exec_driver_sql("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_content_tsv")
+            await conn.exec_driver_sql(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_content_tsv ON messages USING GIN (content_tsv)"
+            )
+
+    @staticmethod
+    def _postgres_index_ready(conn) -> bool:
+        return conn.exec_driver_sql(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'messages' AND column_name = 'content_tsv' "
+            "AND table_schema = current_schema() AND EXISTS ("
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = 'ix_messages_content_tsv' AND i.indisvalid)"
+        ).first() is not None
+
+    @staticmethod
+    def _create_fts5(conn):
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).first()
+        conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+            "content, content='messages', content_rowid='rowid', tokenize='trigram')"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+            "INSERT INTO messages_fts(rowid, content) VALUES (new.rowid, new.content); END"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content); END"
+        )
+        conn.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content); "
+            "INSERT INTO messages_fts(rowid, content) VALUES (new.rowid, new.content); END"
+        )
+        if not exists:
+            conn.exec_driver_sql("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def _columns():
+        return (
+            Message.id,
+            Message.conversation_id,
+            Message.role,
+            Message.timestamp,
+            Conversation.title.label("conversation_title")
+        )
+
+    @staticmethod
+    def _scope(query, user_id: uuid.UUID, conversation_id: Optional[uuid.UUID]):
+        query = query.join(Conversation, Conversation.id == Message.conversation_id).where(
+            Conversation.user_id == user_id,
+            Conversation.deleted_at.is_(None)
+        )
+        if conversation_id is not None:
+            query = query.where(Message.conversation_id == conversation_id)
+        return query
+
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id: uuid.UUID,
+        text: str,
+        limit: int = 20,
+        offset: int = 0,
+        conversation_id: Optional[uuid.UUID] = None
+    ) -> List[Dict]:
+        """Return up to limit + 1 hits (the extra one signals another page), best first"""
+        terms = parse_terms(text)
+        if not terms:
+            return []
+        if self.mode == "postgres":
+            query = self._postgres_query(text, user_id, conversation_id, limit + 1, offset)
+        elif self.mode == "fts5" and any(len(term) >= MIN_TRIGRAM_TERM for term in terms):
+            query = self._fts5_query(terms, user_id, conversation_id).limit(limit + 1).offset(offset)
+        else:
+            query = self._like_query(terms, user_id, conversation_id).limit(limit + 1).offset(offset)
+        result = await db.execute(query)
+        hits = [dict(row._mapping) for row in result]
+        for hit in hits:
+            if "content" in hit:
+                hit["highlight"] = highlight_snippet(hit.pop("content"), terms)
+            else:
+                hit["highlight"] = render_highlight(hit["highlight"] or "")
+        return hits
+
+    def _postgres_query(self, text: str, user_id: uuid.UUID, conversation_id: Optional[uuid.UUID], limit: int, offset: int):
+        config = literal_column(f"'{self.language}'::regconfig")
+        tsquery = func.websearch_to_tsquery(config, text)
+        tsv = literal_column("messages.content_tsv")
+        rank = func.ts_rank_cd(tsv, tsquery)
+        ranked = self._scope(
+            select(*self._columns(), Message.content, rank.label("rank")),
+            user_id,
+            conversation_id
+        ).where(tsv.op("@@")(tsquery)).order_by(rank.desc(), Message.timestamp.desc()).limit(limit).offset(offset)
+        # Headlines are expensive, so they are computed only for the page, outside the ranking
+        page = ranked.subquery()
+        return select(
+            page.c.id,
+            page.c.conversation_id,
+            page.c.role,
+            page.c.timestamp,
+            page.c.conversation_title,
+            page.c.rank,
+            func.ts_headline(
+                config,
+                page.c.content,
+                tsquery,
+                f'StartSel="{_MATCH_START}", StopSel="{_MATCH_END}", MaxFragments=2, MaxWords=20, MinWords=5'
+            ).label("highlight")
+        ).order_by(page.c.rank.desc(), page.c.timestamp.desc())
+
+    def _fts5_query(self, terms: List[str], user_id: uuid.UUID, conversation_id: Optional[uuid.UUID]):
+        fts = table("messages_fts", column("rowid"))
+        fts_ref = literal_column("messages_fts")
+        # Every long-enough term must appear; FTS5 strings are quoted so the input is never parsed as syntax
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms if len(term) >= MIN_TRIGRAM_TERM)
+        short_terms = [term for term in terms if len(term) < MIN_TRIGRAM_TERM]
+        rank = func.bm25(fts_ref)
+        query = select(
+            *self._columns(),
+            (-rank).label("rank"),
+            # Trigram tokens are characters, so the snippet length is counted in characters
+            func.snippet(fts_ref, 0, _MATCH_START, _MATCH_END, "…", 48).label("highlight")
+        ).select_from(fts).join(Message, literal_column("messages.rowid") == fts.c.rowid)
+        query = self._scope(query, user_id, conversation_id).where(fts_ref.op("MATCH")(match))
+        if short_terms:
+            query = query.where(self._contains_all(short_terms))
+        return query.order_by(rank, Message.timestamp.desc())
+
+    def _like_query(self, terms: List[str], user_id: uuid.UUID, conversation_id: Optional[uuid.UUID]):
+        query = self._scope(
+            select(*self._columns(), Message.content, literal_column("NULL").label("rank")),
+            user_id,
+            conversation_id
+        )
+        return query.where(self._contains_all(terms)).order_by(Message.timestamp.desc(), Message.id.desc())
+
+    @staticmethod
+    def _contains_all(terms: List[str]):
+        def pattern(term: str) -> str:
+            return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return and_(*[Message.content.ilike(pattern(term), escape="\\") for term in terms])
+
+message_search = MessageSearch(settings.SEARCH_LANGUAGE)
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    from .database import close_db, init_db
+
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("usage: python -m backend.search migrate")
+
+    async def main():
+        await init_db()
+        await message_search.migrate()
+        await close_db()
+        print("Message search index is ready")
+
+    asyncio.run(main())
@@ -0,0 +1,361 @@
+import asyncio
+import json
+import re
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import UserMemory, MemoryEmbedding, redis_client
+from .persistence import WriteBatch, persistence, DURABILITY_FLUSH
+from .tokenizer import cached_token_count
+from .config import settings
+
+class Embedder:
+    """Base class for local text embedders producing L2-normalized float32 vectors"""
+
+    name = "base"
+    dim = 0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        raise NotImplementedError
+
+class HashingEmbedder(Embedder):
+    """Deterministic feature-hashing embedder over word unigrams and bigrams"""
+
+    _token_pattern = re.compile(r"\w+")
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        tokens = self._token_pattern.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                # crc32 is stable across processes, unlike hash()
+                h = zlib.crc32(feature.encode())
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+class SentenceTransformerEmbedder(Embedder):
+    """Local sentence-transformers model (optional dependency)"""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("sentence-transformers is not installed; use the hashing embedder instead")
+        self._model = SentenceTransformer(model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(
+            self._model.encode(list(texts), normalize_embeddings=True),
+            dtype=np.float32
+        )
+
+def create_embedder(name: str = "hashing", dim: int = 256) -> Embedder:
+    """Create an embedder by name ("hashing" or "sentence-transformers[:model]")"""
+    if name == "hashing":
+        return HashingEmbedder(dim)
+    if name.startswith("sentence-transformers"):
+        _, _, model_name = name.partition(":")
+        return SentenceTransformerEmbedder(model_name or "all-MiniLM-L6-v2")
+    raise ValueError(f"Unknown embedder: {name}")
+
+class VectorStore:
+    """Growable matrix of unit vectors with exact cosine top-k search"""
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._size = 0
+        self.ids: List[str] = []
+        self.payloads: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._positions
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[Dict]):
+        """Insert vectors, replacing any that already exist under the same id"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        needed = self._size + len(ids)
+        if needed > len(self._vectors):
+            grown = np.zeros((max(needed, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+
+        for item_id, vector, payload in zip(ids, vectors, payloads):
+            position = self._positions.get(item_id)
+            if position is None:
+                position = self._size
+                self._size += 1
+                self._positions[item_id] = position
+                self.ids.append(item_id)
+                self.payloads.append(payload)
+            else:
+                self.payloads[position] = payload
+            self._vectors[position] = vector
+
+    def remove(self, ids: Iterable[str]):
+        """Remove vectors by id, moving the last row into each freed slot"""
+        for item_id in ids:
+            position = self._positions.pop(item_id, None)
+            if position is None:
+                continue
+            last = self._size - 1
+            if position != last:
+                self._vectors[position] = self._vectors[last]
+                self.ids[position] = self.ids[last]
+                self.payloads[position] = self.payloads[last]
+                self._positions[self.ids[position]] = position
+            self.ids.pop()
+            self.payloads.pop()
+            self._size -= 1
+
+    def search(self, query: np.ndarray, k: int = 3) -> List[Tuple[str, float, Dict]]:
+        """Return up to k (id, cosine score, payload) tuples, best first"""
+        if self._size == 0 or k <= 0:
+            return []
+        scores = self._vectors[:self._size] @ np.asarray(query, dtype=np.float32).reshape(self.dim)
+        k = min(k, self._size)
+        if k < self._size:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(self._size)
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i]), self.payloads[i]) for i in top]
+
+REMOVAL_CHANNEL = "semantic:remove"
+REMOVAL_CHUNK = 1000  # memory ids per pub/sub message
+
+class SemanticMemoryIndex:
+    """Per-user vector stores over UserMemory, persisted in memory_embeddings
+
+    Stores only pick up new vectors when they sync, so deletions are
+    broadcast over Redis pub/sub and every worker drops those memories.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        max_users: int = 1000,
+        sync_interval: float = 30.0,
+        sync_overlap: float = 60.0
+    ):
+        self.embedder = embedder
+        self.max_users = max_users
+        self.sync_interval = sync_interval
+        self.sync_overlap = timedelta(seconds=sync_overlap)
+        self._stores: "OrderedDict[str, VectorStore]" = OrderedDict()
+        self._synced_until: Dict[str, datetime] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _payload(memory: UserMemory) -> Dict:
+        return {
+            "content": memory.content,
+            "importance": memory.importance_score,
+            "memory_type": memory.memory_type,
+            "tokens": cached_token_count(memory.memory_metadata, memory.content)
+        }
+
+    def _evict(self):
+        while len(self._stores) > self.max_users:
+            user_id, _ = self._stores.popitem(last=False)
+            self._synced_until.pop(user_id, None)
+            self._checked_at.pop(user_id, None)
+            self._locks.pop(user_id, None)
+
+    async def _backfill(self, db: AsyncSession, user_id: uuid.UUID):
+        """Embed this user's memories that have no vector for the current embedder yet"""
+        result = await db.execute(
+            select(UserMemory).outerjoin(
+                MemoryEmbedding,
+                and_(
+                    MemoryEmbedding.memory_id == UserMemory.id,
+                    MemoryEmbedding.model == self.embedder.name
+                )
+            ).where(
+                UserMemory.user_id == user_id,
+                MemoryEmbedding.memory_id.is_(None)
+            )
+        )
+        memories = result.scalars().all()
+        if not memories:
+            return
+        vectors = self.embedder.embed([memory.content for memory in memories])
+        batch = WriteBatch()
+        for memory, vector in zip(memories, vectors):
+            batch.add(MemoryEmbedding(
+                memory_id=memory.id,
+                user_id=memory.user_id,
+                model=self.embedder.name,
+                vector=vector.tobytes(),
+                created_at=datetime.utcnow()
+            ))
+        # Committed on its own (the caller's session is read-only) and before the sync reads them back
+        try:
+            await persistence.write(batch, DURABILITY_FLUSH)
+        except Exception as e:
+            # Usually another worker backfilled the same memories first; the sync picks up theirs
+            print(f"Semantic index backfill for {user_id} failed: {e}")
+
+    async def _load(self, db: AsyncSession, user_id: str) -> VectorStore:
+        """Load or incrementally sync a user's store from the database"""
+        store = self._stores.get(user_id)
+        if store is not None and time.monotonic() - self._checked_at[user_id] < self.sync_interval:
+            self._stores.move_to_end(user_id)
+            return store
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            store = self._stores.get(user_id)
+            user_uuid = uuid.UUID(user_id)
+            if store is None:
+                await self._backfill(db, user_uuid)
+                store = VectorStore(self.embedder.dim)
+            elif time.monotonic() - self._checked_at[user_id] < self.sync_interval:
+                return store
+
+            # Pick up vectors written since the last sync (possibly by other workers)
+            query = select(
+                MemoryEmbedding.memory_id,
+                MemoryEmbedding.vector,
+                MemoryEmbedding.created_at,
+                UserMemory
+            ).join(UserMemory, UserMemory.id == MemoryEmbedding.memory_id).where(
+                MemoryEmbedding.user_id == user_uuid,
+                MemoryEmbedding.model == self.embedder.name,
+                # Expired memories (including those of deleted conversations) await deletion
+                or_(UserMemory.expires_at.is_(None), UserMemory.expires_at > datetime.utcnow())
+            )
+            synced_until = self._synced_until.get(user_id)
+            if synced_until is not None:
+                # created_at is stamped before a write-behind commit, so a row can become
+                # visible after newer ones were synced; re-scan an overlap (the store
+                # replaces vectors by memory id, so rows seen twice are harmless)
+                query = query.where(MemoryEmbedding.created_at >= synced_until - self.sync_overlap)
+            rows = (await db.execute(query)).all()
+
+            if rows:
+                store.add(
+                    [str(row.memory_id) for row in rows],
+                    np.frombuffer(b"".join(row.vector for row in rows), dtype=np.float32),
+                    [self._payload(row.UserMemory) for row in rows]
+                )
+                self._synced_until[user_id] = max(
+                    max(row.created_at for row in rows), synced_until or datetime.min
+                )
+
+            self._stores[user_id] = store
+            self._stores.move_to_end(user_id)
+            self._checked_at[user_id] = time.monotonic()
+            self._evict()
+            return store
+
+    def add_memory(self, batch: WriteBatch, memory: UserMemory):
+        """Embed a new memory and queue its vector alongside it in the write batch"""
+        if memory.id is None:
+            memory.id = uuid.uuid4()
+        vector = self.embedder.embed([memory.content])[0]
+        batch.add(MemoryEmbedding(
+            memory_id=memory.id,
+            user_id=memory.user_id,
+            model=self.embedder.name,
+            vector=vector.tobytes(),
+            created_at=datetime.utcnow()
+        ))
+
+        store = self._stores.get(str(memory.user_id))
+        if store is not None:
+            store.add([str(memory.id)], vector, [self._payload(memory)])
+
+    def drop_local(self, user_id: str, memory_ids: Iterable[str]):
+        """Drop deleted memories from this worker's store for the user"""
+        store = self._stores.get(str(user_id))
+        if store is not None:
+            store.remove(str(memory_id) for memory_id in memory_ids)
+
+    async def remove_memories(self, user_id: str, memory_ids: Iterable[str]):
+        """Drop deleted memories from the user's store on every worker"""
+        memory_ids = [str(memory_id) for memory_id in memory_ids]
+        self.drop_local(user_id, memory_ids)
+        for start in range(0, len(memory_ids), REMOVAL_CHUNK):
+            await redis_client.publish(
+                REMOVAL_CHANNEL,
+                json.dumps({"user_id": str(user_id), "ids": memory_ids[start:start + REMOVAL_CHUNK]})
+            )
+
+    async def _listen(self):
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(REMOVAL_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        removal = json.loads(message["data"])
+                        self.drop_local(removal["user_id"], removal["ids"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Removals may have been missed while disconnected; reload every store
+                print(f"Semantic index listener error: {e}")
+                self._stores.clear()
+                self._synced_until.clear()
+                self._checked_at.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def start(self):
+        """Start listening for removals made by other workers"""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def search(self, db: AsyncSession, user_id: str, text: str, k: int = 3) -> List[Dict]:
+        """Return the k memories nearest to text for this user"""
+        store = await self._load(db, str(user_id))
+        if not len(store) or not text:
+            return []
+        query = self.embedder.embed([text])[0]
+        return [
+            dict(payload, id=memory_id, score=score)
+            for memory_id, score, payload in store.search(query, k)
+        ]
+
+semantic_index = SemanticMemoryIndex(
+    create_embedder(settings.EMBEDDER, settings.EMBEDDING_DIM),
+    max_users=settings.SEMANTIC_INDEX_MAX_USERS,
+    sync_interval=settings.SEMANTIC_INDEX_SYNC_INTERVAL,
+    sync_overlap=settings.SEMANTIC_INDEX_SYNC_OVERLAP
+)
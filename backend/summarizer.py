@@ -0,0 +1,170 @@
+import asyncio
+import re
+import uuid
+from typing import Dict, List, Optional, Sequence, Set
+
+from sqlalchemy import select, update, tuple_
+
+from .database import AsyncSessionLocal, Conversation, Message
+from .context_cache import context_cache, RECENT_MESSAGES
+from .llm_providers import LLMProvider, ProviderError, get_llm_provider
+from .config import settings
+
+_sentence_end = re.compile(r"(?<=[.!?])\s")
+
+def merge_context_items(existing: Sequence[str], new: Sequence[str], limit: int) -> List[str]:
+    """Merge entity/topic lists cumulatively, most recently mentioned last"""
+    merged = [item for item in existing if item not in new] + list(dict.fromkeys(new))
+    return merged[-limit:]
+
+def first_sentence(text: str, max_length: int = 120) -> str:
+    sentence = _sentence_end.split(text.strip(), 1)[0].replace("\n", " ")
+    if len(sentence) > max_length:
+        sentence = sentence[:max_length - 3].rstrip() + "..."
+    return sentence
+
+class ConversationSummarizer:
+    """Folds messages that leave the recent-message window into a rolling summary
+
+    Runs in the background after a turn. Each run reads only the messages
+    after the conversation's watermark (at most `fold_batch` of them
+    beyond the window), folds them into `context_summary`, and advances
+    the watermark with a compare-and-set, so the work per turn stays
+    constant however long the conversation grows. Without an LLM
+    provider the summary is extractive: one line per folded user
+    message, oldest lines dropped once it exceeds `max_chars`.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        provider: Optional[LLMProvider] = None,
+        window: int = RECENT_MESSAGES,
+        fold_batch: int = 50,
+        max_chars: int = 2000
+    ):
+        self.session_factory = session_factory
+        self.provider = provider
+        self.window = window
+        self.fold_batch = fold_batch
+        self.max_chars = max_chars
+        self.stats = {"runs": 0, "folded": 0, "conflicts": 0, "failures": 0}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._rerun: Set[str] = set()
+
+    def schedule(self, conversation_id: str):
+        """Summarize a conversation in the background (coalescing repeated requests)"""
+        conversation_id = str(conversation_id)
+        if conversation_id in self._tasks:
+            self._rerun.add(conversation_id)
+            return
+        task = asyncio.create_task(self._run(conversation_id))
+        self._tasks[conversation_id] = task
+
+    async def _run(self, conversation_id: str):
+        try:
+            while True:
+                self._rerun.discard(conversation_id)
+                try:
+                    more = await self.summarize(conversation_id)
+                except Exception as e:
+                    self.stats["failures"] += 1
+                    print(f"Summarization failed for {conversation_id}: {e}")
+                    return
+                if not more and conversation_id not in self._rerun:
+                    return
+        finally:
+            self._tasks.pop(conversation_id, None)
+
+    async def summarize(self, conversation_id: str) -> bool:
+        """Fold one batch of out-of-window messages; returns True if more remain"""
+        self.stats["runs"] += 1
+        conversation_uuid = uuid.UUID(conversation_id)
+        async with self.session_factory() as db:
+            conversation = await db.get(Conversation, conversation_uuid)
+            if conversation is None or conversation.deleted_at is not None:
+                return False
+            query = select(Message).where(Message.conversation_id == conversation_uuid)
+            if conversation.summarized_until is not None:
+                query = query.where(
+                    tuple_(Message.timestamp, Message.id)
+                    > tuple_(conversation.summarized_until, conversation.summarized_until_id)
+                )
+            result = await db.execute(
+                query.order_by(Message.timestamp, Message.id).limit(self.fold_batch + self.window)
+            )
+            messages = result.scalars().all()
+        if len(messages) <= self.window:
+            return False
+
+        # Fold outside the session so a slow model call doesn't hold a connection
+        folded = messages[:len(messages) - self.window]
+        summary = await self._fold(conversation.context_summary, folded)
+        watermark = folded[-1]
+
+        async with self.session_factory() as db:
+            # Only advance from the watermark we read; a concurrent run on another worker wins otherwise
+            result = await db.execute(
+                update(Conversation).where(
+                    Conversation.id == conversation_uuid,
+                    Conversation.summarized_until.is_not_distinct_from(conversation.summarized_until),
+                    Conversation.summarized_until_id.is_not_distinct_from(conversation.summarized_until_id)
+                ).values(
+                    context_summary=summary,
+                    summarized_until=watermark.timestamp,
+                    summarized_until_id=watermark.id
+                ).execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+        if result.rowcount == 0:
+            self.stats["conflicts"] += 1
+            return False
+        self.stats["folded"] += len(folded)
+        await context_cache.update_conversation_fields(conversation_id, summary=summary)
+        return len(messages) == self.fold_batch + self.window
+
+    async def _fold(self, summary: Optional[str], messages: List[Message]) -> str:
+        if self.provider is not None:
+            try:
+                return await self._fold_with_model(summary, messages)
+            except ProviderError as e:
+                print(f"Model summarization failed, using extractive summary: {e}")
+        return self._fold_extractive(summary, messages)
+
+    def _fold_extractive(self, summary: Optional[str], messages: List[Message]) -> str:
+        lines = summary.splitlines() if summary else []
+        lines.extend(
+            f"- User: {first_sentence(message.content)}"
+            for message in messages if message.role == "user"
+        )
+        while len(lines) > 1 and len("\n".join(lines)) > self.max_chars:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    async def _fold_with_model(self, summary: Optional[str], messages: List[Message]) -> str:
+        transcript = "\n".join(f"{message.role}: {message.content}" for message in messages)
+        result = await self.provider.complete([
+            {
+                "role": "system",
+                "content": "You maintain a running summary of a conversation between a user and an assistant. "
+                           "Merge the new messages into the summary. Keep facts, preferences, decisions and open "
+                           f"questions; drop small talk. Reply with the updated summary only, under {self.max_chars} characters."
+            },
+            {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"}
+        ])
+        return result.strip()[:self.max_chars]
+
+    async def stop(self):
+        """Cancel in-flight summarizations (they are retried after the next turn)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._rerun.clear()
+
+summarizer = ConversationSummarizer(
+    provider=get_llm_provider() if settings.SUMMARY_USE_MODEL else None,
+    fold_batch=settings.SUMMARY_FOLD_BATCH,
+    max_chars=settings.SUMMARY_MAX_CHARS
+)
@@ -0,0 +1,62 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, Optional
+
+from .config import settings
+
+class Tokenizer:
+    """Base class for local token counters"""
+
+    name = "base"
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+class ApproximateTokenizer(Tokenizer):
+    """Dependency-free BPE-like estimate: one token per ~4 characters of each word or symbol"""
+
+    name = "approx-v1"
+    _piece_pattern = re.compile(r"\w+|[^\w\s]")
+
+    def count(self, text: str) -> int:
+        return sum(math.ceil(len(piece) / 4) for piece in self._piece_pattern.findall(text))
+
+class TiktokenTokenizer(Tokenizer):
+    """tiktoken BPE encoding (optional dependency)"""
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        try:
+            import tiktoken
+        except ImportError:
+            raise RuntimeError("tiktoken is not installed; use the approximate tokenizer instead")
+        self._encoding = tiktoken.get_encoding(encoding)
+        self.name = f"tiktoken-{encoding}"
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+def create_tokenizer(name: str = "approx") -> Tokenizer:
+    """Create a tokenizer by name ("approx" or "tiktoken[:encoding]")"""
+    if name == "approx":
+        return ApproximateTokenizer()
+    if name.startswith("tiktoken"):
+        _, _, encoding = name.partition(":")
+        return TiktokenTokenizer(encoding or "cl100k_base")
+    raise ValueError(f"Unknown tokenizer: {name}")
+
+tokenizer = create_tokenizer(settings.TOKENIZER)
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Token count of text with the configured tokenizer"""
+    return tokenizer.count(text)
+
+def token_metadata(text: str) -> Dict:
+    """Metadata entry recording text's token count for the configured tokenizer"""
+    return {"tokens": {tokenizer.name: count_tokens(text)}}
+
+def cached_token_count(metadata: Optional[Dict], text: str) -> int:
+    """Token count stored in metadata, computed only if it was never recorded"""
+    count = ((metadata or {}).get("tokens") or {}).get(tokenizer.name)
+    return count if count is not None else count_tokens(text)
@@ -0,0 +1,279 @@
+import json
+import uuid
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import select, insert, update
+
+from .database import AsyncSessionLocal, Conversation, Message
+
+FORMAT_VERSION = 1
+MESSAGE_ROLES = ("user", "assistant")
+DECOMPRESS_CHUNK = 64 * 1024  # max bytes inflated per decompress() call
+
+class ImportFormatError(ValueError):
+    """An import stream that can't be loaded; reported with its line number"""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+class ImportTooLargeError(ValueError):
+    """An import stream over the (decompressed) size limit"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"import exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+def _line(record: Dict) -> bytes:
+    return (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode()
+
+async def export_ndjson(
+    user_id: uuid.UUID,
+    conversation_id: Optional[uuid.UUID] = None,
+    session_factory=AsyncSessionLocal,
+    batch_size: int = 500
+) -> AsyncIterator[bytes]:
+    """Stream a user's conversations (or one of them) as NDJSON lines
+
+    Rows come from one server-side cursor over conversations outer-joined
+    to their messages, fetched `batch_size` at a time as plain columns
+    (no ORM objects), so memory stays flat however long the history is.
+    """
+    query = select(
+        Conversation.id,
+        Conversation.title,
+        Conversation.created_at,
+        Conversation.updated_at,
+        Conversation.context_summary,
+        Conversation.context_entities,
+        Conversation.context_topics,
+        Conversation.summarized_until,
+        Conversation.summarized_until_id,
+        Message.id.label("message_id"),
+        Message.role,
+        Message.content,
+        Message.timestamp,
+        Message.message_metadata
+    ).outerjoin(Message, Message.conversation_id == Conversation.id).where(
+        Conversation.user_id == user_id,
+        Conversation.deleted_at.is_(None)
+    )
+    if conversation_id is not None:
+        query = query.where(Conversation.id == conversation_id)
+    query = query.order_by(Conversation.id, Message.timestamp, Message.id)
+
+    yield _line({"type": "export", "version": FORMAT_VERSION, "exported_at": datetime.utcnow().isoformat()})
+    async with session_factory() as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        current = None
+        async for rows in result.partitions():
+            chunk = []
+            for row in rows:
+                if row.id != current:
+                    current = row.id
+                    chunk.append(_line({
+                        "type": "conversation",
+                        "id": str(row.id),
+                        "title": row.title,
+                        "created_at": _iso(row.created_at),
+                        "updated_at": _iso(row.updated_at),
+                        "context": {
+                            "summary": row.context_summary,
+                            "entities": row.context_entities or [],
+                            "topics": row.context_topics or []
+                        },
+                        "summarized_until": _iso(row.summarized_until),
+                        "summarized_until_id": str(row.summarized_until_id) if row.summarized_until_id else None
+                    }))
+                if row.message_id is not None:
+                    chunk.append(_line({
+                        "type": "message",
+                        "id": str(row.message_id),
+                        "conversation_id": str(row.id),
+                        "role": row.role,
+                        "content": row.content,
+                        "timestamp": _iso(row.timestamp),
+                        "metadata": row.message_metadata or {}
+                    }))
+            yield b"".join(chunk)
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Gzip a byte stream incrementally"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+async def ndjson_lines(
+    chunks: AsyncIterator[bytes],
+    max_line_bytes: int,
+    max_bytes: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Split a (possibly gzipped) byte stream into lines, decompressing on the fly
+
+    Compressed input is inflated at most DECOMPRESS_CHUNK bytes at a time,
+    so a small gzip bomb can't expand in one call; the decompressed size is
+    capped at `max_bytes` and every line at `max_line_bytes`.
+    """
+    decompressor = None
+    buffer = b""
+    line_number = 0
+    total = 0
+    async for chunk in chunks:
+        if decompressor is None:
+            # gzip is detected from the magic bytes, so Content-Encoding is optional
+            decompressor = zlib.decompressobj(47) if chunk[:2] == b"\x1f\x8b" else False
+        while chunk:
+            if decompressor:
+                try:
+                    data = decompressor.decompress(chunk, DECOMPRESS_CHUNK)
+                except zlib.error as e:
+                    raise ImportFormatError(line_number + 1, f"invalid gzip data ({e})")
+                chunk = decompressor.unconsumed_tail
+            else:
+                data, chunk = chunk, b""
+            total += len(data)
+            if max_bytes is not None and total > max_bytes:
+                raise ImportTooLargeError(max_bytes)
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_number += 1
+                yield line
+            if len(buffer) > max_line_bytes:
+                raise ImportFormatError(line_number + 1, f"line exceeds {max_line_bytes} bytes")
+    if buffer:
+        yield buffer
+
+class ConversationImporter:
+    """Loads an NDJSON export into a user's account in one transaction
+
+    Conversations and messages get fresh ids so an export can be imported
+    next to the original. Messages are buffered and written `batch_size`
+    at a time: with COPY on PostgreSQL and multi-row INSERTs elsewhere.
+    """
+
+    def __init__(self, user_id: uuid.UUID, session_factory=AsyncSessionLocal, batch_size: int = 1000):
+        self.user_id = user_id
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.stats = {"conversations": 0, "messages": 0}
+        self._pending: List[Dict] = []
+        self._conversation_ids: Dict[str, uuid.UUID] = {}
+        self._conversation: Optional[Dict] = None
+
+    async def load(self, lines: AsyncIterator[bytes]) -> Dict[str, int]:
+        async with self.session_factory() as db:
+            line_number = 0
+            async for line in lines:
+                line_number += 1
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    kind = record.get("type")
+                    if kind == "export":
+                        if record.get("version") != FORMAT_VERSION:
+                            raise ValueError(f"unsupported export version {record.get('version')}")
+                    elif kind == "conversation":
+                        await self._finish_conversation(db)
+                        await self._start_conversation(db, record)
+                    elif kind == "message":
+                        self._add_message(record)
+                    else:
+                        raise ValueError(f"unknown record type {kind!r}")
+                except ImportFormatError:
+                    raise
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    raise ImportFormatError(line_number, str(e) or e.__class__.__name__)
+                if len(self._pending) >= self.batch_size:
+                    await self._flush(db)
+            await self._finish_conversation(db)
+            await self._flush(db)
+            await db.commit()
+        return self.stats
+
+    async def _start_conversation(self, db, record: Dict):
+        new_id = uuid.uuid4()
+        self._conversation_ids[record["id"]] = new_id
+        context = record.get("context") or {}
+        await db.execute(insert(Conversation).values(
+            id=new_id,
+            title=record.get("title") or "Imported Conversation",
+            user_id=self.user_id,
+            created_at=datetime.fromisoformat(record["created_at"]) if record.get("created_at") else datetime.utcnow(),
+            updated_at=datetime.fromisoformat(record["updated_at"]) if record.get("updated_at") else datetime.utcnow(),
+            message_count=0,
+            context_summary=context.get("summary"),
+            context_entities=list(context.get("entities") or []),
+            context_topics=list(context.get("topics") or [])
+        ))
+        # The summary watermark points at a message id that is remapped below
+        self._conversation = {
+            "id": new_id,
+            "messages": 0,
+            "watermark_id": record.get("summarized_until_id"),
+            "watermark": None
+        }
+        self.stats["conversations"] += 1
+
+    def _add_message(self, record: Dict):
+        conversation_id = self._conversation_ids.get(record["conversation_id"])
+        if conversation_id is None or conversation_id != self._conversation["id"]:
+            raise ValueError("message does not follow its conversation record")
+        if record["role"] not in MESSAGE_ROLES:
+            raise ValueError(f"invalid role {record['role']!r}")
+        if not isinstance(record["content"], str):
+            raise ValueError("content must be a string")
+        message = {
+            "id": uuid.uuid4(),
+            "conversation_id": conversation_id,
+            "role": record["role"],
+            "content": record["content"],
+            "timestamp": datetime.fromisoformat(record["timestamp"]),
+            "message_metadata": record.get("metadata") or {}
+        }
+        if record.get("id") is not None and record["id"] == self._conversation["watermark_id"]:
+            self._conversation["watermark"] = (message["timestamp"], message["id"])
+        self._pending.append(message)
+        self._conversation["messages"] += 1
+
+    async def _finish_conversation(self, db):
+        conversation = self._conversation
+        if conversation is None:
+            return
+        values = {"message_count": conversation["messages"]}
+        if conversation["watermark"] is not None:
+            values["summarized_until"], values["summarized_until_id"] = conversation["watermark"]
+        else:
+            # Without its watermark the imported summary would be folded again; rebuild it instead
+            values["context_summary"] = None
+        await db.execute(update(Conversation).where(Conversation.id == conversation["id"]).values(**values))
+        self._conversation = None
+
+    async def _flush(self, db):
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        connection = await db.connection()
+        if connection.dialect.name == "postgresql":
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                Message.__tablename__,
+                columns=["id", "conversation_id", "role", "content", "timestamp", "metadata"],
+                records=[
+                    (row["id"], row["conversation_id"], row["role"], row["content"], row["timestamp"],
+                     json.dumps(row["message_metadata"]))
+                    for row in rows
+                ]
+            )
+        else:
+            await db.execute(insert(Message), rows)
+        self.stats["messages"] += len(rows)
@@ -1,14 +1,41 @@
 import socketio
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
 from datetime import datetime
 import asyncio
 import json
+import time
+import uuid
+from typing import Set
 
-from .database import SessionLocal, User, Conversation, Message, memory_store
+from .database import AsyncSessionLocal, User, Conversation, Message, UserMemory, memory_store, replica_router
+from .auth import get_user_for_token
+from .context_cache import context_cache, message_entry
+from .persistence import persistence, WriteBatch
 from .ai_service import AIService
+from .generation_scheduler import generation_scheduler, GenerationRejected
+from .summarizer import summarizer
+from .tokenizer import token_metadata
+from .metrics import observe_stage, SOCKETS_CONNECTED, TURN_SECONDS, TIME_TO_FIRST_TOKEN_SECONDS, TURN_ERRORS
 from .config import settings
 
+_pending_list_bumps: Set[asyncio.Task] = set()
+
+def single_row_batch(obj) -> WriteBatch:
+    batch = WriteBatch()
+    batch.add(obj)
+    return batch
+
+async def bump_list_after_commit(user_id: str, ack: asyncio.Future):
+    """Move the conversation list version once the turn is committed
+
+    Bumping earlier would let a poll in between cache the old list under
+    the new version's ETag.
+    """
+    try:
+        await ack
+    except Exception:
+        return  # logged by the persistence pipeline
+    await context_cache.bump_conversation_list(user_id)
+
 def setup_socket_handlers(sio: socketio.AsyncServer):
     """Setup WebSocket event handlers"""
     
@@ -16,20 +43,7 @@ def setup_socket_handlers(sio: socketio.AsyncServer):
     
     async def get_user_from_token(token: str) -> User:
         """Authenticate user from JWT token"""
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-            email = payload.get("sub")
-            if not email:
-                return None
-                
-            db = SessionLocal()
-            try:
-                user = db.query(User).filter(User.email == email).first()
-                return user
-            finally:
-                db.close()
-        except JWTError:
-            return None
+        return await get_user_for_token(token)
     
     @sio.event
     async def connect(sid, environ, auth):
@@ -43,22 +57,154 @@ def setup_socket_handlers(sio: socketio.AsyncServer):
             await sio.disconnect(sid)
             return False
             
-        # Store user info in session
-        await sio.save_session(sid, {'user_id': str(user.id), 'user_email': user.email})
+        # Store user info in the shared session store
+        await memory_store.store_socket_session(
+            sid,
+            {'user_id': str(user.id), 'user_email': user.email},
+            ttl=settings.SOCKET_SESSION_TTL
+        )
+        SOCKETS_CONNECTED.inc()
         print(f"User {user.email} connected with session {sid}")
         return True
     
     @sio.event
     async def disconnect(sid):
         """Handle client disconnection"""
-        session = await sio.get_session(sid)
+        generation_scheduler.cancel_session(sid)
+        session = await memory_store.get_socket_session(sid)
+        await memory_store.delete_socket_session(sid)
+        if session:
+            SOCKETS_CONNECTED.dec()
         print(f"User {session.get('user_email', 'Unknown')} disconnected")
     
+    async def generate_reply(sid, user_id, conversation_id, conversation_uuid, content, prepared):
+        """Stream the assistant's reply; runs as a scheduled generation job"""
+        user_message_ack = await prepared
+        
+        async with AsyncSessionLocal() as db:
+            # Emit typing indicator
+            await sio.emit('typing_indicator', {
+                'conversation_id': conversation_id,
+                'is_typing': True
+            }, room=sid)
+            
+            # Stream AI response
+            start_time = datetime.utcnow()
+            ai_message_id = uuid.uuid4()
+            ai_response = None
+            first_token_time = None
+            turn_batch = WriteBatch()
+            async for event in ai_service.generate_response_stream(
+                user_message=content,
+                conversation_id=conversation_id,
+                user_id=user_id,
+                db=db,
+                batch=turn_batch
+            ):
+                if event['type'] == 'chunk':
+                    if first_token_time is None:
+                        first_token_time = (datetime.utcnow() - start_time).total_seconds() * 1000
+                        TIME_TO_FIRST_TOKEN_SECONDS.observe(first_token_time / 1000)
+                        
+                        # Stop typing indicator once tokens start flowing
+                        await sio.emit('typing_indicator', {
+                            'conversation_id': conversation_id,
+                            'is_typing': False
+                        }, room=sid)
+                    
+                    await sio.emit('message_chunk', {
+                        'id': str(ai_message_id),
+                        'content': event['content'],
+                        'conversation_id': conversation_id
+                    }, room=sid)
+                elif event['type'] == 'complete':
+                    ai_response = event['response']
+            processing_time = (datetime.utcnow() - start_time).total_seconds() * 1000
+            
+            if first_token_time is None:
+                await sio.emit('typing_indicator', {
+                    'conversation_id': conversation_id,
+                    'is_typing': False
+                }, room=sid)
+            
+            # Create AI message
+            ai_message = Message(
+                id=ai_message_id,
+                content=ai_response['content'],
+                role='assistant',
+                conversation_id=conversation_uuid,
+                timestamp=datetime.utcnow(),
+                message_metadata={
+                    'processing_time': processing_time,
+                    'time_to_first_token': first_token_time,
+                    'confidence': ai_response.get('confidence', 0.9),
+                    'context_used': ai_response.get('context_used', False),
+                    'prompt_tokens': ai_response.get('prompt_tokens'),
+                    **token_metadata(ai_response['content'])
+                }
+            )
+            
+            turn_batch.add(ai_message)
+            
+            # Update conversation (atomic SQL increment for the counter)
+            conversation_values = {'updated_at': datetime.utcnow()}
+            snapshot_fields = {}
+            
+            # Update context if provided
+            if ai_response.get('context'):
+                snapshot_fields = {
+                    'entities': ai_response['context'].get('entities', []),
+                    'topics': ai_response['context'].get('topics', [])
+                }
+                conversation_values.update(
+                    context_entities=snapshot_fields['entities'],
+                    context_topics=snapshot_fields['topics']
+                )
+            
+            turn_batch.update_conversation(conversation_uuid, message_delta=2, **conversation_values)  # user + assistant
+            with observe_stage("user_message_commit"):
+                await persistence.wait(user_message_ack)
+            with observe_stage("final_commit"):
+                # Sticky before the write lands, so no read of the new list can come from a replica
+                await replica_router.mark_write(user_id)
+                turn_ack = persistence.submit(turn_batch)
+                await persistence.wait(turn_ack)
+                committed = turn_ack.done()
+                await context_cache.append_messages(conversation_id, [message_entry(ai_message)], **snapshot_fields)
+                # Parts changed ahead of the commit (memories always, the reply under enqueue durability)
+                context_cache.revalidate_after(
+                    turn_ack,
+                    conversation_id=None if committed else conversation_id,
+                    user_id=user_id if UserMemory in turn_batch.rows else None
+                )
+                if turn_ack.done():
+                    await bump_list_after_commit(user_id, turn_ack)
+                else:
+                    # Enqueue durability: the reply goes out now, the list moves when the commit lands
+                    task = asyncio.create_task(bump_list_after_commit(user_id, turn_ack))
+                    _pending_list_bumps.add(task)
+                    task.add_done_callback(_pending_list_bumps.discard)
+            
+            # Fold messages leaving the recent window into the rolling summary
+            summarizer.schedule(conversation_uuid)
+            
+            # Send final AI message
+            with observe_stage("final_emit"):
+                await sio.emit('message_complete', {
+                    'id': str(ai_message.id),
+                    'content': ai_message.content,
+                    'role': ai_message.role,
+                    'timestamp': ai_message.timestamp.isoformat(),
+                    'conversation_id': str(ai_message.conversation_id),
+                    'metadata': ai_message.message_metadata
+                }, room=sid)
+    
     @sio.event
     async def send_message(sid, data):
         """Handle incoming message from client"""
+        received_at = time.perf_counter()
         try:
-            session = await sio.get_session(sid)
+            session = await memory_store.get_socket_session(sid)
             user_id = session.get('user_id')
             
             if not user_id:
@@ -72,102 +218,89 @@ def setup_socket_handlers(sio: socketio.AsyncServer):
                 await sio.emit('error', {'message': 'Missing conversation_id or content'}, room=sid)
                 return
             
-            db = SessionLocal()
+            with observe_stage("ownership_check"):
+                async with AsyncSessionLocal() as db:
+                    # Verify conversation ownership (served from the context snapshot cache)
+                    snapshot = await context_cache.get_snapshot(db, conversation_id, user_id)
+            
+            if not snapshot:
+                await sio.emit('error', {'message': 'Conversation not found'}, room=sid)
+                return
+            conversation_uuid = uuid.UUID(snapshot['conversation']['id'])
+            
+            # Admission control happens before anything is stored, so a shed message can be resent
+            prepared = asyncio.get_running_loop().create_future()
             try:
-                # Verify conversation ownership
-                conversation = db.query(Conversation).filter(
-                    Conversation.id == conversation_id,
-                    Conversation.user_id == user_id
-                ).first()
-                
-                if not conversation:
-                    await sio.emit('error', {'message': 'Conversation not found'}, room=sid)
-                    return
-                
-                # Create user message
-                user_message = Message(
-                    content=content,
-                    role='user',
-                    conversation_id=conversation_id,
-                    timestamp=datetime.utcnow()
-                )
-                
-                db.add(user_message)
-                db.commit()
-                db.refresh(user_message)
-                
-                # Send user message confirmation
-                await sio.emit('message_received', {
-                    'id': str(user_message.id),
-                    'content': user_message.content,
-                    'role': user_message.role,
-                    'timestamp': user_message.timestamp.isoformat(),
-                    'conversation_id': str(user_message.conversation_id)
-                }, room=sid)
-                
-                # Emit typing indicator
-                await sio.emit('typing_indicator', {
-                    'conversation_id': conversation_id,
-                    'is_typing': True
-                }, room=sid)
-                
-                # Get AI response
-                start_time = datetime.utcnow()
-                ai_response = await ai_service.generate_response(
-                    user_message=content,
-                    conversation_id=conversation_id,
-                    user_id=user_id,
-                    db=db
-                )
-                processing_time = (datetime.utcnow() - start_time).total_seconds() * 1000
-                
-                # Create AI message
-                ai_message = Message(
-                    content=ai_response['content'],
-                    role='assistant',
-                    conversation_id=conversation_id,
-                    timestamp=datetime.utcnow(),
-                    metadata={
-                        'processing_time': processing_time,
-                        'confidence': ai_response.get('confidence', 0.9),
-                        'context_used': ai_response.get('context_used', False)
-                    }
+                job = generation_scheduler.submit(
+                    user_id,
+                    sid,
+                    lambda: generate_reply(sid, user_id, conversation_id, conversation_uuid, content, prepared)
                 )
-                
-                db.add(ai_message)
-                
-                # Update conversation
-                conversation.message_count += 2  # user + assistant
-                conversation.updated_at = datetime.utcnow()
-                
-                # Update context if provided
-                if ai_response.get('context'):
-                    conversation.context_summary = ai_response['context'].get('summary')
-                    conversation.context_entities = ai_response['context'].get('entities', [])
-                    conversation.context_topics = ai_response['context'].get('topics', [])
-                
-                db.commit()
-                db.refresh(ai_message)
-                
-                # Stop typing indicator
-                await sio.emit('typing_indicator', {
+            except GenerationRejected as e:
+                TURN_ERRORS.labels(e.code).inc()
+                await emit_rejection(sid, conversation_id, e)
+                return
+            
+            # Create user message
+            user_message = Message(
+                id=uuid.uuid4(),
+                content=content,
+                role='user',
+                conversation_id=conversation_uuid,
+                timestamp=datetime.utcnow(),
+                message_metadata=token_metadata(content)
+            )
+            
+            # Queue it for the next group commit; generation doesn't wait for it
+            try:
+                with observe_stage("user_message_enqueue"):
+                    user_message_ack = persistence.submit(single_row_batch(user_message))
+                    await context_cache.append_messages(conversation_id, [message_entry(user_message)])
+                    context_cache.revalidate_after(user_message_ack, conversation_id=conversation_id)
+                    await replica_router.mark_write(user_id)
+                prepared.set_result(user_message_ack)
+            finally:
+                # Never leave a scheduled job waiting on a message that wasn't recorded
+                if not prepared.done():
+                    prepared.cancel()
+            
+            # Send user message confirmation
+            await sio.emit('message_received', {
+                'id': str(user_message.id),
+                'content': user_message.content,
+                'role': user_message.role,
+                'timestamp': user_message.timestamp.isoformat(),
+                'conversation_id': str(user_message.conversation_id)
+            }, room=sid)
+            
+            if not job.started:
+                await sio.emit('queued', {
                     'conversation_id': conversation_id,
-                    'is_typing': False
-                }, room=sid)
-                
-                # Send AI response
-                await sio.emit('message_received', {
-                    'id': str(ai_message.id),
-                    'content': ai_message.content,
-                    'role': ai_message.role,
-                    'timestamp': ai_message.timestamp.isoformat(),
-                    'conversation_id': str(ai_message.conversation_id),
-                    'metadata': ai_message.metadata
+                    'message_id': str(user_message.id),
+                    'position': job.position,
+                    'queue_depth': generation_scheduler.queue_depth
                 }, room=sid)
-                
-            finally:
-                db.close()
+            
+            try:
+                await job
+                TURN_SECONDS.observe(time.perf_counter() - received_at)
+            except GenerationRejected as e:
+                TURN_ERRORS.labels(e.code).inc()
+                await emit_rejection(sid, conversation_id, e)
+            except asyncio.CancelledError:
+                # Cancelled because the socket went away; nobody is left to notify
+                if not job.future.cancelled():
+                    raise
                 
         except Exception as e:
+            TURN_ERRORS.labels("error").inc()
             print(f"Error in send_message: {e}")
-            await sio.emit('error', {'message': 'An error occurred processing your message'}, room=sid)
\ No newline at end of file
+            await sio.emit('error', {'message': 'An error occurred processing your message'}, room=sid)
+    
+    async def emit_rejection(sid, conversation_id, rejection: GenerationRejected):
+        await sio.emit('error', {
+            'message': rejection.message,
+            'code': rejection.code,
+            'retry_after': rejection.retry_after,
+            'conversation_id': conversation_id
+        }, room=sid)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""End-to-end load and latency benchmark for the REST and Socket.IO paths.
+
+Simulates N concurrent users who register, log in, create a
+conversation, send messages over Socket.IO and page through the history.
+Reports throughput and p50/p95/p99 latency per endpoint/event, writes the
+results as JSON and compares them against a stored baseline.
+
+By default the real app runs in-process against SQLite and fakeredis, so
+no services are needed; pass --url to drive an already running server
+(e.g. one backed by Postgres and Redis) instead.
+
+    python -m benchmarks.e2e_load --users 20 --messages 5 --output results.json
+    python -m benchmarks.e2e_load --save-baseline benchmarks/baseline.json
+    python -m benchmarks.e2e_load --baseline benchmarks/baseline.json  # exits 1 on regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+import socketio
+
+SOCKETIO_PATH = "/ws/socket.io"
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class Recorder:
+    """Latency samples and error counts per operation"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, operation: str, started: float):
+        self.samples[operation].append((time.perf_counter() - started) * 1000)
+
+    def error(self, operation: str):
+        self.errors[operation] += 1
+
+    def summary(self, duration: float) -> dict:
+        results = {}
+        for operation in sorted(set(self.samples) | set(self.errors)):
+            samples = self.samples.get(operation, [])
+            results[operation] = {
+                "count": len(samples),
+                "errors": self.errors.get(operation, 0),
+                "throughput_per_s": round(len(samples) / duration, 2) if duration else 0.0,
+                "mean_ms": round(sum(samples) / len(samples), 2) if samples else None,
+                "p50_ms": round(percentile(samples, 50), 2) if samples else None,
+                "p95_ms": round(percentile(samples, 95), 2) if samples else None,
+                "p99_ms": round(percentile(samples, 99), 2) if samples else None,
+            }
+        return results
+
+class SocketTurns:
+    """Socket.IO client that sends one message at a time and times its events"""
+
+    def __init__(self, recorder: Recorder):
+        self.recorder = recorder
+        self.client = socketio.AsyncClient(reconnection=False)
+        self._turn = None
+        self.client.on("message_received", self._on_received)
+        self.client.on("message_chunk", self._on_chunk)
+        self.client.on("message_complete", self._on_complete)
+        self.client.on("error", self._on_error)
+
+    async def connect(self, url: str, token: str, transports=("websocket",)):
+        # Websocket only: polling requests for one session may reach different workers
+        started = time.perf_counter()
+        await self.client.connect(url, auth={"token": token}, socketio_path=SOCKETIO_PATH, transports=list(transports))
+        self.recorder.record("socket connect", started)
+
+    async def _on_received(self, data):
+        if self._turn and not self._turn["received"]:
+            self._turn["received"] = True
+            self.recorder.record("socket message_received", self._turn["started"])
+
+    async def _on_chunk(self, data):
+        if self._turn and not self._turn["first_chunk"]:
+            self._turn["first_chunk"] = True
+            self.recorder.record("socket first message_chunk", self._turn["started"])
+
+    async def _on_complete(self, data):
+        if self._turn and not self._turn["done"].done():
+            self.recorder.record("socket send_message -> message_complete", self._turn["started"])
+            self._turn["done"].set_result(data)
+
+    async def _on_error(self, data):
+        if self._turn and not self._turn["done"].done():
+            self._turn["done"].set_exception(RuntimeError(data.get("message", "error")))
+
+    async def send(self, conversation_id: str, content: str, timeout: float):
+        self._turn = {
+            "started": time.perf_counter(),
+            "received": False,
+            "first_chunk": False,
+            "done": asyncio.get_running_loop().create_future()
+        }
+        await self.client.emit("send_message", {"conversation_id": conversation_id, "content": content})
+        try:
+            await asyncio.wait_for(self._turn["done"], timeout)
+        except Exception:
+            self.recorder.error("socket send_message -> message_complete")
+        finally:
+            self._turn = None
+
+    async def close(self):
+        await self.client.disconnect()
+
+async def timed_request(recorder: Recorder, operation: str, request) -> httpx.Response:
+    started = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        recorder.error(operation)
+        raise
+    if response.status_code >= 400:
+        recorder.error(operation)
+        response.raise_for_status()
+    recorder.record(operation, started)
+    return response
+
+async def simulate_user(index: int, args, http: httpx.AsyncClient, recorder: Recorder, run_id: str):
+    await asyncio.sleep(args.ramp * index / max(1, args.users))
+    email = f"bench-{run_id}-{index}@example.com"
+    password = "benchmark-password"
+
+    await timed_request(recorder, "POST /auth/register", http.post(
+        "/auth/register", json={"email": email, "name": f"Bench User {index}", "password": password}
+    ))
+    response = await timed_request(recorder, "POST /auth/login", http.post(
+        "/auth/login", data={"username": email, "password": password}
+    ))
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = await timed_request(recorder, "POST /conversations", http.post(
+        "/conversations/", json={"title": f"Benchmark {index}"}, headers=headers
+    ))
+    conversation_id = response.json()["id"]
+
+    turns = SocketTurns(recorder)
+    await turns.connect(args.url, token)
+    try:
+        for turn in range(args.messages):
+            await turns.send(conversation_id, args.prompts[turn % len(args.prompts)], args.turn_timeout)
+    finally:
+        await turns.close()
+
+    response = await timed_request(recorder, "GET /conversations", http.get(
+        "/conversations/", params={"preview": "true"}, headers=headers
+    ))
+    # Sidebar poll: unchanged list revalidates with the ETag
+    await timed_request(recorder, "GET /conversations (If-None-Match)", http.get(
+        "/conversations/",
+        params={"preview": "true"},
+        headers={**headers, "If-None-Match": response.headers.get("etag", "")}
+    ))
+    cursor = None
+    while True:
+        params = {"limit": args.page_size}
+        if cursor:
+            params["before"] = cursor
+        response = await timed_request(recorder, "GET /conversations/{id}/messages", http.get(
+            f"/conversations/{conversation_id}/messages", params=params, headers=headers
+        ))
+        page = response.json()
+        if not page["has_more"]:
+            break
+        cursor = page["before_cursor"]
+
+async def run_load(args) -> dict:
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.turn_timeout) as http:
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(simulate_user(index, args, http, recorder, run_id) for index in range(args.users)),
+            return_exceptions=True
+        )
+        duration = time.perf_counter() - started
+
+    failed = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    for outcome in failed[:3]:
+        print(f"User scenario failed: {outcome!r}")
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": git_commit(),
+        "config": {
+            "users": args.users,
+            "messages": args.messages,
+            "page_size": args.page_size,
+            "target": args.url if args.external else "in-process (sqlite + fakeredis)",
+        },
+        "duration_s": round(duration, 3),
+        "failed_users": len(failed),
+        "results": recorder.summary(duration),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def run_in_process(args) -> dict:
+    """Start the real app on SQLite and fakeredis inside this process and drive it"""
+    import fakeredis.aioredis
+    import uvicorn
+
+    # Swap the Redis client before any module that imports it is loaded
+    from backend import database
+    database.redis_client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    from backend.ai_service import AIService
+    from backend.main import app
+
+    AIService.FIRST_TOKEN_DELAY = args.first_token_delay
+    AIService.TOKEN_DELAY = args.token_delay
+
+    port = free_port()
+    args.url = f"http://127.0.0.1:{port}"
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+    try:
+        return await run_load(args)
+    finally:
+        server.should_exit = True
+        await serving
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Return regressions: p95 slower or throughput lower than the baseline beyond tolerance"""
+    regressions = []
+    # Throughput is only comparable for the same workload
+    same_workload = results["config"] == baseline.get("config")
+    if not same_workload:
+        print("Baseline was recorded with a different workload; comparing latency only")
+    for operation, current in results["results"].items():
+        previous = baseline.get("results", {}).get(operation)
+        if not previous or current["p95_ms"] is None or previous["p95_ms"] is None:
+            continue
+        if (current["p95_ms"] > previous["p95_ms"] * (1 + tolerance)
+                and current["p95_ms"] - previous["p95_ms"] > min_delta_ms):
+            regressions.append(f"{operation}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if same_workload and current["throughput_per_s"] < previous["throughput_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{operation}: throughput {previous['throughput_per_s']} -> {current['throughput_per_s']}/s"
+            )
+        if same_workload and current["errors"] > previous["errors"]:
+            regressions.append(f"{operation}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+def print_table(results: dict):
+    print(f"\n{results['config']['users']} users x {results['config']['messages']} messages "
+          f"in {results['duration_s']}s ({results['failed_users']} failed)")
+    print(f"{'operation':<42}{'count':>7}{'err':>5}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for operation, stats in results["results"].items():
+        def fmt(value):
+            return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+        print(f"{operation:<42}{stats['count']:>7}{stats['errors']:>5}{stats['throughput_per_s']:>9.1f}"
+              f"{fmt(stats['p50_ms'])}{fmt(stats['p95_ms'])}{fmt(stats['p99_ms'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5, help="Socket.IO messages per user")
+    parser.add_argument("--page-size", type=int, default=4, help="history page size")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which users start")
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--url", default=None, help="drive a running server instead of an in-process one")
+    parser.add_argument("--first-token-delay", type=float, default=0.0, help="simulated model TTFT (in-process only)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="simulated model per-token delay (in-process only)")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--baseline", default=None, help="compare against this results JSON")
+    parser.add_argument("--save-baseline", default=None, help="write results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore p95 changes smaller than this")
+    args = parser.parse_args()
+    args.external = args.url is not None
+    args.prompts = [
+        "Hello!",
+        "I prefer short answers about machine learning, please remember that.",
+        "What's the weather like?",
+        "Can you explain how neural networks learn?",
+        "Thanks!",
+    ]
+
+    if args.external:
+        results = asyncio.run(run_load(args))
+    else:
+        # Fresh database per run; must be configured before the app is imported
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='e2e-load-')}/bench.db"
+        os.environ.setdefault("PASSWORD_HASH_QUEUE_LIMIT", str(max(64, 2 * args.users)))
+        results = asyncio.run(run_in_process(args))
+
+    print_table(results)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Local OpenAI-compatible LLM provider for offline latency/throughput runs.
+
+Serves /v1/chat/completions (streamed and non-streamed) with a
+configurable time to first token, per-token delay, a slow tail and an
+error rate, so retries, hedging and streaming can be exercised without a
+real model. Point the backend at it with:
+
+    python -m benchmarks.mock_llm_server --port 8900 --slow-fraction 0.05
+    LLM_PROVIDER=openai LLM_BASE_URL=http://localhost:8900/v1 python run_backend.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "sure here is what I found about that based on our earlier conversation "
+    "and the preferences you shared let me know if you want more detail"
+).split()
+
+def create_app(
+    ttft_ms: float = 200.0,
+    token_ms: float = 30.0,
+    tokens: int = 40,
+    slow_fraction: float = 0.0,
+    slow_ms: float = 2000.0,
+    error_rate: float = 0.0
+) -> FastAPI:
+    app = FastAPI(title="Mock LLM provider")
+    stats = {"requests": 0, "streams": 0, "errors": 0, "slow": 0}
+
+    def first_token_delay() -> float:
+        if random.random() < slow_fraction:
+            stats["slow"] += 1
+            return slow_ms / 1000
+        return ttft_ms / 1000
+
+    def reply_tokens(max_tokens: int):
+        count = min(tokens, max_tokens)
+        return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", **stats}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": {"message": "mock overload"}}, status_code=503, headers={"Retry-After": "0"})
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "mock")
+        words = reply_tokens(body.get("max_tokens") or tokens)
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token_delay() + token_ms / 1000 * max(0, len(words) - 1))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": {"completion_tokens": len(words)}
+            }
+
+        stats["streams"] += 1
+
+        async def events():
+            await asyncio.sleep(first_token_delay())
+            for index, word in enumerate(words):
+                if index:
+                    await asyncio.sleep(token_ms / 1000)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="time to first token")
+    parser.add_argument("--token-ms", type=float, default=30.0, help="delay between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per reply")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="share of requests with a slow first token")
+    parser.add_argument("--slow-ms", type=float, default=2000.0, help="first-token delay of slow requests")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    args = parser.parse_args()
+
+    app = create_app(args.ttft_ms, args.token_ms, args.tokens, args.slow_fraction, args.slow_ms, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
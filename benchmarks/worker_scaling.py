@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Throughput of the production launcher at increasing worker counts.
+
+For each worker count the server is started with run_production.py and
+a set of client processes drive it, reporting aggregate throughput and
+the speed-up over the first worker count.
+
+The "http" scenario hammers one endpoint for a fixed duration (point
+--path at an authenticated route, with --token, to include the DB/Redis
+path). The "chat" scenario is the Socket.IO scale-out path: each client
+process registers users and creates their conversations (untimed), then
+every user connects a socket and sends --messages turns, waiting for
+each message_complete. It reports turns/second and connect/turn latency.
+
+Without Postgres and Redis at hand, --fake-services runs the workers
+against a shared SQLite file and an in-process fakeredis TCP server.
+
+    python -m benchmarks.worker_scaling --workers 1 2 4 --clients 4
+    python -m benchmarks.worker_scaling --scenario chat --workers 1 2 4 --fake-services
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.e2e_load import Recorder, SocketTurns, free_port, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TURN = "socket send_message -> message_complete"
+CONNECT = "socket connect"
+PROMPTS = [
+    "Hello!",
+    "Can you explain how neural networks learn?",
+    "What's the weather like?",
+    "Thanks!",
+]
+
+async def _client_loop(url: str, headers: dict, duration: float, concurrency: int) -> int:
+    done = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=10.0) as client:
+        async def worker():
+            nonlocal done
+            while time.perf_counter() < deadline:
+                response = await client.get(url, headers=headers)
+                if response.status_code < 500:
+                    done += 1
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return done
+
+def _client_process(url, headers, duration, concurrency, results):
+    results.put(asyncio.run(_client_loop(url, headers, duration, concurrency)))
+
+async def _chat_loop(base: str, client_index: int, args) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    async with httpx.AsyncClient(base_url=base, timeout=args.turn_timeout) as http:
+        async def setup(index: int):
+            response = await http.post("/auth/register", json={
+                "email": f"scale-{run_id}-{client_index}-{index}@example.com",
+                "name": f"Scale User {index}",
+                "password": "benchmark-password"
+            })
+            response.raise_for_status()
+            token = response.json()["access_token"]
+            response = await http.post(
+                "/conversations/", json={"title": "Scaling"}, headers={"Authorization": f"Bearer {token}"}
+            )
+            response.raise_for_status()
+            return token, response.json()["id"]
+        users = await asyncio.gather(*(setup(index) for index in range(args.users)))
+
+    recorder = Recorder()
+    async def chat(token: str, conversation_id: str):
+        turns = SocketTurns(recorder)
+        try:
+            await turns.connect(base, token, args.transports)
+        except Exception:
+            recorder.error(CONNECT)
+            raise
+        try:
+            for turn in range(args.messages):
+                await turns.send(conversation_id, PROMPTS[turn % len(PROMPTS)], args.turn_timeout)
+        finally:
+            await turns.close()
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(chat(*user) for user in users), return_exceptions=True)
+    return {
+        "duration": time.perf_counter() - started,
+        "samples": dict(recorder.samples),
+        "errors": dict(recorder.errors),
+        "failed": sum(isinstance(outcome, BaseException) for outcome in outcomes)
+    }
+
+def _chat_process(base, client_index, args, results):
+    results.put(asyncio.run(_chat_loop(base, client_index, args)))
+
+def wait_until_ready(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+def start_fake_services() -> dict:
+    """Serve fakeredis over TCP from this process; returns the environment for the server"""
+    from fakeredis import TcpFakeServer
+
+    port = free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return {"REDIS_URL": f"redis://127.0.0.1:{port}/0"}
+
+def run_clients(target, client_args, count: int) -> list:
+    results = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(target=target, args=(*client_args(index), results))
+        for index in range(count)
+    ]
+    for client in clients:
+        client.start()
+    outcomes = [results.get() for _ in clients]
+    for client in clients:
+        client.join()
+    return outcomes
+
+def measure(workers: int, args) -> dict:
+    env = dict(os.environ, **args.server_env)
+    data_dir = None
+    if args.fake_services:
+        # A fresh database per worker count, shared by that server's workers
+        data_dir = tempfile.mkdtemp(prefix="worker-scaling-")
+        env["DATABASE_URL"] = f"sqlite:///{data_dir}/bench.db"
+    server = subprocess.Popen(
+        [sys.executable, "run_production.py", "--workers", str(workers), "--port", str(args.port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        wait_until_ready(base + "/health")
+        if args.scenario == "http":
+            headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+            counts = run_clients(
+                _client_process,
+                lambda index: (base + args.path, headers, args.duration, args.concurrency),
+                args.clients
+            )
+            return {"throughput": sum(counts) / args.duration}
+
+        outcomes = run_clients(_chat_process, lambda index: (base, index, args), args.clients)
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        for outcome in outcomes:
+            for operation, values in outcome["samples"].items():
+                samples[operation].extend(values)
+            for operation, count in outcome["errors"].items():
+                errors[operation] += count
+        duration = max(outcome["duration"] for outcome in outcomes)
+        turns = samples.get(TURN, [])
+        connects = samples.get(CONNECT, [])
+        return {
+            "throughput": len(turns) / duration,
+            "turns": len(turns),
+            "failed_users": sum(outcome["failed"] for outcome in outcomes),
+            "errors": sum(errors.values()),
+            "connect_p50": percentile(connects, 50) if connects else None,
+            "turn_p50": percentile(turns, 50) if turns else None,
+            "turn_p95": percentile(turns, 95) if turns else None,
+        }
+    finally:
+        server.terminate()
+        server.wait()
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=["http", "chat"], default="http")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="http: in-flight requests per client")
+    parser.add_argument("--duration", type=float, default=10.0, help="http: seconds per run")
+    parser.add_argument("--path", default="/health", help="http: endpoint to request")
+    parser.add_argument("--token", default=None, help="http: bearer token for --path")
+    parser.add_argument("--users", type=int, default=8, help="chat: socket users per client process")
+    parser.add_argument("--messages", type=int, default=4, help="chat: turns per user")
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--transport",
+        choices=["websocket", "polling"],
+        default="websocket",
+        help="chat: a polling session whose requests reach different workers breaks"
+    )
+    parser.add_argument("--fake-services", action="store_true", help="use SQLite and a fakeredis server")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    args.transports = ["polling", "websocket"] if args.transport == "polling" else ["websocket"]
+    args.server_env = start_fake_services() if args.fake_services else {}
+
+    baseline = None
+    for workers in args.workers:
+        result = measure(workers, args)
+        baseline = baseline or result["throughput"]
+        speedup = result["throughput"] / baseline if baseline else 0.0
+        if args.scenario == "http":
+            print(f"workers={workers}  req/s={result['throughput']:.0f}  speedup={speedup:.2f}x")
+            continue
+        def ms(value):
+            return f"{value:.0f}ms" if value is not None else "-"
+        print(
+            f"workers={workers}  turns/s={result['throughput']:.1f}  speedup={speedup:.2f}x  "
+            f"turns={result['turns']}  errors={result['errors']}  failed_users={result['failed_users']}  "
+            f"connect_p50={ms(result['connect_p50'])}  turn_p50={ms(result['turn_p50'])}  turn_p95={ms(result['turn_p95'])}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the backend with multiple worker processes")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count())))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    
+    # Workers (and other nodes) share Socket.IO rooms through Redis; sessions
+    # already live in Redis. Every engine.io request of a long-polling
+    # session must reach the same process, which the workers behind this one
+    # port can't guarantee: clients connect with the websocket transport only
+    # (as the frontend does), or a proxy with sticky sessions must route each
+    # worker on its own port.
+    if args.workers > 1 and not os.environ.get("SOCKETIO_MESSAGE_QUEUE"):
+        os.environ["SOCKETIO_MESSAGE_QUEUE"] = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+    
+    # Each worker writes its Prometheus samples here so /metrics on any worker covers all of them
+    if args.workers > 1 and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        metrics_dir = tempfile.mkdtemp(prefix="prometheus-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    else:
+        metrics_dir = None
+    
+    # Create the schema once; workers creating it concurrently on a fresh database collide
+    if args.workers > 1:
+        from backend.database import init_db, close_db
+        
+        async def prepare_database():
+            await init_db()
+            await close_db()
+        asyncio.run(prepare_database())
+    
+    try:
+        uvicorn.run(
+            "backend.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level=args.log_level,
+            proxy_headers=True
+        )
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect, useLayoutEffect, useRef } from 'react';
 import { useSocket } from '../../contexts/SocketContext';
 import { conversationAPI } from '../../lib/api';
 import { Message, Conversation } from '../../types';
@@ -14,9 +14,19 @@ export const ChatInterface: React.FC = () => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [isTyping, setIsTyping] = useState(false);
   const [loading, setLoading] = useState(true);
+  const [conversationCursor, setConversationCursor] = useState<string | null>(null);
+  const [loadingConversations, setLoadingConversations] = useState(false);
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const messagesContainerRef = useRef<HTMLDivElement>(null);
+  const activeConversationRef = useRef<string | null>(null);
+  // Scroll height before older messages were prepended, to keep the viewport in place
+  const prependedFromHeight = useRef<number | null>(null);
+  // A freshly loaded page jumps to the bottom instead of scrolling past the top
+  const jumpToBottom = useRef(false);
   
-  const { sendMessage, onMessageReceived, onTypingIndicator } = useSocket();
+  const { sendMessage, onMessageReceived, onMessageChunk, onMessageComplete, onTypingIndicator, onQueued, onError } = useSocket();
 
   // Load conversations on mount
   useEffect(() => {
@@ -30,24 +40,81 @@ export const ChatInterface: React.FC = () => {
       setIsTyping(false);
     });
 
+    onMessageChunk((chunk) => {
+      setIsTyping(false);
+      setMessages(prev => {
+        const index = prev.findIndex(m => m.id === chunk.id);
+        if (index === -1) {
+          return [...prev, {
+            id: chunk.id,
+            content: chunk.content,
+            role: 'assistant',
+            timestamp: new Date().toISOString(),
+            conversationId: chunk.conversation_id,
+          }];
+        }
+        const updated = [...prev];
+        updated[index] = { ...updated[index], content: updated[index].content + chunk.content };
+        return updated;
+      });
+    });
+
+    onMessageComplete((message: Message) => {
+      setIsTyping(false);
+      setMessages(prev => {
+        const index = prev.findIndex(m => m.id === message.id);
+        if (index === -1) {
+          return [...prev, message];
+        }
+        const updated = [...prev];
+        updated[index] = message;
+        return updated;
+      });
+    });
+
     onTypingIndicator((data) => {
       if (data.conversationId === activeConversation) {
         setIsTyping(data.isTyping);
       }
     });
-  }, [activeConversation, onMessageReceived, onTypingIndicator]);
 
-  // Auto scroll to bottom
-  useEffect(() => {
+    onQueued((data) => {
+      if (data.conversation_id === activeConversation) {
+        setIsTyping(true);
+      }
+    });
+
+    onError((error) => {
+      setIsTyping(false);
+      console.error('Message failed:', error.message);
+    });
+  }, [activeConversation, onMessageReceived, onMessageChunk, onMessageComplete, onTypingIndicator, onQueued, onError]);
+
+  // Auto scroll to bottom, except when older messages were prepended above
+  useLayoutEffect(() => {
+    const container = messagesContainerRef.current;
+    if (prependedFromHeight.current !== null && container) {
+      container.scrollTop += container.scrollHeight - prependedFromHeight.current;
+      prependedFromHeight.current = null;
+      return;
+    }
+    if (jumpToBottom.current && container) {
+      container.scrollTop = container.scrollHeight;
+      jumpToBottom.current = false;
+      return;
+    }
     scrollToBottom();
   }, [messages, isTyping]);
 
   const loadConversations = async () => {
     try {
-      const data = await conversationAPI.getConversations();
+      const page = await conversationAPI.getConversationPage();
+      const data = page.conversations;
       setConversations(data);
+      setConversationCursor(page.has_more ? page.next_cursor ?? null : null);
       if (data.length > 0) {
         setActiveConversation(data[0].id);
+        activeConversationRef.current = data[0].id;
         loadMessages(data[0].id);
       }
     } catch (error) {
@@ -57,21 +124,70 @@ export const ChatInterface: React.FC = () => {
     }
   };
 
+  const loadMoreConversations = async () => {
+    if (!conversationCursor || loadingConversations) return;
+    setLoadingConversations(true);
+    try {
+      const page = await conversationAPI.getConversationPage({ before: conversationCursor });
+      setConversations(prev => {
+        const known = new Set(prev.map(c => c.id));
+        return [...prev, ...page.conversations.filter(c => !known.has(c.id))];
+      });
+      setConversationCursor(page.has_more ? page.next_cursor ?? null : null);
+    } catch (error) {
+      console.error('Failed to load more conversations:', error);
+    } finally {
+      setLoadingConversations(false);
+    }
+  };
+
   const loadMessages = async (conversationId: string) => {
+    setOlderCursor(null);
     try {
-      const data = await conversationAPI.getMessages(conversationId);
-      setMessages(data);
+      const page = await conversationAPI.getMessagePage(conversationId);
+      if (activeConversationRef.current !== conversationId) return;
+      jumpToBottom.current = true;
+      setMessages(page.messages);
+      setOlderCursor(page.has_more ? page.before_cursor ?? null : null);
     } catch (error) {
       console.error('Failed to load messages:', error);
     }
   };
 
+  const loadOlderMessages = async () => {
+    const conversationId = activeConversation;
+    if (!conversationId || !olderCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const page = await conversationAPI.getMessagePage(conversationId, { before: olderCursor });
+      if (activeConversationRef.current !== conversationId) return;
+      prependedFromHeight.current = messagesContainerRef.current?.scrollHeight ?? null;
+      setMessages(prev => {
+        const known = new Set(prev.map(m => m.id));
+        return [...page.messages.filter(m => !known.has(m.id)), ...prev];
+      });
+      setOlderCursor(page.has_more ? page.before_cursor ?? null : null);
+    } catch (error) {
+      console.error('Failed to load older messages:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
+  const handleMessagesScroll = (event: React.UIEvent<HTMLDivElement>) => {
+    if (event.currentTarget.scrollTop < 100) {
+      loadOlderMessages();
+    }
+  };
+
   const createNewConversation = async () => {
     try {
       const newConversation = await conversationAPI.createConversation();
       setConversations(prev => [newConversation, ...prev]);
       setActiveConversation(newConversation.id);
+      activeConversationRef.current = newConversation.id;
       setMessages([]);
+      setOlderCursor(null);
     } catch (error) {
       console.error('Failed to create conversation:', error);
     }
@@ -79,6 +195,7 @@ export const ChatInterface: React.FC = () => {
 
   const selectConversation = async (conversationId: string) => {
     setActiveConversation(conversationId);
+    activeConversationRef.current = conversationId;
     await loadMessages(conversationId);
   };
 
@@ -91,10 +208,13 @@ export const ChatInterface: React.FC = () => {
         const remaining = conversations.filter(c => c.id !== conversationId);
         if (remaining.length > 0) {
           setActiveConversation(remaining[0].id);
+          activeConversationRef.current = remaining[0].id;
           loadMessages(remaining[0].id);
         } else {
           setActiveConversation(null);
+          activeConversationRef.current = null;
           setMessages([]);
+          setOlderCursor(null);
         }
       }
     } catch (error) {
@@ -144,6 +264,9 @@ export const ChatInterface: React.FC = () => {
         onSelectConversation={selectConversation}
         onNewConversation={createNewConversation}
         onDeleteConversation={deleteConversation}
+        hasMoreConversations={conversationCursor !== null}
+        loadingMoreConversations={loadingConversations}
+        onLoadMoreConversations={loadMoreConversations}
       />
       
       <div className="flex-1 flex flex-col">
@@ -158,7 +281,15 @@ export const ChatInterface: React.FC = () => {
         </div>
 
         {/* Messages Area */}
-        <div className="flex-1 overflow-y-auto p-6 space-y-4">
+        <div
+          ref={messagesContainerRef}
+          onScroll={handleMessagesScroll}
+          className="flex-1 overflow-y-auto p-6 space-y-4"
+        >
+          {loadingOlder && (
+            <div className="text-center text-sm text-gray-400">Loading earlier messages...</div>
+          )}
+          
           {messages.length === 0 && activeConversation && (
             <div className="text-center py-12">
               <div className="text-gray-500 text-lg mb-2">Start a conversation</div>
@@ -11,6 +11,9 @@ interface SidebarProps {
   onSelectConversation: (id: string) => void;
   onNewConversation: () => void;
   onDeleteConversation: (id: string) => void;
+  hasMoreConversations: boolean;
+  loadingMoreConversations: boolean;
+  onLoadMoreConversations: () => void;
 }
 
 export const Sidebar: React.FC<SidebarProps> = ({
@@ -19,6 +22,9 @@ export const Sidebar: React.FC<SidebarProps> = ({
   onSelectConversation,
   onNewConversation,
   onDeleteConversation,
+  hasMoreConversations,
+  loadingMoreConversations,
+  onLoadMoreConversations,
 }) => {
   const { user, logout } = useAuth();
   const [isCollapsed, setIsCollapsed] = useState(false);
@@ -45,7 +51,15 @@ export const Sidebar: React.FC<SidebarProps> = ({
       </div>
 
       {/* Conversations List */}
-      <div className="flex-1 overflow-y-auto p-4 space-y-2">
+      <div
+        className="flex-1 overflow-y-auto p-4 space-y-2"
+        onScroll={(e) => {
+          const list = e.currentTarget;
+          if (hasMoreConversations && list.scrollHeight - list.scrollTop - list.clientHeight < 100) {
+            onLoadMoreConversations();
+          }
+        }}
+      >
         {conversations.map((conversation) => (
           <div
             key={conversation.id}
@@ -83,6 +97,15 @@ export const Sidebar: React.FC<SidebarProps> = ({
             )}
           </div>
         ))}
+        {hasMoreConversations && !isCollapsed && (
+          <button
+            onClick={onLoadMoreConversations}
+            disabled={loadingMoreConversations}
+            className="w-full p-2 text-sm text-gray-400 hover:text-white transition-colors"
+          >
+            {loadingMoreConversations ? 'Loading...' : 'Load older conversations'}
+          </button>
+        )}
       </div>
 
       {/* User Profile */}
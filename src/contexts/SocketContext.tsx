@@ -1,14 +1,18 @@
 import React, { createContext, useContext, useEffect, useState, ReactNode } from 'react';
 import { io, Socket } from 'socket.io-client';
 import { useAuth } from './AuthContext';
-import type { Message } from '../types';
+import type { Message, MessageChunk, GenerationQueued, SocketError } from '../types';
 
 interface SocketContextType {
   socket: Socket | null;
   isConnected: boolean;
   sendMessage: (conversationId: string, content: string) => void;
   onMessageReceived: (callback: (message: Message) => void) => void;
+  onMessageChunk: (callback: (chunk: MessageChunk) => void) => void;
+  onMessageComplete: (callback: (message: Message) => void) => void;
   onTypingIndicator: (callback: (data: { conversationId: string; isTyping: boolean }) => void) => void;
+  onQueued: (callback: (data: GenerationQueued) => void) => void;
+  onError: (callback: (error: SocketError) => void) => void;
 }
 
 const SocketContext = createContext<SocketContextType | undefined>(undefined);
@@ -37,6 +41,8 @@ export const SocketProvider: React.FC<SocketProviderProps> = ({ children }) => {
         auth: {
           token,
         },
+        // Long-polling requests of one session can land on different backend workers
+        transports: ['websocket'],
       });
 
       newSocket.on('connect', () => {
@@ -75,18 +81,50 @@ export const SocketProvider: React.FC<SocketProviderProps> = ({ children }) => {
     }
   };
 
+  const onMessageChunk = (callback: (chunk: MessageChunk) => void) => {
+    if (socket) {
+      socket.off('message_chunk');
+      socket.on('message_chunk', callback);
+    }
+  };
+
+  const onMessageComplete = (callback: (message: Message) => void) => {
+    if (socket) {
+      socket.off('message_complete');
+      socket.on('message_complete', callback);
+    }
+  };
+
   const onTypingIndicator = (callback: (data: { conversationId: string; isTyping: boolean }) => void) => {
     if (socket) {
       socket.on('typing_indicator', callback);
     }
   };
 
+  const onQueued = (callback: (data: GenerationQueued) => void) => {
+    if (socket) {
+      socket.off('queued');
+      socket.on('queued', callback);
+    }
+  };
+
+  const onError = (callback: (error: SocketError) => void) => {
+    if (socket) {
+      socket.off('error');
+      socket.on('error', callback);
+    }
+  };
+
   const value = {
     socket,
     isConnected,
     sendMessage,
     onMessageReceived,
+    onMessageChunk,
+    onMessageComplete,
     onTypingIndicator,
+    onQueued,
+    onError,
   };
 
   return <SocketContext.Provider value={value}>{children}</SocketContext.Provider>;
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import type { User, AuthResponse, Conversation, Message, APIError } from '../types';
+import type { User, AuthResponse, Conversation, ConversationPage, MessagePage, APIError } from '../types';
 
 const API_BASE_URL = 'http://localhost:8000';
 
@@ -58,8 +58,12 @@ export const authAPI = {
 };
 
 export const conversationAPI = {
-  getConversations: async (): Promise<Conversation[]> => {
-    const response = await api.get('/conversations');
+  getConversationPage: async (
+    params: { limit?: number; before?: string; preview?: boolean } = {}
+  ): Promise<ConversationPage> => {
+    // Newest first; pass next_cursor as `before` for older conversations.
+    // The browser revalidates with If-None-Match, so unchanged polls are cheap 304s
+    const response = await api.get('/conversations', { params });
     return response.data;
   },
 
@@ -73,8 +77,12 @@ export const conversationAPI = {
     return response.data;
   },
 
-  getMessages: async (conversationId: string): Promise<Message[]> => {
-    const response = await api.get(`/conversations/${conversationId}/messages`);
+  // Newest page by default; pass the page's before_cursor as `before` for older ones
+  getMessagePage: async (
+    conversationId: string,
+    params: { limit?: number; before?: string; after?: string } = {}
+  ): Promise<MessagePage> => {
+    const response = await api.get(`/conversations/${conversationId}/messages`, { params });
     return response.data;
   },
 
@@ -12,6 +12,7 @@ export interface UserPreferences {
   responseLength: 'short' | 'medium' | 'detailed';
   interests: string[];
   timezone: string;
+  responseCache?: boolean;
 }
 
 export interface Message {
@@ -27,6 +28,33 @@ export interface Message {
   };
 }
 
+export interface MessagePage {
+  messages: Message[];
+  has_more: boolean;
+  before_cursor?: string | null;
+  after_cursor?: string | null;
+}
+
+export interface MessageChunk {
+  id: string;
+  content: string;
+  conversation_id: string;
+}
+
+export interface GenerationQueued {
+  conversation_id: string;
+  message_id: string;
+  position: number;
+  queue_depth: number;
+}
+
+export interface SocketError {
+  message: string;
+  code?: 'overloaded' | 'too_many_pending' | 'timeout';
+  retry_after?: number;
+  conversation_id?: string;
+}
+
 export interface Conversation {
   id: string;
   title: string;
@@ -35,6 +63,13 @@ export interface Conversation {
   updatedAt: string;
   messageCount: number;
   context?: ConversationContext;
+  last_message_preview?: string | null;
+}
+
+export interface ConversationPage {
+  conversations: Conversation[];
+  has_more: boolean;
+  next_cursor?: string | null;
 }
 
 export interface ConversationContext {
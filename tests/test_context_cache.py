@@ -0,0 +1,136 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import fakeredis.aioredis
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from backend import context_cache as context_cache_module
+from backend.context_cache import ContextCache, message_entry
+from backend.database import Base, User, Conversation, Message
+
+def setup_store(monkeypatch, tmp_path):
+    monkeypatch.setattr(context_cache_module, "redis_client", fakeredis.aioredis.FakeRedis(decode_responses=True))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/cache.db")
+    return engine, async_sessionmaker(bind=engine, expire_on_commit=False)
+
+async def create_conversation(engine, sessions):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    user = User(id=uuid.uuid4(), email=f"{uuid.uuid4()}@example.com", name="Alice", hashed_password="x")
+    conversation = Conversation(id=uuid.uuid4(), user_id=user.id, title="Chat")
+    async with sessions() as db:
+        db.add_all([user, conversation])
+        await db.commit()
+    return str(user.id), str(conversation.id)
+
+def new_message(conversation_id: str) -> Message:
+    return Message(
+        id=uuid.uuid4(),
+        content="hello",
+        role="user",
+        conversation_id=uuid.UUID(conversation_id),
+        timestamp=datetime.utcnow(),
+        message_metadata={}
+    )
+
+async def recent_ids(cache, sessions, conversation_id, user_id):
+    async with sessions() as db:
+        snapshot = await cache.get_snapshot(db, conversation_id, user_id)
+    return [message["id"] for message in snapshot["conversation"]["recent_messages"]]
+
+async def settle(*caches):
+    for cache in caches:
+        await asyncio.gather(*cache._revalidations)
+
+def test_rebuild_before_commit_is_superseded_once_committed(monkeypatch, tmp_path):
+    engine, sessions = setup_store(monkeypatch, tmp_path)
+
+    async def run():
+        user_id, conversation_id = await create_conversation(engine, sessions)
+        writer, reader = ContextCache(), ContextCache()
+        await recent_ids(writer, sessions, conversation_id, user_id)
+
+        message = new_message(conversation_id)
+        ack = asyncio.get_running_loop().create_future()
+        await writer.append_messages(conversation_id, [message_entry(message)])
+        writer.revalidate_after(ack, conversation_id=conversation_id)
+
+        # The reader misses the published blob and rebuilds before the row is committed
+        await context_cache_module.redis_client.delete(writer._key("conv", conversation_id))
+        assert await recent_ids(reader, sessions, conversation_id, user_id) == []
+
+        async with sessions() as db:
+            db.add(message)
+            await db.commit()
+        ack.set_result(None)
+        await settle(writer)
+
+        assert await recent_ids(reader, sessions, conversation_id, user_id) == [str(message.id)]
+        assert await recent_ids(writer, sessions, conversation_id, user_id) == [str(message.id)]
+        await engine.dispose()
+
+    asyncio.run(run())
+
+def test_failed_write_drops_the_applied_part(monkeypatch, tmp_path):
+    engine, sessions = setup_store(monkeypatch, tmp_path)
+
+    async def run():
+        user_id, conversation_id = await create_conversation(engine, sessions)
+        writer, reader = ContextCache(), ContextCache()
+        message = new_message(conversation_id)
+        await recent_ids(writer, sessions, conversation_id, user_id)
+
+        ack = asyncio.get_running_loop().create_future()
+        await writer.append_messages(conversation_id, [message_entry(message)])
+        writer.revalidate_after(ack, conversation_id=conversation_id)
+        assert await recent_ids(reader, sessions, conversation_id, user_id) == [str(message.id)]
+
+        ack.set_exception(RuntimeError("commit failed"))
+        await settle(writer)
+
+        assert await recent_ids(reader, sessions, conversation_id, user_id) == []
+        assert await recent_ids(writer, sessions, conversation_id, user_id) == []
+        await engine.dispose()
+
+    asyncio.run(run())
+
+def test_update_without_predecessor_forces_a_rebuild(monkeypatch, tmp_path):
+    engine, sessions = setup_store(monkeypatch, tmp_path)
+
+    async def run():
+        user_id, conversation_id = await create_conversation(engine, sessions)
+        first, second = ContextCache(), ContextCache()
+        await recent_ids(first, sessions, conversation_id, user_id)
+        await recent_ids(second, sessions, conversation_id, user_id)
+
+        # Two updates from different workers: the second one doesn't hold the first's version
+        await first.update_conversation_fields(conversation_id, summary="first")
+        await second.update_conversation_fields(conversation_id, summary="second")
+        assert second._local.get(second._key("conv", conversation_id)) is None
+
+        async with sessions() as db:
+            snapshot = await second.get_snapshot(db, conversation_id, user_id)
+        version = int(await context_cache_module.redis_client.get(second._version_key("conv", conversation_id)))
+        assert second._local[second._key("conv", conversation_id)]["version"] == version
+        assert snapshot["conversation"]["summary"] is None  # rebuilt from the database
+        await engine.dispose()
+
+    asyncio.run(run())
+
+def test_unknown_conversation_leaves_no_version_counter(monkeypatch, tmp_path):
+    engine, sessions = setup_store(monkeypatch, tmp_path)
+
+    async def run():
+        user_id, _ = await create_conversation(engine, sessions)
+        cache = ContextCache()
+        made_up = str(uuid.uuid4())
+        async with sessions() as db:
+            assert await cache.get_snapshot(db, made_up, user_id) is None
+        assert await context_cache_module.redis_client.exists(cache._version_key("conv", made_up)) == 0
+        await engine.dispose()
+
+    asyncio.run(run())
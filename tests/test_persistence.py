@@ -0,0 +1,125 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from backend.database import Base, User, Conversation, Message
+from backend.persistence import DURABILITY_ENQUEUE, DURABILITY_FLUSH, PersistencePipeline, WriteBatch
+
+def make_sessions(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/persistence.db")
+    return engine, async_sessionmaker(bind=engine, expire_on_commit=False)
+
+async def create_conversation(engine, sessions) -> uuid.UUID:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    user = User(id=uuid.uuid4(), email=f"{uuid.uuid4()}@example.com", name="Alice", hashed_password="x")
+    conversation = Conversation(id=uuid.uuid4(), user_id=user.id, title="Chat", message_count=0)
+    async with sessions() as db:
+        db.add_all([user, conversation])
+        await db.commit()
+    return conversation.id
+
+def message_batch(conversation_id: uuid.UUID, message_id: uuid.UUID = None) -> WriteBatch:
+    batch = WriteBatch()
+    batch.add(Message(
+        id=message_id or uuid.uuid4(), content="hello", role="user",
+        conversation_id=conversation_id, timestamp=datetime.utcnow(), message_metadata={}
+    ))
+    batch.update_conversation(conversation_id, message_delta=1)
+    return batch
+
+async def stored(sessions, conversation_id):
+    async with sessions() as db:
+        messages = (await db.execute(
+            select(func.count()).select_from(Message).where(Message.conversation_id == conversation_id)
+        )).scalar()
+        count = (await db.execute(
+            select(Conversation.message_count).where(Conversation.id == conversation_id)
+        )).scalar()
+    return messages, count
+
+def test_concurrent_batches_share_one_commit(tmp_path):
+    engine, sessions = make_sessions(tmp_path)
+
+    async def run():
+        conversation_id = await create_conversation(engine, sessions)
+        pipeline = PersistencePipeline(session_factory=sessions, max_batch=100, max_delay=0.05)
+        acks = [pipeline.submit(message_batch(conversation_id)) for _ in range(10)]
+        await asyncio.gather(*acks)
+        assert pipeline.stats == {"batches": 10, "commits": 1, "rows": 10, "failures": 0}
+        # The counter moved by the sum of the merged deltas in one UPDATE
+        assert await stored(sessions, conversation_id) == (10, 10)
+        await pipeline.stop()
+        await engine.dispose()
+
+    asyncio.run(run())
+
+def test_group_is_flushed_at_max_batch(tmp_path):
+    engine, sessions = make_sessions(tmp_path)
+
+    async def run():
+        conversation_id = await create_conversation(engine, sessions)
+        pipeline = PersistencePipeline(session_factory=sessions, max_batch=4, max_delay=1.0)
+        started = asyncio.get_running_loop().time()
+        acks = [pipeline.submit(message_batch(conversation_id)) for _ in range(8)]
+        await asyncio.gather(*acks)
+        # Two full groups, neither waiting out max_delay
+        assert pipeline.stats["commits"] == 2
+        assert asyncio.get_running_loop().time() - started < 1.0
+        assert await stored(sessions, conversation_id) == (8, 8)
+        await pipeline.stop()
+        await engine.dispose()
+
+    asyncio.run(run())
+
+def test_failed_batch_fails_only_its_own_ack(tmp_path):
+    engine, sessions = make_sessions(tmp_path)
+
+    async def run():
+        conversation_id = await create_conversation(engine, sessions)
+        pipeline = PersistencePipeline(session_factory=sessions, max_batch=100, max_delay=0.05)
+        duplicate = uuid.uuid4()
+        await pipeline.write(message_batch(conversation_id, duplicate))
+
+        good = [pipeline.submit(message_batch(conversation_id)) for _ in range(3)]
+        bad = pipeline.submit(message_batch(conversation_id, duplicate))
+        await asyncio.gather(*good)
+        with pytest.raises(IntegrityError):
+            await bad
+        assert pipeline.stats["failures"] == 1
+        # The bad batch's counter update rolled back with its row
+        assert await stored(sessions, conversation_id) == (4, 4)
+        await pipeline.stop()
+        await engine.dispose()
+
+    asyncio.run(run())
+
+def test_enqueue_returns_before_the_commit_and_flush_after(tmp_path):
+    engine, sessions = make_sessions(tmp_path)
+
+    async def run():
+        conversation_id = await create_conversation(engine, sessions)
+        pipeline = PersistencePipeline(session_factory=sessions, max_batch=100, max_delay=0.2)
+
+        await pipeline.write(message_batch(conversation_id), DURABILITY_ENQUEUE)
+        assert await stored(sessions, conversation_id) == (0, 0)
+
+        await pipeline.write(message_batch(conversation_id), DURABILITY_FLUSH)
+        # Both were queued within one window, so the flush ack covers the earlier write too
+        assert await stored(sessions, conversation_id) == (2, 2)
+
+        # Stopping flushes anything still queued
+        await pipeline.write(message_batch(conversation_id), DURABILITY_ENQUEUE)
+        await pipeline.stop()
+        assert await stored(sessions, conversation_id) == (3, 3)
+        await engine.dispose()
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import fakeredis.aioredis
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from backend import context_cache as context_cache_module
+from backend import reaper as reaper_module
+from backend import semantic_memory as semantic_memory_module
+from backend.conversations import delete_conversation
+from backend.database import Base, User, Conversation, Message, UserMemory, MemoryEmbedding
+from backend.reaper import ConversationReaper
+
+def setup_store(monkeypatch, tmp_path):
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    for module in (reaper_module, context_cache_module, semantic_memory_module):
+        monkeypatch.setattr(module, "redis_client", redis)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/reaper.db")
+    return engine, async_sessionmaker(bind=engine, expire_on_commit=False), redis
+
+async def populate(engine, sessions):
+    """A user with a conversation to delete (5 messages, 3 memories) and one to keep"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    user = User(id=uuid.uuid4(), email=f"{uuid.uuid4()}@example.com", name="Alice", hashed_password="x")
+    doomed = Conversation(id=uuid.uuid4(), user_id=user.id, title="Doomed")
+    kept = Conversation(id=uuid.uuid4(), user_id=user.id, title="Kept")
+    rows = [user, doomed, kept]
+    for conversation, messages, memories in ((doomed, 5, 3), (kept, 1, 1)):
+        for index in range(messages):
+            rows.append(Message(
+                id=uuid.uuid4(), content=f"message {index}", role="user",
+                conversation_id=conversation.id, timestamp=datetime.utcnow(), message_metadata={}
+            ))
+        for index in range(memories):
+            memory = UserMemory(
+                id=uuid.uuid4(), user_id=user.id, memory_type="long_term", content=f"memory {index}",
+                importance_score=8, memory_metadata={"conversation_id": str(conversation.id)}
+            )
+            rows.append(memory)
+            rows.append(MemoryEmbedding(
+                memory_id=memory.id, user_id=user.id, model="hashing-64", vector=b"\0" * 256,
+                created_at=datetime.utcnow()
+            ))
+    async with sessions() as db:
+        db.add_all(rows)
+        await db.commit()
+    return user, doomed, kept
+
+async def count(sessions, model, *where):
+    async with sessions() as db:
+        return (await db.execute(select(func.count()).select_from(model).where(*where))).scalar()
+
+def test_delete_hides_memories_and_reaper_removes_rows(monkeypatch, tmp_path):
+    engine, sessions, _ = setup_store(monkeypatch, tmp_path)
+
+    async def run():
+        user, doomed, kept = await populate(engine, sessions)
+        async with sessions() as db:
+            await delete_conversation(doomed.id, user, db)
+
+        doomed_memory = UserMemory.memory_metadata["conversation_id"].as_string() == str(doomed.id)
+        kept_memory = UserMemory.memory_metadata["conversation_id"].as_string() == str(kept.id)
+        assert await count(sessions, UserMemory, doomed_memory, UserMemory.expires_at.is_not(None)) == 3
+        assert await count(sessions, UserMemory, kept_memory, UserMemory.expires_at.is_(None)) == 1
+
+        reaper = ConversationReaper(session_factory=sessions, batch_size=2, batch_delay=0)
+        await reaper.reap_pending()
+
+        assert await count(sessions, Conversation, Conversation.id == doomed.id) == 0
+        assert await count(sessions, Message, Message.conversation_id == doomed.id) == 0
+        assert await count(sessions, UserMemory, doomed_memory) == 0
+        assert await count(sessions, MemoryEmbedding) == 1
+        assert await count(sessions, Message, Message.conversation_id == kept.id) == 1
+        assert await count(sessions, UserMemory, kept_memory) == 1
+        assert reaper.stats == {"pending": 0, "reaped": 1, "messages": 5, "memories": 3, "failures": 0}
+        assert reaper.progress == {}
+        await engine.dispose()
+
+    asyncio.run(run())
+
+def test_conversation_locked_by_another_worker_is_skipped(monkeypatch, tmp_path):
+    engine, sessions, redis = setup_store(monkeypatch, tmp_path)
+
+    async def run():
+        user, doomed, _ = await populate(engine, sessions)
+        async with sessions() as db:
+            await delete_conversation(doomed.id, user, db)
+        await redis.set(f"reaper:lock:{doomed.id}", 1)
+
+        reaper = ConversationReaper(session_factory=sessions, batch_size=2, batch_delay=0)
+        await reaper.reap_pending()
+        assert reaper.stats["pending"] == 1 and reaper.stats["reaped"] == 0
+        assert await count(sessions, Message, Message.conversation_id == doomed.id) == 5
+
+        # Once the other worker's lock is gone the conversation is reaped
+        await redis.delete(f"reaper:lock:{doomed.id}")
+        await reaper.reap_pending()
+        assert reaper.stats["pending"] == 0 and reaper.stats["reaped"] == 1
+        assert await count(sessions, Conversation, Conversation.id == doomed.id) == 0
+        await engine.dispose()
+
+    asyncio.run(run())
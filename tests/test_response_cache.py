@@ -0,0 +1,65 @@
+import asyncio
+import os
+import uuid
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import fakeredis.aioredis
+
+from backend import response_cache as response_cache_module
+from backend.ai_service import AIService
+from backend.response_cache import ResponseCache
+from backend.semantic_memory import HashingEmbedder
+
+def make_context(name: str, memory: str):
+    return {
+        "user_profile": {"id": str(uuid.uuid4()), "name": name, "preferences": {}, "communication_style": "casual"},
+        "conversation_context": {"title": "Chat", "message_count": 0, "summary": None, "entities": [], "topics": []},
+        "memory": {
+            "short_term": {},
+            "long_term": [{"content": memory, "importance": 8, "created_at": None, "tokens": None}],
+            "semantic": [],
+            "related": []
+        }
+    }
+
+def test_same_message_from_different_users_is_not_shared(monkeypatch):
+    monkeypatch.setattr(response_cache_module, "redis_client", fakeredis.aioredis.FakeRedis(decode_responses=True))
+    cache = ResponseCache(HashingEmbedder(64), similarity_threshold=0.5)
+    service = AIService()
+    service.response_cache = cache
+    service.FIRST_TOKEN_DELAY = service.TOKEN_DELAY = 0
+    alice = make_context("Alice", "User expressed: my name is Alice")
+    bob = make_context("Bob", "User expressed: my name is Bob")
+
+    async def reply(context):
+        return "".join([chunk async for chunk in service._stream_ai_response("thanks", context, [], {})])
+
+    async def run():
+        await reply(alice)
+        assert cache.stats["stores"] == 1
+        # Same message and preferences, but Bob's prompt carries his own profile and memories
+        await reply(bob)
+        assert cache.stats["exact_hits"] == 0 and cache.stats["similar_hits"] == 0
+        alice_key = cache.key_for(alice["user_profile"]["id"], "thanks", alice, {}, "simulated", "closing", [])
+        bob_key = cache.key_for(bob["user_profile"]["id"], "thanks", bob, {}, "simulated", "closing", [])
+        assert alice_key.digest != bob_key.digest
+        # A user's own repeat is still served from the cache
+        await reply(alice)
+        assert cache.stats["exact_hits"] == 1
+
+    asyncio.run(run())
+
+def test_key_changes_with_summary_and_history():
+    cache = ResponseCache(HashingEmbedder(64))
+    context = make_context("Alice", "User expressed: my name is Alice")
+    user_id = context["user_profile"]["id"]
+
+    def key(history):
+        return cache.key_for(user_id, "thanks", context, {}, "simulated", "closing", history).digest
+
+    first = key(["m1", "m2"])
+    assert key(["m1", "m2"]) == first
+    assert key(["m1", "m3"]) != first
+    context["conversation_context"]["summary"] = "Alice asked about her order."
+    assert key(["m1", "m2"]) != first
@@ -0,0 +1,40 @@
+import asyncio
+import gzip
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+
+from backend.transfer import DECOMPRESS_CHUNK, ImportFormatError, ImportTooLargeError, ndjson_lines
+
+async def stream(data: bytes, size: int = 8192):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+async def collect(data: bytes, **limits):
+    return [line async for line in ndjson_lines(stream(data), **limits)]
+
+def test_gzipped_lines_are_split_across_chunks():
+    lines = [b'{"type":"message","n":%d}' % n for n in range(5000)]
+    data = gzip.compress(b"\n".join(lines) + b"\n")
+    assert asyncio.run(collect(data, max_line_bytes=1024)) == lines
+
+def test_gzip_bomb_is_rejected_by_decompressed_size():
+    # ~100 KB compressed, 100 MB inflated; only a bounded slice is ever inflated at once
+    bomb = gzip.compress(b"\n" * (100 * 1024 * 1024))
+    consumed = 0
+
+    async def run():
+        nonlocal consumed
+        async for _ in ndjson_lines(stream(bomb), max_line_bytes=1024, max_bytes=1024 * 1024):
+            consumed += 1
+
+    with pytest.raises(ImportTooLargeError):
+        asyncio.run(run())
+    assert consumed <= 1024 * 1024 + DECOMPRESS_CHUNK
+
+def test_overlong_line_is_a_format_error():
+    data = gzip.compress(b"x" * (DECOMPRESS_CHUNK * 4))
+    with pytest.raises(ImportFormatError, match="line 1"):
+        asyncio.run(collect(data, max_line_bytes=1024))